@@ -4,8 +4,11 @@ import logging
 import argparse
 from dotenv import load_dotenv
 from pathlib import Path
+from datetime import date
+import json
 import os
 import sys
+import time
 
 load_dotenv()  # load environment variables
 
@@ -16,68 +19,37 @@ PINBOARD_API_KEY = os.getenv("PINBOARD_API_KEY")
 
 if not ONE_MIN_AI_API_KEY:
     raise ValueError("ONE_MIN_AI_API_KEY is not set")
-if not PASTEBIN_API_KEY:
+if not PASTEBIN_API_KEY and os.getenv("SUMMARY_STORE", "pastebin") == "pastebin":
     raise ValueError("PASTEBIN_API_KEY is not set")
 if not PINBOARD_API_KEY:
     raise ValueError("PINBOARD_API_KEY is not set")
 
 PROJECT_ROOT = Path(__file__).resolve().parent
 
+from src import log_config
+
 _LOGF_FILE = PROJECT_ROOT / "app.log"
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(_LOGF_FILE),
-        logging.StreamHandler(),  # Optional: keep console output
-    ],
+log_config.setup_logging(
+    _LOGF_FILE,
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    module_levels=log_config.parse_module_levels(os.getenv("LOG_LEVELS", "")),
 )
 
 logger = logging.getLogger("app")
 
-from src import one_min_ai
-from src import youtube_info
-from src import pastebin
-from src.pb_enum import PastebinExpire, PastebinListing
-from src import pinboard
-from src import text_edit
-from src import open_router_ai
-from src import ex
-
-
-def format_seconds_to_hms(total_seconds: int) -> str:
-    """
-    Converts an integer representing seconds into a formatted string
-    of Hours, Minutes, and Seconds.
-
-    Args:
-        total_seconds (int): The total number of seconds.
-
-    Returns:
-        str: A string formatted as "HHh MMm SSs", "MMm SSs", or "SSs"
-            depending on the total duration.
-    """
-    if not isinstance(total_seconds, int) or total_seconds < 0:
-        raise ValueError("Input must be a non-negative integer representing seconds.")
-
-    hours, remainder = divmod(total_seconds, 3600)  # 3600 seconds in an hour
-    minutes, seconds = divmod(remainder, 60)  # 60 seconds in a minute
-
-    if hours > 0:
-        return f"{hours}h {minutes}m {seconds}s"
-    elif minutes > 0:
-        return f"{minutes}m {seconds}s"
-    else:
-        return f"{seconds}s"
-
-    # --- Examples ---
-    # print(format_seconds_to_hms(3665))  # Output: 1h 1m 5s
-    # print(format_seconds_to_hms(3600))  # Output: 1h 0m 0s
-    # print(format_seconds_to_hms(125))  # Output: 2m 5s
-    # print(format_seconds_to_hms(59))  # Output: 59s
-    # print(format_seconds_to_hms(0))  # Output: 0s
-    # print(format_seconds_to_hms(36000))  # Output: 10h 0m 0s
-    # print(format_seconds_to_hms(7261))  # Output: 2h 1m 1s
+from src import tagging
+from src import deadline
+from src import bookmark_pipelines
+from src import batch
+from src import records
+from src import cpu_pool
+from src import paste_registry
+from src import storage
+from src import search_index
+from src import backfill
+from src import paths
+from src import scheduler
+from src import usage
 
 
 # region Args Parser
@@ -104,6 +76,38 @@ def _args_youtube_summary(parser: argparse.ArgumentParser) -> None:
         help="Additional tags to add (comma separated)",
         dest="tags",
     )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        required=False,
+        default=deadline.JOB_TIMEOUT,
+        help="Total time budget for the job in seconds",
+        dest="timeout",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Process the URL even if it was bookmarked before",
+        dest="force",
+    )
+    parser.add_argument(
+        "--source",
+        type=str,
+        required=False,
+        choices=tuple(scheduler.SOURCE_PRIORITIES),
+        default="cli",
+        help="Where the request came from. cli and bookmarklet requests go before batch work",
+        dest="source",
+    )
+    parser.add_argument(
+        "--tagger",
+        type=str,
+        required=False,
+        choices=tagging.TAGGER_MODES,
+        default=tagging.TAGGER_MODE,
+        help="How tags are generated: llm, local or hybrid (local first, LLM when unsure)",
+        dest="tagger",
+    )
 
 
 def _args_web_summary(parser: argparse.ArgumentParser) -> None:
@@ -123,143 +127,504 @@ def _args_web_summary(parser: argparse.ArgumentParser) -> None:
         help="Additional tags to add (comma separated)",
         dest="tags",
     )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        required=False,
+        default=deadline.JOB_TIMEOUT,
+        help="Total time budget for the job in seconds",
+        dest="timeout",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Process the URL even if it was bookmarked before",
+        dest="force",
+    )
+    parser.add_argument(
+        "--source",
+        type=str,
+        required=False,
+        choices=tuple(scheduler.SOURCE_PRIORITIES),
+        default="cli",
+        help="Where the request came from. cli and bookmarklet requests go before batch work",
+        dest="source",
+    )
+
+
+def _args_batch(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=str,
+        required=True,
+        help="File with one URL per line, optionally followed by a tab and comma separated tags. Use - for stdin",
+        dest="input",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        required=False,
+        default="-",
+        help="JSON lines file results are appended to as jobs complete. Defaults to stdout",
+        dest="output",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        required=False,
+        default=4,
+        help="Number of jobs to run at the same time",
+        dest="workers",
+    )
+    parser.add_argument(
+        "-t",
+        "--tags",
+        type=str,
+        required=False,
+        help="Additional tags to add to every job (comma separated)",
+        dest="tags",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        required=False,
+        default=deadline.JOB_TIMEOUT,
+        help="Time budget for each job in seconds",
+        dest="timeout",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Process URLs even if they were bookmarked before",
+        dest="force",
+    )
+    parser.add_argument(
+        "--source",
+        type=str,
+        required=False,
+        choices=tuple(scheduler.SOURCE_PRIORITIES),
+        default="batch",
+        help="Where the URLs came from. Sets the priority of the jobs",
+        dest="source",
+    )
+    parser.add_argument(
+        "--run-budget",
+        type=str,
+        required=False,
+        default="",
+        help="Credits each provider may use in this run, e.g. 1min=50000,openrouter=0.5. No new jobs start once one is used up",
+        dest="run_budget",
+    )
+    parser.add_argument(
+        "--tagger",
+        type=str,
+        required=False,
+        choices=tagging.TAGGER_MODES,
+        default=tagging.TAGGER_MODE,
+        help="How tags are generated for videos: llm, local or hybrid",
+        dest="tagger",
+    )
+    parser.add_argument(
+        "--cpu-workers",
+        type=int,
+        required=False,
+        default=cpu_pool.CPU_WORKERS,
+        help="Worker processes for CPU bound stages (video info extraction, Markdown conversion). 0 runs them in process",
+        dest="cpu_workers",
+    )
+
+
+def _args_reconcile_pastes(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--limit",
+        type=int,
+        required=False,
+        default=1000,
+        help="Number of account pastes to check (at most 1000)",
+        dest="limit",
+    )
+
+
+def _args_rebuild_site(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--dir",
+        type=str,
+        required=False,
+        default=str(storage.SITE_DIR),
+        help="The local site directory",
+        dest="dir",
+    )
+
+
+def _args_search(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "query",
+        type=str,
+        help='Words to search for. Supports FTS5 syntax, e.g. "rust AND async", title:python, data*',
+    )
+    parser.add_argument(
+        "-n",
+        "--limit",
+        type=int,
+        required=False,
+        default=20,
+        help="Maximum number of results",
+        dest="limit",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print one JSON line per result",
+        dest="json",
+    )
+
+
+def _args_replay(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-p",
+        "--pipeline",
+        type=str,
+        required=False,
+        choices=tuple(bookmark_pipelines.PIPELINES),
+        help="Only replay runs of this pipeline",
+        dest="pipeline",
+    )
+    parser.add_argument(
+        "--days",
+        type=float,
+        required=False,
+        help="Only replay runs recorded in the last N days",
+        dest="days",
+    )
+    parser.add_argument(
+        "-n",
+        "--limit",
+        type=int,
+        required=False,
+        help="Maximum number of runs to replay",
+        dest="limit",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print one JSON line per changed run",
+        dest="json",
+    )
+
+
+def _args_backfill(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--domain",
+        type=str,
+        required=False,
+        default="",
+        help="Only bookmarks on this domain or its subdomains",
+        dest="domain",
+    )
+    parser.add_argument(
+        "--tag",
+        type=str,
+        required=False,
+        default="",
+        help="Only bookmarks with this tag",
+        dest="tag",
+    )
+    parser.add_argument(
+        "--since",
+        type=date.fromisoformat,
+        required=False,
+        help="Only bookmarks created on or after this date (YYYY-MM-DD)",
+        dest="since",
+    )
+    parser.add_argument(
+        "--until",
+        type=date.fromisoformat,
+        required=False,
+        help="Only bookmarks created on or before this date (YYYY-MM-DD)",
+        dest="until",
+    )
+    parser.add_argument(
+        "--kind",
+        type=str,
+        required=False,
+        choices=("youtube", "web"),
+        default="",
+        help="Only YouTube videos or only websites",
+        dest="kind",
+    )
+    parser.add_argument(
+        "--with-extended",
+        action="store_true",
+        help="Also process bookmarks that already have a description. The description is kept",
+        dest="with_extended",
+    )
+    parser.add_argument(
+        "-n",
+        "--limit",
+        type=int,
+        required=False,
+        help="Maximum number of bookmarks to process in this run",
+        dest="limit",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Download the bookmarks from Pinboard again instead of using the saved list",
+        dest="refresh",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        required=False,
+        default=str(paths.CACHE_DIR / backfill.RESULTS_FILE),
+        help="JSON lines file results are appended to. Bookmarks with an ok result in it are skipped",
+        dest="output",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        required=False,
+        default=4,
+        help="Number of bookmarks to process at the same time",
+        dest="workers",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        required=False,
+        default=deadline.JOB_TIMEOUT,
+        help="Time budget for each bookmark in seconds",
+        dest="timeout",
+    )
+    parser.add_argument(
+        "--tagger",
+        type=str,
+        required=False,
+        choices=tagging.TAGGER_MODES,
+        default=tagging.TAGGER_MODE,
+        help="How tags are generated for videos: llm, local or hybrid",
+        dest="tagger",
+    )
+    parser.add_argument(
+        "--cpu-workers",
+        type=int,
+        required=False,
+        default=cpu_pool.CPU_WORKERS,
+        help="Worker processes for CPU bound stages. 0 runs them in process",
+        dest="cpu_workers",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Process bookmarks even if they were summarized before",
+        dest="force",
+    )
+    parser.add_argument(
+        "--run-budget",
+        type=str,
+        required=False,
+        default="",
+        help="Credits each provider may use in this run, e.g. 1min=50000,openrouter=0.5. No new jobs start once one is used up",
+        dest="run_budget",
+    )
+
+
+def _args_usage(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--by",
+        type=str,
+        required=False,
+        choices=("day", "run", "job"),
+        default="day",
+        help="Total the credits per day, run or job",
+        dest="by",
+    )
+    parser.add_argument(
+        "--days",
+        type=float,
+        required=False,
+        default=7,
+        help="Only requests made in the last N days",
+        dest="days",
+    )
+    parser.add_argument(
+        "-n",
+        "--limit",
+        type=int,
+        required=False,
+        default=50,
+        help="Maximum number of rows",
+        dest="limit",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print one JSON line per row",
+        dest="json",
+    )
 
 
 def _args_process_cmd(args: argparse.Namespace) -> None:
     if args.command == "youtube":
-        _args_action_youtube(args=args)
+        with log_config.job_context(args.url), scheduler.job(args.source), deadline.budget(
+            args.timeout
+        ):
+            _args_action_youtube(args=args)
     elif args.command == "web":
-        _args_action_web_summary(args=args)
+        with log_config.job_context(args.url), scheduler.job(args.source), deadline.budget(
+            args.timeout
+        ):
+            _args_action_web_summary(args=args)
+    elif args.command == "batch":
+        _args_action_batch(args=args)
+    elif args.command == "backfill":
+        _args_action_backfill(args=args)
+    elif args.command == "reconcile-pastes":
+        _args_action_reconcile_pastes(args=args)
+    elif args.command == "search":
+        _args_action_search(args=args)
+    elif args.command == "replay":
+        _args_action_replay(args=args)
+    elif args.command == "usage":
+        _args_action_usage(args=args)
+    elif args.command == "rebuild-site":
+        _args_action_rebuild_site(args=args)
     else:
         raise ValueError(f"Unknown command: {args.command}")
 
 
 def _args_action_youtube(args: argparse.Namespace) -> None:
-    pb_result = False
-    url = args.url
-    ulr_prefixes = (
-        "https://youtu.be/",
-        "https://www.youtube.com/watch?v=",
-        "https://youtube.com/shorts/",
-        "https://www.youtube.com/shorts/",
-    )
-    if not url.startswith(ulr_prefixes):
-        raise ValueError(f"URL must start with {ulr_prefixes}")
     try:
-        new_tags = args.tags
-        if new_tags:
-            new_tags = [new_tags.strip() for tag in new_tags.split(",")]
-        else:
-            new_tags = []
-        info = youtube_info.get_youtube_info(url)
-        logger.info("Youtube Video URL: %s", url)
-        logger.info("Youtube Video Title Title: %s", info["title"])
-        logger.info("Youtube Video Duration: %s", info["duration"])
-
-        summary = ""
-        try:
-            summary = one_min_ai.get_youtube_summary(url)
-        except ex.NoCaptionsError:
-            logger.info(
-                "Continuing without captions. No pastebin entry will be created."
-            )
-
-        if summary:
-            shortened_summary = one_min_ai.shorten_content(summary, 40)
-            shortened_summary = text_edit.markdown_to_text(shortened_summary)
-            shortened_summary = text_edit.remove_first_line_summary_count(
-                shortened_summary
-            )
-            shortened_summary = text_edit.remove_last_line_if_has_parentheses(
-                shortened_summary
-            )
-        fmt_time = format_seconds_to_hms(info["duration"])
-        logger.info("Youtube Video Duration: %s", fmt_time)
-        if summary:
-            summary = f"# {info['title']}\n\n## Summary\n\n{summary}\n\n## Details\n\n- Duration: {fmt_time}\n- URL: [{info['title']}]({url})"
-            tags = one_min_ai.query_tags(summary)
-        else:
-            tags = []
-
-        if "YouTube" not in tags:
-            tags.append("YouTube")
-        if "Video" not in tags:
-            tags.append("Video")
-        for tag in new_tags:
-            if tag not in tags:
-                tags.append(tag)
-
-        if summary:
-            tags_str = "\n- ".join(tags)
-            summary += f"\n\n## Tags\n- {tags_str}\n"
-
-            try:
-                link = pastebin.create_paste(
-                    info["title"], summary, expire=PastebinExpire.EXPIRE_N
-                )
-            except ex.PastebinFilterError:
-                logger.info(
-                    "Pastebin reporst a filter error. Creating a private paste."
-                )
-                link = pastebin.create_paste(
-                    info["title"],
-                    summary,
-                    expire=PastebinExpire.EXPIRE_N,
-                    listing=PastebinListing.PRIVATE,
-                )
-            logger.info("Paste created: %s for %s", link, info["title"])
-            extended_desc = f"See Summary Here: {link}"
-            extended_desc += f"\n\n<blockquote>\n{shortened_summary}\n</blockquote>"
-        else:
-            extended_desc = f"Youtube Video Duration: {fmt_time}"
-        pb_result = pinboard.add_link(
-            url=url, description=info["title"], extended=extended_desc, tags=tags
+        bookmark_pipelines.run_youtube(
+            args.url, bookmark_pipelines.parse_tags(args.tags), args.tagger, args.force
         )
-        # pb_result = pinboard.add_link(url=url, description=info["title"], extended= summary, tags)
-
     except Exception as e:
         logger.error("main() An error occurred: %s", e)
         raise e
-    if pb_result is True:
-        logger.info("Pinboard link added")
-    else:
-        logger.error("Pinboard link not added: %s", pb_result)
-        raise Exception("Pinboard link not added")
 
 
 def _args_action_web_summary(args: argparse.Namespace) -> None:
-    pb_result = False
-    url = args.url
-
     try:
-        new_tags = args.tags
-        if new_tags:
-            new_tags = [new_tags.strip() for tag in new_tags.split(",")]
-        else:
-            new_tags = []
-        info = open_router_ai.get_domain_summary(url)
-        logger.info("URL: %s", info["url"])
-
-        summary = text_edit.markdown_to_text(info["summary"])
-        summary = f"<blockquote>\n{summary}\n</blockquote>"
-
-        tags = info["tags"]
-        for tag in new_tags:
-            if tag not in tags:
-                tags.append(tag)
-
-        pb_result = pinboard.add_link(
-            url=url, description=info["title"], extended=summary, tags=tags
+        bookmark_pipelines.run_web(
+            args.url, bookmark_pipelines.parse_tags(args.tags), args.force
         )
-
     except Exception as e:
         logger.error("main() An error occurred: %s", e)
         raise e
-    if pb_result is True:
-        logger.info("Pinboard link added")
-    else:
-        logger.error("Pinboard link not added: %s", pb_result)
-        raise Exception("Pinboard link not added")
+
+
+def _args_action_batch(args: argparse.Namespace) -> None:
+    extra_tags = bookmark_pipelines.parse_tags(args.tags)
+
+    def run(job: records.BookmarkJob) -> dict:
+        job.tags = [*job.tags, *extra_tags]
+        job.source = job.source or args.source
+        return batch.run_job(job, args.tagger, args.timeout, args.force)
+
+    usage.RUN_BUDGETS.update(usage.parse_budgets(args.run_budget))
+    cpu_pool.configure(args.cpu_workers)
+    with batch.open_text(args.input) as src, batch.open_text(args.output, "a") as out:
+        jobs = usage.within_budget(batch.read_jobs(src))
+        stats = batch.run_batch(jobs, out, run, workers=args.workers)
+    if stats.failed:
+        raise Exception(f"{stats.failed} of {stats.total} jobs failed")
+
+
+def _args_action_backfill(args: argparse.Namespace) -> None:
+    posts_file = paths.cache_path(backfill.POSTS_FILE)
+    if args.refresh or not posts_file.exists():
+        backfill.fetch_posts(posts_file)
+    flt = backfill.BackfillFilter(
+        domain=args.domain,
+        tag=args.tag,
+        since=args.since,
+        until=args.until,
+        kind=args.kind,
+        empty_extended=not args.with_extended,
+    )
+    output = Path(args.output)
+    done = backfill.completed_urls(output)
+    if done:
+        logger.info("Resuming backfill, %d bookmarks already done", len(done))
+    jobs = backfill.select_jobs(backfill.read_posts(posts_file), flt, done, args.limit)
+    usage.RUN_BUDGETS.update(usage.parse_budgets(args.run_budget))
+
+    def run(job: records.BookmarkJob) -> dict:
+        return batch.run_job(job, args.tagger, args.timeout, args.force)
+
+    cpu_pool.configure(args.cpu_workers)
+    with batch.open_text(args.output, "a") as out:
+        stats = batch.run_batch(usage.within_budget(jobs), out, run, workers=args.workers)
+    if stats.failed:
+        raise Exception(f"{stats.failed} of {stats.total} bookmarks failed")
+
+
+def _args_action_reconcile_pastes(args: argparse.Namespace) -> None:
+    registry = paste_registry.get_registry()
+    added, removed = registry.reconcile(args.limit)
+    print(f"{len(registry)} pastes registered, {added} added, {removed} removed")
+
+
+def _args_action_rebuild_site(args: argparse.Namespace) -> None:
+    count = storage.LocalSiteStore(Path(args.dir)).rebuild()
+    print(f"{count} pages written to {args.dir}")
+
+
+def _args_action_search(args: argparse.Namespace) -> None:
+    for hit in search_index.get_index().search(args.query, args.limit):
+        if args.json:
+            print(hit.to_json())
+            continue
+        print(f"{hit.title}\n  {hit.url}")
+        if hit.link:
+            print(f"  {hit.link}")
+        if hit.tags:
+            print(f"  tags: {', '.join(hit.tags)}")
+        print(f"  {hit.snippet}\n")
+
+
+def _args_action_replay(args: argparse.Namespace) -> None:
+    since = time.time() - args.days * 86400 if args.days else 0.0
+    total = changed = 0
+    for run, diffs in bookmark_pipelines.replay_runs(args.pipeline, since, args.limit):
+        total += 1
+        if not diffs:
+            continue
+        changed += 1
+        if args.json:
+            print(json.dumps({"id": run.id, "url": run.url, "job_id": run.job_id, "diffs": diffs}))
+            continue
+        print(f"=== {run.url} ({run.pipeline} run {run.id})")
+        for diff in diffs.values():
+            print(diff)
+    print(f"{changed} of {total} runs changed", file=sys.stderr)
+
+
+def _args_action_usage(args: argparse.Namespace) -> None:
+    since = time.time() - args.days * 86400
+    rows = usage.get_ledger().totals(args.by, since, args.limit)
+    for row in rows:
+        if args.json:
+            print(json.dumps(row))
+            continue
+        estimated = f", {row['estimated']} estimated" if row["estimated"] else ""
+        print(
+            f"{row[args.by] or '-'}  {row['provider']:<10} {row['calls']:>5} calls"
+            f"  {row['prompt_tokens']:>9} + {row['completion_tokens']:>8} tokens"
+            f"  {row['credits']:>12.4f} credits{estimated}"
+        )
+    spent = usage.get_ledger().spent_today()
+    budgets = ", ".join(
+        f"{name} {spent.get(name, 0.0):.4g} of {budget:.4g}"
+        for name, budget in usage.DAILY_BUDGETS.items()
+    )
+    if budgets:
+        print(f"Today: {budgets}", file=sys.stderr)
 
 
 # endregion Args Parser
@@ -283,6 +648,48 @@ def main():
         )
         _args_web_summary(parser_youtube)
 
+        parser_batch = subparser.add_parser(
+            name="batch",
+            help="Summarize and bookmark a list of YouTube videos and websites.",
+        )
+        _args_batch(parser_batch)
+
+        parser_backfill = subparser.add_parser(
+            name="backfill",
+            help="Summarize and tag existing Pinboard bookmarks and update them in place.",
+        )
+        _args_backfill(parser_backfill)
+
+        parser_reconcile = subparser.add_parser(
+            name="reconcile-pastes",
+            help="Sync the local paste registry with the pastes in the Pastebin account.",
+        )
+        _args_reconcile_pastes(parser_reconcile)
+
+        parser_search = subparser.add_parser(
+            name="search",
+            help="Search the titles, tags and summaries of everything bookmarked so far.",
+        )
+        _args_search(parser_search)
+
+        parser_replay = subparser.add_parser(
+            name="replay",
+            help="Re-run the cleanup and formatting stages over archived runs and show what changes.",
+        )
+        _args_replay(parser_replay)
+
+        parser_usage = subparser.add_parser(
+            name="usage",
+            help="Show the tokens and credits used per day, run or job.",
+        )
+        _args_usage(parser_usage)
+
+        parser_rebuild = subparser.add_parser(
+            name="rebuild-site",
+            help="Render the local summary site again from its Markdown files.",
+        )
+        _args_rebuild_site(parser_rebuild)
+
         args = parser.parse_args()
         _args_process_cmd(args)
         logger.info("Script completed successfully.")
@@ -0,0 +1,242 @@
+from __future__ import annotations
+import difflib
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator
+from . import records
+from .paths import cache_path
+from .records import Record
+from .tag_vocab import TagVocabulary
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FILE = "archive.db"
+ARCHIVE_RUNS = os.getenv("ARCHIVE_RUNS", "1") not in ("0", "false", "False", "")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    pipeline TEXT NOT NULL,
+    url TEXT NOT NULL,
+    job_id TEXT NOT NULL DEFAULT '',
+    created REAL NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_pipeline ON runs (pipeline, created);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+"""
+
+_SKIP = object()
+
+
+@dataclass
+class ArchivedRun:
+    id: int
+    pipeline: str
+    url: str
+    job_id: str
+    created: float
+    values: dict[str, Any] = field(default_factory=dict)
+
+
+class Archive:
+    """
+    Compressed record of the stage values of past pipeline runs.
+
+    Each run is stored as zlib compressed JSON. Large values shared by many runs,
+    such as the tag vocabulary, are stored once and referenced by hash.
+    """
+
+    def __init__(self, path: Path | None = None) -> None:
+        """
+        Args:
+            path (Path, optional): The database file. Defaults to the cache file.
+        """
+        self.path = path or cache_path(ARCHIVE_FILE)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._blob_hashes: dict[tuple[int, float, int], str] = {}
+        self._vocabularies: dict[str, TagVocabulary] = {}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM runs").fetchone()[0]
+
+    # region Encoding
+
+    def _vocabulary_ref(self, vocabulary: TagVocabulary) -> str:
+        key = (id(vocabulary), vocabulary.updated, len(vocabulary))
+        digest = self._blob_hashes.get(key)
+        if digest is None:
+            data = json.dumps(vocabulary.to_dict(), sort_keys=True).encode("utf-8")
+            digest = hashlib.sha256(data).hexdigest()[:16]
+            self._conn.execute(
+                "INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)",
+                (digest, zlib.compress(data)),
+            )
+            self._blob_hashes = {key: digest}
+        return digest
+
+    def _encode(self, value: Any) -> Any:
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        if isinstance(value, Record):
+            return {"__record__": type(value).__name__, "data": value.to_dict()}
+        if isinstance(value, TagVocabulary):
+            return {"__vocabulary__": self._vocabulary_ref(value)}
+        if isinstance(value, (list, tuple)):
+            return [self._encode(v) for v in value]
+        if isinstance(value, dict):
+            return {str(k): self._encode(v) for k, v in value.items()}
+        return _SKIP
+
+    def _decode(self, value: Any) -> Any:
+        if isinstance(value, list):
+            return [self._decode(v) for v in value]
+        if not isinstance(value, dict):
+            return value
+        if "__record__" in value:
+            return getattr(records, value["__record__"]).from_dict(value["data"])
+        if "__vocabulary__" in value:
+            return self._load_vocabulary(value["__vocabulary__"])
+        return {k: self._decode(v) for k, v in value.items()}
+
+    def _load_vocabulary(self, digest: str) -> TagVocabulary:
+        vocabulary = self._vocabularies.get(digest)
+        if vocabulary is None:
+            row = self._conn.execute("SELECT data FROM blobs WHERE hash = ?", (digest,)).fetchone()
+            data = json.loads(zlib.decompress(row[0])) if row else {}
+            vocabulary = self._vocabularies[digest] = TagVocabulary.from_dict(data)
+        return vocabulary
+
+    # endregion Encoding
+
+    def record(self, pipeline: str, values: dict[str, Any], job_id: str = "") -> None:
+        """
+        Store the values of a completed run.
+
+        Values that cannot be stored as JSON, such as fingerprint arrays, are left out.
+
+        Args:
+            pipeline (str): The pipeline name.
+            values (dict[str, Any]): The values returned by ``Pipeline.run``.
+            job_id (str, optional): The job ID.
+        """
+        with self._lock, self._conn:
+            data = {}
+            for name, value in values.items():
+                encoded = self._encode(value)
+                if encoded is not _SKIP:
+                    data[name] = encoded
+            blob = zlib.compress(
+                json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            )
+            self._conn.execute(
+                "INSERT INTO runs (pipeline, url, job_id, created, data) VALUES (?, ?, ?, ?, ?)",
+                (pipeline, values.get("url", ""), job_id, time.time(), blob),
+            )
+
+    def runs(
+        self, pipeline: str | None = None, since: float = 0.0, limit: int | None = None
+    ) -> Iterator[ArchivedRun]:
+        """
+        Read archived runs, oldest first.
+
+        Args:
+            pipeline (str, optional): Only runs of this pipeline. Defaults to all.
+            since (float, optional): Only runs recorded after this time. Defaults to all.
+            limit (int, optional): The maximum number of runs. Defaults to all.
+
+        Yields:
+            ArchivedRun: The runs with their decoded values.
+        """
+        sql = "SELECT id, pipeline, url, job_id, created, data FROM runs WHERE created >= ?"
+        params: list[Any] = [since]
+        if pipeline:
+            sql += " AND pipeline = ?"
+            params.append(pipeline)
+        sql += " ORDER BY id"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        for id_, name, url, job_id, created, blob in rows:
+            with self._lock:
+                values = self._decode(json.loads(zlib.decompress(blob)))
+            yield ArchivedRun(id_, name, url, job_id, created, values)
+
+
+def _text(value: Any) -> list[str]:
+    if isinstance(value, str):
+        text = value
+    elif isinstance(value, Record):
+        text = json.dumps(value.to_dict(), ensure_ascii=False, indent=1)
+    else:
+        text = json.dumps(value, ensure_ascii=False, indent=1, default=repr)
+    return text.splitlines(keepends=True)
+
+
+def diff_values(
+    recorded: dict[str, Any], replayed: dict[str, Any], names: tuple[str, ...]
+) -> dict[str, str]:
+    """
+    Compare the replayed values of a run with the recorded ones.
+
+    Args:
+        recorded (dict[str, Any]): The archived values.
+        replayed (dict[str, Any]): The values after the replay.
+        names (tuple[str, ...]): The value names to compare.
+
+    Returns:
+        dict[str, str]: A unified diff for each value that changed.
+    """
+    diffs = {}
+    for name in names:
+        if name not in replayed or recorded.get(name) == replayed[name]:
+            continue
+        diffs[name] = "".join(
+            difflib.unified_diff(
+                _text(recorded.get(name)),
+                _text(replayed[name]),
+                f"{name} (recorded)",
+                f"{name} (replayed)",
+            )
+        )
+    return diffs
+
+
+_archive: Archive | None = None
+_archive_lock = threading.Lock()
+
+
+def get_archive() -> Archive:
+    """
+    Get the shared run archive, opening it on first use.
+
+    Returns:
+        Archive: The archive.
+    """
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = Archive()
+        return _archive
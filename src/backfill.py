@@ -0,0 +1,141 @@
+from __future__ import annotations
+import json
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime
+from pathlib import Path
+from typing import Iterable, Iterator
+from urllib.parse import urlsplit
+from .records import YOUTUBE_URL_PREFIXES, BookmarkJob, PinboardPost
+from .paths import cache_path
+from .storage import write_atomic
+from . import pinboard
+
+logger = logging.getLogger(__name__)
+
+POSTS_FILE = "backfill_posts.jsonl"
+RESULTS_FILE = "backfill_results.jsonl"
+
+
+@dataclass
+class BackfillFilter:
+    """Which existing bookmarks to enrich. Empty fields match everything."""
+
+    domain: str = ""
+    tag: str = ""
+    since: date | None = None
+    until: date | None = None
+    kind: str = ""
+    empty_extended: bool = True
+
+    def matches(self, post: PinboardPost) -> bool:
+        if self.empty_extended and post.extended.strip():
+            return False
+        if self.kind:
+            is_youtube = post.url.startswith(YOUTUBE_URL_PREFIXES)
+            if is_youtube != (self.kind == "youtube"):
+                return False
+        if self.tag and self.tag.casefold() not in (t.casefold() for t in post.tags):
+            return False
+        if self.domain:
+            host = urlsplit(post.url).netloc.lower().removeprefix("www.")
+            domain = self.domain.lower().removeprefix("www.")
+            if host != domain and not host.endswith("." + domain):
+                return False
+        if self.since or self.until:
+            created = datetime.fromisoformat(post.time).date()
+            if self.since and created < self.since:
+                return False
+            if self.until and created > self.until:
+                return False
+        return True
+
+
+def fetch_posts(path: Path | None = None) -> int:
+    """
+    Download every bookmark in the account to a local snapshot.
+
+    The snapshot is what a backfill works through, so an interrupted backfill
+    resumes without another ``posts/all`` call.
+
+    Args:
+        path (Path, optional): The snapshot file. Defaults to the cache file.
+
+    Returns:
+        int: The number of bookmarks.
+    """
+    path = path or cache_path(POSTS_FILE)
+    posts = pinboard.get_all_posts()
+    write_atomic(path, "".join(post.to_json() + "\n" for post in posts))
+    logger.info("fetch_posts() %d bookmarks saved to %s", len(posts), path)
+    return len(posts)
+
+
+def read_posts(path: Path | None = None) -> Iterator[PinboardPost]:
+    """
+    Read the bookmark snapshot lazily.
+
+    Args:
+        path (Path, optional): The snapshot file. Defaults to the cache file.
+
+    Yields:
+        PinboardPost: One bookmark per line.
+    """
+    path = path or cache_path(POSTS_FILE)
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield PinboardPost.from_json(line)
+
+
+def completed_urls(results: Path) -> set[str]:
+    """
+    Get the URLs a previous backfill already finished.
+
+    Args:
+        results (Path): The backfill results file.
+
+    Returns:
+        set[str]: URLs whose result line has ``ok`` set. Failed URLs are retried.
+    """
+    done: set[str] = set()
+    if not results.exists():
+        return done
+    with results.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short when the last run was killed
+            if record.get("ok"):
+                done.add(record["url"])
+    return done
+
+
+def select_jobs(
+    posts: Iterable[PinboardPost],
+    flt: BackfillFilter,
+    done: set[str] | None = None,
+    limit: int | None = None,
+) -> Iterator[BookmarkJob]:
+    """
+    Turn the matching bookmarks into jobs, skipping finished ones.
+
+    Args:
+        posts (Iterable[PinboardPost]): The bookmarks.
+        flt (BackfillFilter): The selection.
+        done (set[str], optional): URLs to skip.
+        limit (int, optional): The maximum number of jobs.
+
+    Yields:
+        BookmarkJob: A job that updates the bookmark.
+    """
+    done = done or set()
+    count = 0
+    for post in posts:
+        if limit is not None and count >= limit:
+            return
+        if post.url in done or not flt.matches(post):
+            continue
+        count += 1
+        yield BookmarkJob(post.url, post=post, source="backfill")
@@ -0,0 +1,185 @@
+from __future__ import annotations
+import json
+import logging
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, TextIO
+from . import bookmark_pipelines
+from . import concurrency
+from . import deadline
+from . import log_config
+from . import scheduler
+from . import usage
+from .records import BookmarkJob
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchStats:
+    total: int = 0
+    ok: int = 0
+    failed: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+
+def read_jobs(lines: Iterable[str]) -> Iterator[BookmarkJob]:
+    """
+    Parse jobs lazily from lines of text.
+
+    Each line holds a URL, optionally followed by a tab and comma separated tags.
+    Blank lines and lines starting with ``#`` are skipped.
+
+    Args:
+        lines (Iterable[str]): The input lines, e.g. an open file.
+
+    Yields:
+        BookmarkJob: One job per URL.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        url, _, tags = line.partition("\t")
+        yield BookmarkJob(url.strip(), bookmark_pipelines.parse_tags(tags))
+
+
+@contextmanager
+def open_text(path: str, mode: str = "r") -> Iterator[TextIO]:
+    """
+    Open a text file, with ``-`` meaning stdin or stdout.
+
+    Args:
+        path (str): The file path or ``-``.
+        mode (str, optional): ``r`` or ``a``. Defaults to ``r``.
+    """
+    if path == "-":
+        yield sys.stdin if mode == "r" else sys.stdout
+        return
+    with Path(path).open(mode, encoding="utf-8") as f:
+        yield f
+
+
+def run_job(
+    job: BookmarkJob, tagger_mode: str, timeout: float, force: bool = False
+) -> dict:
+    """
+    Run the pipeline for one job and keep only a small result record.
+
+    Args:
+        job (BookmarkJob): The job.
+        tagger_mode (str): ``llm``, ``local`` or ``hybrid``.
+        timeout (float): The job time budget in seconds.
+        force (bool, optional): Process URLs that were bookmarked before.
+
+    Returns:
+        dict: The result record written to the output.
+    """
+    start = time.monotonic()
+    record: dict = {"url": job.url, "kind": job.kind}
+    with log_config.job_context(job.url, job.job_id) as job_id, scheduler.job(
+        job.source or "batch"
+    ), deadline.budget(timeout):
+        record["job_id"] = job.job_id = job_id
+        try:
+            if job.post is not None:
+                values = bookmark_pipelines.run_backfill(job.post, tagger_mode, force)
+            elif job.kind == "youtube":
+                values = bookmark_pipelines.run_youtube(
+                    job.url, job.tags, tagger_mode, force
+                )
+            else:
+                values = bookmark_pipelines.run_web(job.url, job.tags, force)
+            record.update(
+                ok=True,
+                title=values.get("title"),
+                tags=values.get("tags"),
+                link=values["paste"].url if values.get("paste") else "",
+            )
+            if values.get("duplicate"):
+                record["duplicate"] = True
+            if values.get("reused"):
+                record["reused_from"] = values["reused"].url
+            if values.get("similar"):
+                record["similar"] = values["similar"]
+        except Exception as e:
+            logger.error("run_job() %s failed: %s", job.url, e)
+            record.update(ok=False, error=f"{type(e).__name__}: {e}")
+        credits = usage.job_credits(job_id)
+        if credits:
+            record["credits"] = credits
+    record["duration"] = round(time.monotonic() - start, 3)
+    return record
+
+
+def run_batch(
+    jobs: Iterable[BookmarkJob],
+    output: TextIO,
+    run: Callable[[BookmarkJob], dict],
+    workers: int = 4,
+    max_pending: int | None = None,
+) -> BatchStats:
+    """
+    Run jobs concurrently while keeping memory flat.
+
+    Jobs are pulled from ``jobs`` only when there is room, so at most ``max_pending``
+    jobs are held in memory no matter how long the input is. Each result is written
+    to ``output`` as a JSON line as soon as its job completes.
+
+    Args:
+        jobs (Iterable[BookmarkJob]): The jobs, ideally a lazy iterator.
+        output (TextIO): Where result lines are written.
+        run (Callable[[BookmarkJob], dict]): Runs one job and returns its result record.
+        workers (int, optional): Jobs run at the same time. Defaults to 4.
+        max_pending (int, optional): Jobs submitted but not finished. Defaults to twice ``workers``.
+
+    Returns:
+        BatchStats: Counts of completed jobs.
+    """
+    max_pending = max_pending or workers * 2
+    stats = BatchStats()
+    pending: set[Future] = set()
+
+    def drain(return_when: str) -> None:
+        nonlocal pending
+        done, pending = wait(pending, return_when=return_when)
+        for future in done:
+            record = future.result()
+            stats.ok += bool(record.get("ok"))
+            stats.failed += not record.get("ok")
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+
+    with ThreadPoolExecutor(workers, thread_name_prefix="batch") as executor:
+        for job in jobs:
+            if len(pending) >= max_pending:
+                drain(FIRST_COMPLETED)
+            pending.add(executor.submit(run, job))
+            stats.total += 1
+        while pending:
+            drain(FIRST_COMPLETED)
+    logger.info(
+        "run_batch() %d jobs, %d ok, %d failed in %.1fs",
+        stats.total,
+        stats.ok,
+        stats.failed,
+        stats.elapsed,
+    )
+    for name, state in concurrency.snapshot().items():
+        logger.info(
+            "run_batch() %s concurrency limit %d, raised %d and cut %d times",
+            name,
+            state["limit"],
+            state["increases"],
+            state["decreases"],
+        )
+    logger.info("run_batch() credits used: %s", usage.get_ledger().spent_run())
+    return stats
@@ -0,0 +1,665 @@
+from __future__ import annotations
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Iterator
+from urllib.parse import urljoin
+import numpy as np
+import requests
+from .pipeline import Pipeline, Stage
+from .tag_vocab import TagVocabulary
+from .records import (
+    YOUTUBE_URL_PREFIXES,
+    IndexedSummary,
+    PasteResult,
+    PinboardPost,
+    Summary,
+    VideoInfo,
+)
+from . import ex
+from . import one_min_ai
+from . import open_router_ai
+from . import model_router
+from . import paste_registry
+from . import search_index
+from . import fingerprint
+from . import archive
+from . import log_config
+from . import pinboard_writer
+from . import tag_vocab
+from . import tagging
+from . import text_edit
+from . import youtube_info
+from . import cpu_pool
+from . import deadline
+from . import usage
+
+logger = logging.getLogger(__name__)
+
+YOUTUBE_TAGS = ("YouTube", "Video")
+
+
+def parse_tags(tags: str | None) -> list[str]:
+    """
+    Split a comma separated tag string.
+
+    Args:
+        tags (str | None): Tags such as ``"tag1, tag2"``.
+
+    Returns:
+        list[str]: The non empty tags.
+    """
+    if not tags:
+        return []
+    return [tag.strip() for tag in tags.split(",") if tag.strip()]
+
+
+# region Shared stages
+
+
+def load_vocabulary() -> TagVocabulary:
+    return tag_vocab.get_vocabulary()
+
+
+def merge_tags(
+    ai_tags: list[str] | None,
+    base_tags: list[str],
+    new_tags: list[str],
+    vocabulary: TagVocabulary,
+) -> list[str]:
+    return vocabulary.normalize([*(ai_tags or []), *base_tags, *new_tags])
+
+
+def pin(url: str, title: str, extended: str, tags: list[str]) -> bool:
+    result = pinboard_writer.add_link(
+        url=url, description=title, extended=extended, tags=tags
+    )
+    if result is not True:
+        logger.error("Pinboard link not added: %s", result)
+        raise Exception("Pinboard link not added")
+    logger.info("Pinboard link added")
+    return result
+
+
+def find_similar(url: str, title: str) -> list[str]:
+    similar = search_index.get_index().similar(title, url)
+    for entry in similar:
+        logger.warning("Similar content was already bookmarked: %s (%s)", entry.title, entry.url)
+    return [entry.url for entry in similar]
+
+
+VOCABULARY_STAGE = Stage("vocabulary", load_vocabulary, outputs=("vocabulary",))
+MERGE_TAGS_STAGE = Stage(
+    "merge_tags",
+    merge_tags,
+    inputs=("ai_tags", "base_tags", "new_tags", "vocabulary"),
+    outputs=("tags",),
+    pure=True,
+)
+PIN_STAGE = Stage("pin", pin, inputs=("url", "title", "extended", "tags"))
+SIMILAR_STAGE = Stage(
+    "similar", find_similar, ("url", "title"), ("similar",), degrade=(sqlite3.Error,)
+)
+
+# endregion Shared stages
+
+# region YouTube
+
+
+def fetch_info(url: str) -> tuple[VideoInfo, str]:
+    if not url.startswith(YOUTUBE_URL_PREFIXES):
+        raise ValueError(f"URL must start with {YOUTUBE_URL_PREFIXES}")
+    video = cpu_pool.run(youtube_info.get_video_info, url)
+    logger.info("Youtube Video URL: %s", url)
+    logger.info("Youtube Video Title Title: %s", video.title)
+    logger.info("Youtube Video Duration: %s", video.duration)
+    return video, video.title
+
+
+def fingerprint_video(
+    url: str, video: VideoInfo, reuse: bool
+) -> tuple[np.ndarray | None, IndexedSummary | None]:
+    sig = fingerprint.signature(f"{video.title}\n{video.description}")
+    if sig is None or not reuse:
+        return sig, None
+    match = fingerprint.get_index().nearest(sig, exclude=url)
+    if match is None:
+        return sig, None
+    entry = search_index.get_index().get(match[0])
+    if entry is None or not entry.summary:
+        return sig, None
+    logger.info(
+        "Reusing the summary of %s (%s), similarity %.2f", entry.title, entry.url, match[1]
+    )
+    return sig, entry
+
+
+def summarize_video(url: str, video: VideoInfo, reused: IndexedSummary | None) -> str:
+    if reused is not None:
+        return reused.summary
+    return one_min_ai.get_youtube_summary(url, duration=video.duration)
+
+
+def shorten_summary(summary: str | None, reused: IndexedSummary | None) -> str:
+    if not summary:
+        return ""
+    if reused is not None and reused.short_summary:
+        return reused.short_summary
+    return one_min_ai.shorten_content(summary, 40)
+
+
+def clean_short_summary(short_raw: str) -> str:
+    shortened = cpu_pool.markdown_to_text(short_raw)
+    shortened = text_edit.remove_first_line_summary_count(shortened)
+    return text_edit.remove_last_line_if_has_parentheses(shortened)
+
+
+def video_document(video: VideoInfo, summary: str | None) -> str:
+    if not summary:
+        logger.info("Continuing without a summary. No pastebin entry will be created.")
+        return ""
+    fmt_time = text_edit.format_seconds_to_hms(video.duration)
+    return f"# {video.title}\n\n## Summary\n\n{summary}\n\n## Details\n\n- Duration: {fmt_time}\n- URL: [{video.title}]({video.url})"
+
+
+def tag_document(
+    document: str,
+    vocabulary: TagVocabulary,
+    tagger_mode: str,
+    reused: IndexedSummary | None,
+) -> list[str]:
+    if not document:
+        return []
+    if reused is not None:
+        return [tag for tag in reused.tags if tag not in YOUTUBE_TAGS]
+    tagger = tagging.get_tagger(
+        usage.cheaper_tagger(tagger_mode), vocabulary, ignore=YOUTUBE_TAGS
+    )
+    return tagger.tag(document).tags
+
+
+def build_paste_body(document: str, tags: list[str]) -> str:
+    if not document:
+        return ""
+    tags_str = "\n- ".join(tags)
+    return f"{document}\n\n## Tags\n- {tags_str}\n"
+
+
+def paste_document(title: str, paste_body: str) -> PasteResult | None:
+    if not paste_body:
+        return None
+    paste = paste_registry.get_registry().get_or_create(title, paste_body)
+    logger.info("Paste: %s for %s", paste.url, title)
+    return paste
+
+
+def video_extended(
+    paste: PasteResult | None, short_summary: str, video: VideoInfo
+) -> str:
+    if paste is None:
+        fmt_time = text_edit.format_seconds_to_hms(video.duration)
+        return f"Youtube Video Duration: {fmt_time}"
+    extended = f"See Summary Here: {paste.url}"
+    extended += f"\n\n<blockquote>\n{short_summary}\n</blockquote>"
+    return extended
+
+
+def index_video(
+    url: str,
+    title: str,
+    ai_tags: list[str],
+    vocabulary: TagVocabulary,
+    short_summary: str,
+    summary: str | None,
+    paste: PasteResult | None,
+    pin: bool,
+    signature: np.ndarray | None,
+) -> None:
+    if signature is not None and summary:
+        fingerprint.get_index().add(url, signature)
+    search_index.get_index().add(
+        IndexedSummary(
+            url=url,
+            kind="youtube",
+            title=title,
+            # only the tags of the content, a reused summary must not bring back this job's extras
+            tags=vocabulary.normalize(ai_tags),
+            short_summary=short_summary,
+            summary=summary or "",
+            link=paste.url if paste else "",
+        )
+    )
+
+
+YOUTUBE_PIPELINE = Pipeline(
+    "youtube",
+    [
+        Stage("fetch_info", fetch_info, ("url",), ("video", "title"), memo=True),
+        Stage(
+            "fingerprint",
+            fingerprint_video,
+            ("url", "video", "reuse"),
+            ("signature", "reused"),
+            degrade=(sqlite3.Error,),
+        ),
+        Stage(
+            "summarize",
+            summarize_video,
+            ("url", "video", "reused"),
+            ("summary",),
+            degrade=(ex.NoCaptionsError, ex.DeadlineExceededError),
+            memo=True,
+        ),
+        Stage(
+            "shorten",
+            shorten_summary,
+            ("summary", "reused"),
+            ("short_raw",),
+            memo=True,
+        ),
+        Stage(
+            "clean_short",
+            clean_short_summary,
+            ("short_raw",),
+            ("short_summary",),
+            pure=True,
+        ),
+        VOCABULARY_STAGE,
+        Stage(
+            "document",
+            video_document,
+            ("video", "summary"),
+            ("document",),
+            pure=True,
+        ),
+        Stage(
+            "tag",
+            tag_document,
+            ("document", "vocabulary", "tagger_mode", "reused"),
+            ("ai_tags",),
+        ),
+        MERGE_TAGS_STAGE,
+        Stage("paste_body", build_paste_body, ("document", "tags"), ("paste_body",), pure=True),
+        Stage("paste", paste_document, ("title", "paste_body"), ("paste",)),
+        Stage(
+            "extended",
+            video_extended,
+            ("paste", "short_summary", "video"),
+            ("extended",),
+            pure=True,
+        ),
+        PIN_STAGE,
+        SIMILAR_STAGE,
+        Stage(
+            "index",
+            index_video,
+            (
+                "url",
+                "title",
+                "ai_tags",
+                "vocabulary",
+                "short_summary",
+                "summary",
+                "paste",
+                "pin",
+                "signature",
+            ),
+            degrade=(sqlite3.Error,),
+        ),
+    ],
+)
+
+# endregion YouTube
+
+# region Web
+
+PAGE_TIMEOUT = 20
+# Only the start of a page is read. The title and canonical link are in its head.
+PAGE_MAX_BYTES = 1_000_000
+PAGE_HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; ai-pinboard)"}
+
+
+def fetch_page(url: str) -> tuple[str, str]:
+    with requests.get(
+        url, headers=PAGE_HEADERS, timeout=deadline.timeout(PAGE_TIMEOUT), stream=True
+    ) as response:
+        response.raise_for_status()
+        page_url = response.url
+        if "html" not in response.headers.get("Content-Type", ""):
+            return page_url, ""
+        body = response.raw.read(PAGE_MAX_BYTES, decode_content=True)
+        encoding = response.encoding or "utf-8"
+    title, canonical = cpu_pool.run(text_edit.page_info, body.decode(encoding, errors="replace"))
+    if canonical:
+        page_url = urljoin(page_url, canonical)
+    logger.info("Page: %s (%s)", title, page_url)
+    return page_url, title
+
+
+def find_similar_page(
+    url: str, page_url: str | None, page_title: str | None, reuse: bool
+) -> tuple[list[str], IndexedSummary | None]:
+    index = search_index.get_index()
+    reused = None
+    if page_url and search_index.canonical_url(page_url) != search_index.canonical_url(url):
+        # a redirect or canonical link to a page that was processed under another URL
+        entry = index.get(page_url)
+        if entry is not None:
+            logger.warning("%s is the same page as %s (%s)", url, entry.url, entry.title)
+            if reuse and entry.summary:
+                logger.info("Reusing the summary of %s", entry.url)
+                reused = entry
+    similar = find_similar(url, page_title) if page_title else []
+    return similar, reused
+
+
+def summarize_web(
+    url: str, vocabulary: TagVocabulary, reused: IndexedSummary | None
+) -> tuple[str, Summary, list[str]]:
+    if reused is not None:
+        summary = Summary(url=url, title=reused.title, summary=reused.summary, tags=reused.tags)
+        return summary.title, summary, summary.tags
+    summary = open_router_ai.get_domain_summary(
+        url,
+        vocabulary=vocabulary.top(),
+        chat=model_router.get_router().chat,
+    )
+    logger.info("URL: %s", summary.url)
+    return summary.title, summary, summary.tags
+
+
+def web_extended(web_summary: Summary) -> str:
+    summary = cpu_pool.markdown_to_text(web_summary.summary)
+    return f"<blockquote>\n{summary}\n</blockquote>"
+
+
+def index_web(
+    url: str,
+    title: str,
+    ai_tags: list[str],
+    vocabulary: TagVocabulary,
+    web_summary: Summary,
+    pin: bool,
+) -> None:
+    search_index.get_index().add(
+        IndexedSummary(
+            url=url,
+            kind="web",
+            title=title,
+            tags=vocabulary.normalize(ai_tags),
+            summary=web_summary.summary,
+        )
+    )
+
+
+WEB_PIPELINE = Pipeline(
+    "web",
+    [
+        Stage(
+            "fetch_page",
+            fetch_page,
+            ("url",),
+            ("page_url", "page_title"),
+            degrade=(requests.RequestException, UnicodeError),
+            memo=True,
+        ),
+        # checked on the fetched page, before the summary is paid for
+        Stage(
+            "similar",
+            find_similar_page,
+            ("url", "page_url", "page_title", "reuse"),
+            ("similar", "reused"),
+            degrade=(sqlite3.Error,),
+        ),
+        VOCABULARY_STAGE,
+        Stage(
+            "summarize",
+            summarize_web,
+            ("url", "vocabulary", "reused"),
+            ("title", "web_summary", "ai_tags"),
+        ),
+        Stage("extended", web_extended, ("web_summary",), ("extended",), pure=True),
+        MERGE_TAGS_STAGE,
+        PIN_STAGE,
+        Stage(
+            "index",
+            index_web,
+            ("url", "title", "ai_tags", "vocabulary", "web_summary", "pin"),
+            degrade=(sqlite3.Error,),
+        ),
+    ],
+)
+
+# endregion Web
+
+# region Backfill
+
+
+def update_pin(post: PinboardPost, extended: str, tags: list[str]) -> bool:
+    result = pinboard_writer.add_link(
+        url=post.url,
+        description=post.description,
+        # A description written by hand is kept, only empty ones are filled in.
+        extended=post.extended or extended,
+        tags=tags,
+        dt=datetime.fromisoformat(post.time) if post.time else None,
+        shared=post.shared,
+        toread=post.toread,
+    )
+    if result is not True:
+        logger.error("Pinboard link not updated: %s", result)
+        raise Exception("Pinboard link not updated")
+    logger.info("Pinboard link updated")
+    return result
+
+
+def post_document(post: PinboardPost) -> str:
+    return f"{post.description}\n\n{post.extended}".strip()
+
+
+UPDATE_PIN_STAGE = Stage("pin", update_pin, inputs=("post", "extended", "tags"))
+
+YOUTUBE_BACKFILL_PIPELINE = YOUTUBE_PIPELINE.extend("youtube_backfill", [UPDATE_PIN_STAGE])
+WEB_BACKFILL_PIPELINE = WEB_PIPELINE.extend("web_backfill", [UPDATE_PIN_STAGE])
+
+# Bookmarks whose description is kept are only tagged, from their title and description.
+RETAG_BACKFILL_PIPELINE = Pipeline(
+    "retag_backfill",
+    [
+        VOCABULARY_STAGE,
+        Stage("document", post_document, ("post",), ("document",), pure=True),
+        Stage(
+            "tag",
+            tag_document,
+            ("document", "vocabulary", "tagger_mode", "reused"),
+            ("ai_tags",),
+        ),
+        MERGE_TAGS_STAGE,
+        UPDATE_PIN_STAGE,
+    ],
+)
+
+# endregion Backfill
+
+
+PIPELINES = {
+    p.name: p
+    for p in (
+        YOUTUBE_PIPELINE,
+        WEB_PIPELINE,
+        YOUTUBE_BACKFILL_PIPELINE,
+        WEB_BACKFILL_PIPELINE,
+        RETAG_BACKFILL_PIPELINE,
+    )
+}
+
+
+def _archive_run(pipeline: Pipeline, values: dict) -> None:
+    if not archive.ARCHIVE_RUNS:
+        return
+    try:
+        archive.get_archive().record(pipeline.name, values, log_config.current_job_id())
+    except sqlite3.Error as e:
+        logger.error("Unable to archive the %s run: %s", pipeline.name, e)
+
+
+def replay_runs(
+    pipeline: str | None = None, since: float = 0.0, limit: int | None = None
+) -> Iterator[tuple[archive.ArchivedRun, dict[str, str]]]:
+    """
+    Re-run the pure stages (cleanup, tag merging, document assembly) over archived runs.
+
+    No network or AI calls are made, so thousands of runs replay in seconds.
+
+    Args:
+        pipeline (str, optional): ``youtube`` or ``web``. Defaults to both.
+        since (float, optional): Only runs recorded after this time. Defaults to all.
+        limit (int, optional): The maximum number of runs. Defaults to all.
+
+    Yields:
+        tuple[ArchivedRun, dict[str, str]]: Each run with a unified diff per changed value.
+    """
+    for run in archive.get_archive().runs(pipeline, since, limit):
+        if run.pipeline not in PIPELINES:
+            continue
+        target = PIPELINES[run.pipeline]
+        names = tuple(o for s in target.stages if s.pure for o in s.outputs)
+        try:
+            replayed = target.replay(run.values)
+        except Exception as e:
+            logger.error("replay_runs() Run %d of %s failed: %s", run.id, run.url, e)
+            yield run, {"error": f"{type(e).__name__}: {e}\n"}
+            continue
+        yield run, archive.diff_values(run.values, replayed, names)
+
+
+def find_duplicate(url: str) -> dict | None:
+    """
+    Look up a URL in the summary index before any LLM call is made.
+
+    Args:
+        url (str): The URL about to be processed.
+
+    Returns:
+        dict | None: Values shaped like a pipeline result, built from the indexed
+        entry, or ``None`` if the URL was not processed before.
+    """
+    try:
+        entry = search_index.get_index().get(url)
+    except sqlite3.Error as e:
+        logger.error("find_duplicate() Unable to read the summary index: %s", e)
+        return None
+    if entry is None:
+        return None
+    logger.warning(
+        "%s was already bookmarked as %s. Use --force to process it again.",
+        url,
+        entry.title,
+    )
+    return {
+        "url": url,
+        "title": entry.title,
+        "tags": entry.tags,
+        "paste": PasteResult(url=entry.link, title=entry.title) if entry.link else None,
+        "duplicate": entry,
+    }
+
+
+def run_youtube(url: str, tags: list[str], tagger_mode: str, force: bool = False) -> dict:
+    """
+    Summarize a YouTube video, paste the summary and bookmark it on Pinboard.
+
+    Args:
+        url (str): The video URL.
+        tags (list[str]): Extra tags to add.
+        tagger_mode (str): ``llm``, ``local`` or ``hybrid``.
+        force (bool, optional): Process the video even if it was bookmarked before, and
+            summarize it even if a near-identical video was summarized already.
+
+    Returns:
+        dict: Every stage output, or the indexed entry under ``duplicate`` if skipped.
+    """
+    if not force and (values := find_duplicate(url)):
+        return values
+    values = YOUTUBE_PIPELINE.run(
+        url=url,
+        new_tags=tags,
+        base_tags=list(YOUTUBE_TAGS),
+        tagger_mode=tagger_mode,
+        reuse=not force,
+    )
+    _archive_run(YOUTUBE_PIPELINE, values)
+    return values
+
+
+def run_web(url: str, tags: list[str], force: bool = False) -> dict:
+    """
+    Summarize a website and bookmark it on Pinboard.
+
+    Args:
+        url (str): The website URL.
+        tags (list[str]): Extra tags to add.
+        force (bool, optional): Process the website even if it was bookmarked before, and
+            summarize it even if the page it leads to was summarized under another URL.
+
+    Returns:
+        dict: Every stage output, or the indexed entry under ``duplicate`` if skipped.
+    """
+    if not force and (values := find_duplicate(url)):
+        return values
+    values = WEB_PIPELINE.run(url=url, new_tags=tags, base_tags=[], reuse=not force)
+    _archive_run(WEB_PIPELINE, values)
+    return values
+
+
+def run_backfill(
+    post: PinboardPost, tagger_mode: str, force: bool = False
+) -> dict:
+    """
+    Summarize and tag an existing Pinboard bookmark and update it in place.
+
+    The bookmark keeps its title, creation time, privacy and unread flags, and
+    its tags are merged with the generated ones. A bookmark that already has a
+    description keeps it, so it is only tagged, without a summary or paste.
+
+    Args:
+        post (PinboardPost): The bookmark.
+        tagger_mode (str): ``llm``, ``local`` or ``hybrid``. Used for videos and for
+            bookmarks that are only tagged.
+        force (bool, optional): Process the bookmark even if it was processed before.
+
+    Returns:
+        dict: Every stage output, or the indexed entry under ``duplicate`` if skipped.
+    """
+    if not force and (values := find_duplicate(post.url)):
+        return values
+    is_youtube = post.url.startswith(YOUTUBE_URL_PREFIXES)
+    if post.extended.strip():
+        pipeline = RETAG_BACKFILL_PIPELINE
+        values = pipeline.run(
+            url=post.url,
+            title=post.description,
+            post=post,
+            extended=post.extended,
+            new_tags=[],
+            base_tags=[*post.tags, *YOUTUBE_TAGS] if is_youtube else post.tags,
+            tagger_mode=tagger_mode,
+            reused=None,
+        )
+    elif is_youtube:
+        pipeline = YOUTUBE_BACKFILL_PIPELINE
+        values = pipeline.run(
+            url=post.url,
+            post=post,
+            new_tags=[],
+            base_tags=[*post.tags, *YOUTUBE_TAGS],
+            tagger_mode=tagger_mode,
+            reuse=not force,
+        )
+    else:
+        pipeline = WEB_BACKFILL_PIPELINE
+        values = pipeline.run(
+            url=post.url, post=post, new_tags=[], base_tags=post.tags, reuse=not force
+        )
+    _archive_run(pipeline, values)
+    return values
@@ -0,0 +1,315 @@
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator
+from . import deadline
+from . import scheduler
+from .ex import DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+# Limits each provider starts at and may grow to. Override with the environment.
+INITIAL_CONCURRENCY = int(os.getenv("PROVIDER_INITIAL_CONCURRENCY", "2"))
+MAX_CONCURRENCY = int(os.getenv("PROVIDER_MAX_CONCURRENCY", "16"))
+
+# HTTP status codes that mean the provider wants fewer requests.
+OVERLOAD_CODES = (429, 503)
+
+
+class LatencyWindow:
+    """Recent latencies of one kind of request and their p95 baseline."""
+
+    def __init__(self, size: int) -> None:
+        self.latencies: deque[float] = deque(maxlen=size)
+        self.baseline: float | None = None
+
+    def p(self, pct: float) -> float | None:
+        if not self.latencies:
+            return None
+        values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(len(values) * pct))]
+
+    def add(self, latency: float, tolerance: float) -> bool:
+        """
+        Record a latency.
+
+        Args:
+            latency (float): The request duration in seconds.
+            tolerance (float): How many times the baseline the p95 may reach.
+
+        Returns:
+            bool: ``True`` if the p95 of a full window is above ``tolerance`` times the baseline.
+        """
+        self.latencies.append(latency)
+        if len(self.latencies) < (self.latencies.maxlen or 0):
+            return False
+        p95 = self.p(0.95) or 0.0
+        if self.baseline is None:
+            self.baseline = p95
+            return False
+        slow = p95 > self.baseline * tolerance
+        # follow slow drifts, such as a model that got slower for everyone
+        self.baseline += 0.05 * (p95 - self.baseline)
+        return slow
+
+
+def _status_code(error: BaseException) -> int | None:
+    # requests puts it on the response, openai on the error itself
+    code = getattr(error, "status_code", None)
+    if code is None:
+        code = getattr(getattr(error, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on the number of requests in flight to one provider.
+
+    Every call that finishes without the latency rising adds ``1 / limit`` to the
+    limit, so the limit grows by about one per round of requests. A throttled or
+    timed out call, or a recent p95 latency well above the baseline, halves it.
+    The limit is cut at most once per median latency, so one burst of errors
+    from requests that were all in flight together counts once.
+
+    Latencies are compared per feature, such as video summaries and chat, since
+    one provider's features take very different times. A change in the mix of
+    features then does not look like the provider slowing down.
+
+    Free slots go to waiting requests in :class:`scheduler.FairQueue` order, so
+    interactive jobs skip ahead of a running batch.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int = INITIAL_CONCURRENCY,
+        min_limit: int = 1,
+        max_limit: int = MAX_CONCURRENCY,
+        backoff: float = 0.5,
+        tolerance: float = 2.0,
+        window: int = 20,
+        overload: tuple[type[BaseException], ...] = (),
+    ) -> None:
+        """
+        Args:
+            name (str): The provider name used in logs.
+            initial (int, optional): The starting limit. Defaults to ``INITIAL_CONCURRENCY``.
+            min_limit (int, optional): The lowest limit. Defaults to 1.
+            max_limit (int, optional): The highest limit. Defaults to ``MAX_CONCURRENCY``.
+            backoff (float, optional): Factor applied to the limit on overload. Defaults to 0.5.
+            tolerance (float, optional): How many times the baseline p95 the recent p95
+                may reach before it counts as overload. Defaults to 2.
+            window (int, optional): Number of recent latencies of a feature the p95 is
+                taken over. Defaults to 20.
+            overload (tuple[type[BaseException], ...], optional): Errors that mean the
+                provider is overloaded, such as client timeouts. Responses with an
+                ``OVERLOAD_CODES`` status always count.
+        """
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = float(min(max(initial, min_limit), self.max_limit))
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.overload = overload
+        self.in_flight = 0
+        self.queue = scheduler.FairQueue()
+        self.increases = 0
+        self.decreases = 0
+        self.window = window
+        self.windows: dict[str, LatencyWindow] = {}
+        self._last_decrease = 0.0
+        self._cooldown = 1.0
+        self._cond = threading.Condition()
+
+    def _window(self, feature: str) -> LatencyWindow:
+        window = self.windows.get(feature)
+        if window is None:
+            window = self.windows[feature] = LatencyWindow(self.window)
+        return window
+
+    def acquire(self) -> scheduler.Ticket:
+        """
+        Wait until a request may be sent.
+
+        Returns:
+            scheduler.Ticket: The slot, to pass to :meth:`release`.
+
+        Raises:
+            DeadlineExceededError: If the job's time budget runs out while waiting.
+        """
+        with self._cond:
+            ticket = self.queue.join()
+            while self.in_flight >= int(self.limit) or not self.queue.is_next(ticket):
+                left = deadline.remaining()
+                if left is not None and left <= 0:
+                    self.queue.leave(ticket)
+                    self._cond.notify_all()
+                    raise DeadlineExceededError(f"Deadline exceeded waiting for {self.name}")
+                self._cond.wait(left)
+            self.queue.start(ticket)
+            self.in_flight += 1
+            # another slot may still be free for the next ticket in line
+            self._cond.notify_all()
+            return ticket
+
+    def release(
+        self,
+        ticket: scheduler.Ticket,
+        latency: float,
+        overloaded: bool = False,
+        feature: str = "",
+    ) -> None:
+        """
+        Record the outcome of a request and adjust the limit.
+
+        Args:
+            ticket (scheduler.Ticket): The slot returned by :meth:`acquire`.
+            latency (float): The request duration in seconds.
+            overloaded (bool, optional): The provider throttled or timed out. Defaults to False.
+            feature (str, optional): The kind of request, whose latencies it is compared with.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self.queue.finish(ticket)
+            window = self._window(feature)
+            if not overloaded:
+                overloaded = window.add(latency, self.tolerance)
+            if overloaded:
+                self._decrease(window)
+            elif self.limit < self.max_limit and self.in_flight + 1 >= int(self.limit):
+                # only grow while the current limit is actually in use
+                before = int(self.limit)
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                if int(self.limit) > before:
+                    self.increases += 1
+                    logger.info("AdaptiveLimiter(%s) limit raised to %d", self.name, int(self.limit))
+            self._cond.notify_all()
+
+    def _decrease(self, window: LatencyWindow) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self._cooldown:
+            return
+        self._last_decrease = now
+        self._cooldown = window.p(0.5) or self._cooldown
+        # judge the new limit on latencies measured under it
+        for each in self.windows.values():
+            each.latencies.clear()
+        before = int(self.limit)
+        self.limit = max(float(self.min_limit), self.limit * self.backoff)
+        self.decreases += 1
+        logger.info(
+            "AdaptiveLimiter(%s) overloaded, limit %d -> %d", self.name, before, int(self.limit)
+        )
+
+    def is_overload(
+        self, error: BaseException, latency: float = 0.0, timeout: float | None = None
+    ) -> bool:
+        """
+        Whether an error means the provider wants fewer requests.
+
+        Args:
+            error (BaseException): The error.
+            latency (float, optional): How long the request took.
+            timeout (float, optional): The full timeout of the request. An ``overload``
+                error that came sooner, because the job's time budget shortened the
+                timeout, does not count.
+
+        Returns:
+            bool: ``True`` for throttling and for timeouts the provider caused.
+        """
+        if _status_code(error) in OVERLOAD_CODES:
+            return True
+        if not isinstance(error, self.overload):
+            return False
+        return timeout is None or latency >= timeout
+
+    @contextmanager
+    def slot(self, feature: str = "", timeout: float | None = None) -> Iterator[None]:
+        """
+        Hold one request slot for the block and learn from how it went.
+
+        Errors that are not overload, such as a bad request or a timeout cut
+        short by the job's deadline, release the slot without changing the limit.
+
+        Args:
+            feature (str, optional): The kind of request, e.g. the 1min.ai request type.
+                Latencies are only compared within a feature.
+            timeout (float, optional): The full timeout of the request, before the
+                job's deadline shortens it.
+        """
+        ticket = self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            latency = time.monotonic() - start
+            if self.is_overload(e, latency, timeout):
+                self.release(ticket, latency, overloaded=True, feature=feature)
+            else:
+                with self._cond:
+                    self.in_flight -= 1
+                    self.queue.finish(ticket)
+                    self._cond.notify_all()
+            raise
+        self.release(ticket, time.monotonic() - start, feature=feature)
+
+    def snapshot(self) -> dict:
+        """
+        Get the current state.
+
+        Returns:
+            dict: The limit, in flight and waiting requests, how often the limit was
+            raised and cut, and the p50, p95 and baseline of each feature.
+        """
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": len(self.queue),
+                "increases": self.increases,
+                "decreases": self.decreases,
+                "features": {
+                    name: {"p50": w.p(0.5), "p95": w.p(0.95), "baseline": w.baseline}
+                    for name, w in self.windows.items()
+                },
+            }
+
+
+_limiters: dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str, overload: tuple[type[BaseException], ...] = ()) -> AdaptiveLimiter:
+    """
+    Get the shared limiter of a provider, creating it on first use.
+
+    Args:
+        name (str): The provider name, e.g. ``1min``.
+        overload (tuple[type[BaseException], ...], optional): Errors that mean the
+            provider is overloaded. Only used when the limiter is created.
+
+    Returns:
+        AdaptiveLimiter: The limiter.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = _limiters[name] = AdaptiveLimiter(name, overload=overload)
+        return limiter
+
+
+def snapshot() -> dict[str, dict]:
+    """
+    Get the state of every provider limiter.
+
+    Returns:
+        dict[str, dict]: Provider name mapped to :meth:`AdaptiveLimiter.snapshot`.
+    """
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.snapshot() for limiter in limiters}
@@ -0,0 +1,154 @@
+from __future__ import annotations
+import atexit
+import importlib
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable
+from . import deadline
+from . import log_config
+from . import text_edit
+from . import ex
+from .ex import DeadlineExceededError, WorkerError
+
+logger = logging.getLogger(__name__)
+
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "0"))
+
+# Modules imported by each worker when it starts, so the first job does not pay for it.
+WARM_MODULES = ("yt_dlp", "markdown", "bs4", "src.youtube_info", "src.text_edit")
+
+# Text shorter than this is converted in process. Sending it to a worker costs more than the conversion.
+MARKDOWN_OFFLOAD_MIN = 4000
+
+_pool: ProcessPoolExecutor | None = None
+_log_listener: logging.handlers.QueueListener | None = None
+_atexit_registered = False
+
+
+class _ForwardHandler(logging.Handler):
+    """Hand records from worker processes to the parent's loggers."""
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        logging.getLogger(record.name).handle(record)
+        return True
+
+
+def _init_worker(log_queue: Any, level: int) -> None:
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler = log_config.StructuredQueueHandler(log_queue)
+    # set the job fields here, the parent's filter keeps values that are already set
+    handler.addFilter(log_config.ContextFilter())
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name in WARM_MODULES:
+        importlib.import_module(name)
+
+
+def configure(workers: int = CPU_WORKERS) -> None:
+    """
+    Start or stop the worker process pool.
+
+    Args:
+        workers (int, optional): Number of worker processes. ``0`` runs CPU stages
+            in the calling thread. Defaults to the ``CPU_WORKERS`` environment variable or 0.
+    """
+    global _pool, _log_listener, _atexit_registered
+    shutdown()
+    if workers <= 0:
+        return
+    # fork is unsafe once threads are running, so workers start from a clean interpreter
+    method = "forkserver" if sys.platform.startswith("linux") else "spawn"
+    ctx = multiprocessing.get_context(method)
+    log_queue = ctx.Queue()
+    _log_listener = logging.handlers.QueueListener(log_queue, _ForwardHandler())
+    _log_listener.start()
+    _pool = ProcessPoolExecutor(
+        workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(log_queue, logging.getLogger().getEffectiveLevel()),
+    )
+    # Start every worker now so the imports happen before the first job arrives.
+    for future in [_pool.submit(os.getpid) for _ in range(workers)]:
+        future.result()
+    logger.info("configure() Started %d CPU worker processes", workers)
+    if not _atexit_registered:
+        atexit.register(shutdown)
+        _atexit_registered = True
+
+
+def shutdown() -> None:
+    """Stop the worker processes."""
+    global _pool, _log_listener
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+
+def _call_in_context(context: dict[str, str], fn: Callable[..., Any], *args: Any) -> Any:
+    # Runs in the worker, so its log records carry the caller's job id, URL and stage.
+    with log_config.restore_context(context):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if type(e).__module__ == ex.__name__:
+                raise  # the project's own errors pickle and callers handle them by type
+            logger.debug("%s() failed in worker", fn.__name__, exc_info=True)
+            raise WorkerError(type(e).__name__, str(e)) from None
+
+
+def enabled() -> bool:
+    return _pool is not None
+
+
+def run(fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    Run a CPU bound function in a worker process, or in process when the pool is off.
+
+    ``fn`` and its arguments must be picklable, so ``fn`` has to be a module level function.
+
+    Args:
+        fn (Callable): The function.
+        *args: The function arguments.
+
+    Returns:
+        Any: The function result.
+
+    Raises:
+        DeadlineExceededError: If the current time budget runs out first.
+        WorkerError: If ``fn`` raised an error other than one from ``ex`` in a worker.
+    """
+    if _pool is None:
+        return fn(*args)
+    future = _pool.submit(_call_in_context, log_config.current_context(), fn, *args)
+    try:
+        return future.result(timeout=deadline.remaining())
+    except DeadlineExceededError:
+        raise
+    except TimeoutError:
+        future.cancel()
+        raise DeadlineExceededError(f"{fn.__name__} did not finish in time")
+
+
+def markdown_to_text(markdown_text: str) -> str:
+    """
+    Convert Markdown to plain text, in a worker process when the text is large.
+
+    Args:
+        markdown_text (str): The markdown formatted text to convert.
+
+    Returns:
+        str: The plain text.
+    """
+    if len(markdown_text) < MARKDOWN_OFFLOAD_MIN:
+        return text_edit.markdown_to_text(markdown_text)
+    return run(text_edit.markdown_to_text, markdown_text)
@@ -0,0 +1,166 @@
+from __future__ import annotations
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+from .ex import DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "900"))
+
+# Default time budget in seconds for each pipeline stage.
+STAGE_BUDGETS: dict[str, float] = {
+    "fetch_info": 60.0,
+    "summarize": 300.0,
+    "shorten": 90.0,
+    "tag": 90.0,
+    "paste": 60.0,
+    "pin": 120.0,
+}
+
+# Absolute time.monotonic() value the current job or stage must finish by.
+_DEADLINE: contextvars.ContextVar[float | None] = contextvars.ContextVar(
+    "deadline", default=None
+)
+
+
+def remaining() -> float | None:
+    """
+    Get the seconds left in the current budget.
+
+    Returns:
+        float | None: Seconds left, or ``None`` if no budget is set.
+    """
+    deadline = _DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check(name: str = "") -> None:
+    """
+    Raise if the current budget is spent.
+
+    Args:
+        name (str, optional): Name used in the error message.
+
+    Raises:
+        DeadlineExceededError: If the budget is spent.
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceededError(f"Deadline exceeded {name}".strip())
+
+
+def timeout(default: float) -> float:
+    """
+    Get the timeout to use for a single I/O call.
+
+    Args:
+        default (float): The timeout to use when there is plenty of budget left.
+
+    Returns:
+        float: The smaller of ``default`` and the seconds left in the budget.
+
+    Raises:
+        DeadlineExceededError: If the budget is already spent.
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceededError("Deadline exceeded")
+    return min(default, left)
+
+
+@contextmanager
+def budget(seconds: float | None, name: str = "") -> Iterator[None]:
+    """
+    Limit the time available to the code inside the block.
+
+    Budgets nest. An inner budget never extends the outer one.
+
+    Args:
+        seconds (float | None): The budget in seconds. ``None`` keeps the outer budget.
+        name (str, optional): Name used in log and error messages.
+
+    Raises:
+        DeadlineExceededError: If the outer budget is already spent.
+    """
+    check(name)
+    parent = _DEADLINE.get()
+    deadline = parent
+    if seconds is not None:
+        deadline = time.monotonic() + seconds
+        if parent is not None:
+            deadline = min(deadline, parent)
+    token = _DEADLINE.set(deadline)
+    try:
+        yield
+    except DeadlineExceededError:
+        logger.error("budget() %s ran out of time", name or "Job")
+        raise
+    finally:
+        _DEADLINE.reset(token)
+
+
+def bind(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Wrap a function so it runs with the caller's budget in another thread.
+
+    Args:
+        fn (Callable): The function to wrap.
+
+    Returns:
+        Callable: A function to pass to ``executor.submit`` or ``threading.Thread``.
+    """
+    ctx = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return ctx.run(fn, *args, **kwargs)
+
+    return run
+
+
+def call_with_timeout(
+    fn: Callable[..., Any], seconds: float, *args: Any, **kwargs: Any
+) -> Any:
+    """
+    Call a function that has no timeout of its own and stop waiting after ``seconds``.
+
+    The call runs in a daemon thread. On timeout the thread is abandoned, so this is
+    only meant for blocking I/O in libraries that do not accept a timeout.
+
+    Args:
+        fn (Callable): The function to call.
+        seconds (float): The timeout in seconds, capped by the current budget.
+
+    Returns:
+        Any: The function result.
+
+    Raises:
+        DeadlineExceededError: If the call did not finish in time.
+    """
+    seconds = timeout(seconds)
+    future: Future = Future()
+
+    def run() -> None:
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=bind(run), daemon=True).start()
+    try:
+        return future.result(timeout=seconds)
+    except DeadlineExceededError:
+        raise
+    except TimeoutError:
+        raise DeadlineExceededError(
+            f"{getattr(fn, '__name__', fn)} did not finish in {seconds:.0f}s"
+        )
@@ -8,3 +8,24 @@ class NoCaptionsError(Exception):
 
 class PastebinFilterError(Exception):
     pass
+
+
+class DeadlineExceededError(TimeoutError):
+    pass
+
+
+class WorkerError(Exception):
+    """
+    An error raised in a worker process.
+
+    Errors such as yt-dlp's ``DownloadError`` hold objects that cannot be pickled
+    back to the parent, so the worker sends the type name and message instead.
+    """
+
+    def __init__(self, type_name: str, message: str) -> None:
+        super().__init__(type_name, message)
+        self.type_name = type_name
+        self.message = message
+
+    def __str__(self) -> str:
+        return f"{self.type_name}: {self.message}"
@@ -0,0 +1,231 @@
+from __future__ import annotations
+import logging
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+import numpy as np
+from .paths import cache_path
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "fingerprints.db"
+
+NUM_HASHES = 64
+BANDS = 16  # 16 bands of 4 rows find pairs above ~0.5 similarity with high probability
+ROWS = NUM_HASHES // BANDS
+SHINGLE_WORDS = 3
+# Texts with fewer shingles than this are too short to fingerprint reliably.
+MIN_SHINGLES = 8
+# Only the start of a text is fingerprinted, so a long description cannot outweigh the title.
+MAX_WORDS = 200
+# Estimated Jaccard similarity above which two videos are treated as the same content.
+SIMILARITY_THRESHOLD = float(os.getenv("FINGERPRINT_THRESHOLD", "0.8"))
+
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_rng = np.random.default_rng(20250707)  # fixed seed, signatures must be stable across runs
+_A = _rng.integers(1, 2**31, NUM_HASHES, dtype=np.uint64)
+_B = _rng.integers(0, 2**31, NUM_HASHES, dtype=np.uint64)
+
+_WORD = re.compile(r"\w+")
+_URL = re.compile(r"https?://\S+")
+# Lines a channel repeats under every video: calls to action, social links, sponsors.
+_BOILERPLATE = re.compile(
+    r"\b(?:subscribe|patreon|sponsor(?:ed)?|affiliate|merch|discord|instagram|twitter|tiktok"
+    r"|facebook|linkedin|newsletter|donate|donation|paypal|ko-fi|business inquir(?:y|ies)"
+    r"|follow (?:me|us)|support (?:me|us|the channel)|thanks for watching|music by|my gear"
+    r"|all rights reserved|copyright)\b",
+    re.IGNORECASE,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    url TEXT PRIMARY KEY,
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bands (
+    bucket INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (bucket, url)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS bands_url ON bands (url);
+"""
+
+
+def strip_boilerplate(text: str) -> str:
+    """
+    Remove the lines of a video description that many unrelated videos share.
+
+    Lines with a call to action, such as subscribing or a sponsor, lines that are
+    mostly links and lines of only hashtags are dropped, so two videos of one
+    channel are not similar just because of their footer.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        str: The remaining lines.
+    """
+    kept = []
+    for line in text.splitlines():
+        words = _URL.sub(" ", line).split()
+        if len(words) < 3 and _URL.search(line):
+            continue
+        if words and all(w.startswith("#") for w in words):
+            continue
+        if _BOILERPLATE.search(line):
+            continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def shingles(text: str) -> set[int]:
+    """
+    Hash the overlapping word triples of a text.
+
+    Boilerplate lines and links are removed first, since descriptions of re-uploads
+    often differ only in their links, and only the first ``MAX_WORDS`` words are used.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        set[int]: CRC32 of each three word sequence.
+    """
+    words = _WORD.findall(_URL.sub(" ", strip_boilerplate(text)).casefold())[:MAX_WORDS]
+    return {
+        zlib.crc32(" ".join(words[i : i + SHINGLE_WORDS]).encode("utf-8"))
+        for i in range(max(len(words) - SHINGLE_WORDS + 1, 0))
+    }
+
+
+def signature(text: str) -> np.ndarray | None:
+    """
+    Compute the MinHash signature of a text.
+
+    Args:
+        text (str): The text, e.g. a video title and description.
+
+    Returns:
+        np.ndarray | None: ``NUM_HASHES`` unsigned integers, or ``None`` if the text
+        is too short to fingerprint.
+    """
+    values = shingles(text)
+    if len(values) < MIN_SHINGLES:
+        return None
+    x = np.fromiter(values, dtype=np.uint64, count=len(values))
+    # (a * x + b) mod p for every hash function and shingle at once, then the column minimum
+    hashed = (_A[:, None] * x[None, :] + _B[:, None]) % _PRIME
+    return hashed.min(axis=1)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimate the Jaccard similarity of two texts from their signatures."""
+    return float(np.count_nonzero(a == b)) / NUM_HASHES
+
+
+def _buckets(sig: np.ndarray) -> list[int]:
+    # A hash of each band's rows, with the band number in the high bits.
+    return [
+        zlib.crc32(sig[i * ROWS : (i + 1) * ROWS].tobytes()) | (i << 32) for i in range(BANDS)
+    ]
+
+
+class FingerprintIndex:
+    """
+    Locality sensitive hashing index of MinHash signatures.
+
+    Each signature is split into bands. Two texts are candidates when any band
+    matches exactly, and candidates are confirmed by comparing the full signatures,
+    so a lookup reads a handful of rows however many videos are indexed.
+    """
+
+    def __init__(self, path: Path | None = None) -> None:
+        """
+        Args:
+            path (Path, optional): The database file. Defaults to the cache file.
+        """
+        self.path = path or cache_path(INDEX_FILE)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def add(self, url: str, sig: np.ndarray) -> None:
+        """
+        Add or replace the signature of a URL.
+
+        Args:
+            url (str): The URL.
+            sig (np.ndarray): Its signature.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM bands WHERE url = ?", (url,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fingerprints (url, signature) VALUES (?, ?)",
+                (url, sig.tobytes()),
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO bands (bucket, url) VALUES (?, ?)",
+                [(bucket, url) for bucket in _buckets(sig)],
+            )
+
+    def nearest(
+        self, sig: np.ndarray, threshold: float = SIMILARITY_THRESHOLD, exclude: str = ""
+    ) -> tuple[str, float] | None:
+        """
+        Find the most similar indexed text.
+
+        Args:
+            sig (np.ndarray): The signature to look up.
+            threshold (float, optional): The minimum estimated similarity.
+                Defaults to ``SIMILARITY_THRESHOLD``.
+            exclude (str, optional): A URL to ignore, usually the one being processed.
+
+        Returns:
+            tuple[str, float] | None: The URL and its similarity, or ``None`` if nothing
+            reaches the threshold.
+        """
+        buckets = _buckets(sig)
+        marks = ", ".join("?" * len(buckets))
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT f.url, f.signature FROM fingerprints f
+                WHERE f.url IN (SELECT url FROM bands WHERE bucket IN ({marks}))
+                """,
+                buckets,
+            ).fetchall()
+        best: tuple[str, float] | None = None
+        for url, blob in rows:
+            if url == exclude:
+                continue
+            score = similarity(sig, np.frombuffer(blob, dtype=np.uint64))
+            if score >= threshold and (best is None or score > best[1]):
+                best = (url, score)
+        return best
+
+
+_index: FingerprintIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> FingerprintIndex:
+    """
+    Get the shared fingerprint index, opening it on first use.
+
+    Returns:
+        FingerprintIndex: The index.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FingerprintIndex()
+        return _index
@@ -0,0 +1,273 @@
+from __future__ import annotations
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+# Context fields that are attached to every log record emitted while a job is running.
+_JOB_ID: contextvars.ContextVar[str] = contextvars.ContextVar("job_id", default="")
+_URL: contextvars.ContextVar[str] = contextvars.ContextVar("url", default="")
+_STAGE: contextvars.ContextVar[str] = contextvars.ContextVar("stage", default="")
+
+CONTEXT_FIELDS = ("job_id", "url", "stage", "duration")
+CONSOLE_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener: logging.handlers.QueueListener | None = None
+_atexit_registered = False
+
+
+class ContextFilter(logging.Filter):
+    """
+    Copy the current job context onto each record.
+
+    The filter is attached to the ``QueueHandler`` so that it runs in the thread
+    that emitted the record, before the record is handed to the listener thread.
+    Values passed explicitly with ``extra=`` take precedence.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "job_id", ""):
+            record.job_id = _JOB_ID.get()
+        if not getattr(record, "url", ""):
+            record.url = _URL.get()
+        if not getattr(record, "stage", ""):
+            record.stage = _STAGE.get()
+        if not hasattr(record, "duration"):
+            record.duration = None
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format log records as a single JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value not in (None, ""):
+                data[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue records with the traceback kept apart from the message.
+
+    The default ``prepare`` appends the traceback to ``msg`` and drops ``exc_text``,
+    so the JSON lines could not put it in their ``exc`` field. The formatted traceback
+    is kept in ``exc_text`` instead, which the console formatter still prints.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+            # the traceback objects cannot cross the queue to another process
+            record.exc_info = None
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+_TRACEBACK_FORMATTER = logging.Formatter()
+
+
+def parse_module_levels(spec: str) -> dict[str, int]:
+    """
+    Parse a per-module level specification.
+
+    Args:
+        spec (str): Comma separated ``module=LEVEL`` pairs, e.g. ``"src.one_min_ai=DEBUG,urllib3=WARNING"``.
+
+    Returns:
+        dict[str, int]: Logger name mapped to numeric level.
+
+    Raises:
+        ValueError: If a level name is not recognised.
+    """
+    result: dict[str, int] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item or "=" not in item:
+            continue
+        name, level_name = item.split("=", 1)
+        level = logging.getLevelName(level_name.strip().upper())
+        if not isinstance(level, int):
+            raise ValueError(f"Unknown log level: {level_name}")
+        result[name.strip()] = level
+    return result
+
+
+def setup_logging(
+    log_file: Path,
+    level: int | str = logging.INFO,
+    module_levels: dict[str, int] | None = None,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    console: bool = True,
+) -> logging.handlers.QueueListener:
+    """
+    Configure the root logger to log through a queue.
+
+    Callers only pay for putting the record on a queue. A ``QueueListener`` thread
+    writes JSON lines to a size rotated file and, optionally, human readable lines
+    to the console.
+
+    Args:
+        log_file (Path): The log file to write JSON lines to.
+        level (int | str, optional): The root log level. Defaults to logging.INFO.
+        module_levels (dict[str, int], optional): Per logger levels. Defaults to None.
+        max_bytes (int, optional): Rotate the log file when it reaches this size. Defaults to 10 MB.
+        backup_count (int, optional): Number of rotated files to keep. Defaults to 5.
+        console (bool, optional): Also log to the console. Defaults to True.
+
+    Returns:
+        logging.handlers.QueueListener: The running listener.
+    """
+    global _listener, _atexit_registered
+    if _listener is not None:
+        _listener.stop()
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonLinesFormatter())
+    handlers: list[logging.Handler] = [file_handler]
+    if console:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        handlers.append(stream_handler)
+
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name, module_level in (module_levels or {}).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    if not _atexit_registered:
+        atexit.register(shutdown_logging)
+        _atexit_registered = True
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """Flush any queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def current_context() -> dict[str, str]:
+    """
+    Get the job context of the current thread, to hand to another process.
+
+    Returns:
+        dict[str, str]: The job id, URL and stage.
+    """
+    return {"job_id": _JOB_ID.get(), "url": _URL.get(), "stage": _STAGE.get()}
+
+
+@contextmanager
+def restore_context(context: dict[str, str]) -> Iterator[None]:
+    """
+    Attach a job context taken with :func:`current_context` to records logged inside the block.
+
+    Args:
+        context (dict[str, str]): The job id, URL and stage.
+    """
+    tokens = [
+        (var, var.set(context.get(name, "")))
+        for name, var in (("job_id", _JOB_ID), ("url", _URL), ("stage", _STAGE))
+    ]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def current_job_id() -> str:
+    """Get the ID of the job running in the current context, or an empty string."""
+    return _JOB_ID.get()
+
+
+def new_job_id() -> str:
+    """
+    Create a short unique job identifier.
+
+    Returns:
+        str: A 12 character hex string.
+    """
+    return uuid.uuid4().hex[:12]
+
+
+@contextmanager
+def job_context(url: str, job_id: str = "") -> Iterator[str]:
+    """
+    Attach a job id and URL to all records logged inside the block.
+
+    Args:
+        url (str): The URL being processed.
+        job_id (str, optional): The job id. A new one is created if omitted.
+
+    Yields:
+        str: The job id.
+    """
+    job_id = job_id or new_job_id()
+    job_token = _JOB_ID.set(job_id)
+    url_token = _URL.set(url)
+    try:
+        yield job_id
+    finally:
+        _URL.reset(url_token)
+        _JOB_ID.reset(job_token)
+
+
+@contextmanager
+def stage(name: str, log: logging.Logger | None = None) -> Iterator[None]:
+    """
+    Attach a stage name to records logged inside the block and log its duration.
+
+    Args:
+        name (str): The stage name, e.g. ``summarize``.
+        log (logging.Logger, optional): The logger to report the duration to.
+    """
+    log = log or logging.getLogger(__name__)
+    token = _STAGE.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = round(time.perf_counter() - start, 3)
+        log.info("Stage %s finished in %.3fs", name, duration, extra={"duration": duration})
+        _STAGE.reset(token)
@@ -0,0 +1,316 @@
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Protocol
+from . import one_min_ai
+from . import open_router_ai
+from . import deadline
+from . import usage
+from .concurrency import AdaptiveLimiter
+
+logger = logging.getLogger(__name__)
+
+# Comma separated `provider:model` pairs, in order of preference.
+DEFAULT_ROUTES = "1min:deepseek-chat,openrouter:mistralai/mistral-nemo:free"
+MODEL_ROUTES = os.getenv("MODEL_ROUTES", DEFAULT_ROUTES)
+
+
+class ChatBackend(Protocol):
+    name: str
+    limiter: AdaptiveLimiter
+
+    def chat(self, prompt: str) -> str: ...
+
+
+class OneMinAIBackend:
+    """A 1min.ai ``CHAT_WITH_AI`` model."""
+
+    def __init__(self, model: str = "deepseek-chat") -> None:
+        self.model = model
+        self.name = f"1min:{model}"
+        self.limiter = one_min_ai.LIMITER
+
+    def chat(self, prompt: str) -> str:
+        return one_min_ai.query_chat(prompt, self.model)
+
+
+class OpenRouterBackend:
+    """An OpenRouter chat completion model."""
+
+    def __init__(self, model: str = "mistralai/mistral-nemo:free") -> None:
+        self.model = model
+        self.name = f"openrouter:{model}"
+        self.limiter = open_router_ai.LIMITER
+
+    def chat(self, prompt: str) -> str:
+        return open_router_ai.query_chat(prompt, self.model)
+
+
+_BACKENDS: dict[str, Callable[[str], ChatBackend]] = {
+    "1min": OneMinAIBackend,
+    "openrouter": OpenRouterBackend,
+}
+
+
+class BackendStats:
+    """Rolling latency and error rate of a backend."""
+
+    def __init__(self, window: int = 50, cooldown: float = 60.0) -> None:
+        """
+        Args:
+            window (int, optional): Number of recent calls to keep. Defaults to 50.
+            cooldown (float, optional): Seconds an unhealthy backend is skipped. Defaults to 60.
+        """
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.cooldown = cooldown
+        self.down_until = 0.0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def begin(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def record(self, latency: float, ok: bool) -> None:
+        """
+        Record the outcome of a call.
+
+        The backend is marked unhealthy for ``cooldown`` seconds after three
+        failures in a row or when at least half of the recent calls failed.
+
+        Args:
+            latency (float): The call duration in seconds.
+            ok (bool): Whether the call succeeded.
+        """
+        with self._lock:
+            self.in_flight -= 1
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+                return
+            recent = list(self.outcomes)[-3:]
+            if (len(recent) == 3 and not any(recent)) or (
+                len(self.outcomes) >= 4 and self.error_rate() >= 0.5
+            ):
+                self.down_until = time.monotonic() + self.cooldown
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def percentile(self, pct: float) -> float | None:
+        if not self.latencies:
+            return None
+        values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(len(values) * pct))]
+
+    def p50(self) -> float | None:
+        return self.percentile(0.5)
+
+    def p95(self) -> float | None:
+        return self.percentile(0.95)
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+
+class ModelRouter:
+    """
+    Send chat prompts to the fastest healthy backend.
+
+    Backends are ranked by their rolling median latency, with unhealthy backends
+    (high error rate or consecutive failures) moved to the end until their cool down
+    expires. When the chosen backend takes longer than its p95 latency, the request
+    is hedged by sending a duplicate to the next backend and the first reply wins.
+    Failed requests fail over to the next backend.
+    """
+
+    def __init__(
+        self,
+        backends: list[ChatBackend],
+        hedge: bool = True,
+        hedge_after: float = 30.0,
+        min_hedge_after: float = 2.0,
+        max_workers: int = 8,
+    ) -> None:
+        """
+        Args:
+            backends (list[ChatBackend]): Backends in order of preference.
+            hedge (bool, optional): Hedge slow requests. Defaults to True.
+            hedge_after (float, optional): Hedge delay in seconds until a backend has latency samples. Defaults to 30.
+            min_hedge_after (float, optional): Lower bound for the p95 hedge delay. Defaults to 2.
+            max_workers (int, optional): Threads used for in flight requests. Defaults to 8.
+        """
+        if not backends:
+            raise ValueError("At least one backend is required")
+        self.backends = backends
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.min_hedge_after = min_hedge_after
+        self.stats = {b.name: BackendStats() for b in backends}
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="model-router")
+
+    def ranked(self) -> list[ChatBackend]:
+        """
+        Get the backends in the order they will be tried.
+
+        Returns:
+            list[ChatBackend]: Healthy backends by median latency, then unhealthy ones.
+        """
+
+        def key(item: tuple[int, ChatBackend]) -> tuple:
+            order, backend = item
+            stats = self.stats[backend.name]
+            p50 = stats.p50()
+            return (not stats.healthy, p50 is None, p50 or 0.0, order)
+
+        return [b for _, b in sorted(enumerate(self.backends), key=key)]
+
+    def _hedge_delay(self, backend: ChatBackend) -> float:
+        p95 = self.stats[backend.name].p95()
+        if p95 is None:
+            return self.hedge_after
+        return max(self.min_hedge_after, p95)
+
+    def _call(self, backend: ChatBackend, prompt: str) -> str:
+        stats = self.stats[backend.name]
+        stats.begin()
+        start = time.monotonic()
+        try:
+            result = backend.chat(prompt)
+        except Exception:
+            stats.record(time.monotonic() - start, False)
+            raise
+        stats.record(time.monotonic() - start, True)
+        return result
+
+    def chat(self, prompt: str) -> str:
+        """
+        Send a prompt and return the first successful reply.
+
+        Args:
+            prompt (str): The prompt.
+
+        Returns:
+            str: The reply.
+
+        Raises:
+            Exception: The last error if every backend failed.
+        """
+        queue = self.ranked()
+        pending: dict[Future, ChatBackend] = {}
+        last_error: Exception | None = None
+
+        def launch() -> ChatBackend | None:
+            if not queue:
+                return None
+            backend = queue.pop(0)
+            call = deadline.bind(self._call)
+            pending[self._executor.submit(call, backend, prompt)] = backend
+            return backend
+
+        current = launch()
+        while pending:
+            left = deadline.remaining()
+            timeout = left
+            # a hedge pays for two replies, so near the budget each prompt is sent once
+            hedging = (
+                self.hedge
+                and queue
+                and len(pending) == 1
+                and current is not None
+                and not usage.near_budget()
+            )
+            if hedging:
+                timeout = self._hedge_delay(current)
+                if left is not None:
+                    timeout = min(timeout, left)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                deadline.check("waiting for a model reply")
+                logger.info(
+                    "ModelRouter.chat() %s is slow, hedging with %s",
+                    current.name,
+                    queue[0].name,
+                )
+                current = launch()
+                continue
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    logger.warning("ModelRouter.chat() %s failed: %s", backend.name, e)
+                    last_error = e
+            if not pending:
+                current = launch()
+        raise last_error or Exception("No backend returned a reply")
+
+    def snapshot(self) -> dict[str, dict]:
+        """
+        Get the current statistics of each backend.
+
+        Returns:
+            dict[str, dict]: Backend name mapped to its p50, p95, error rate, health
+            and the current concurrency limit of its provider.
+        """
+        result = {}
+        for backend in self.backends:
+            s = self.stats[backend.name]
+            result[backend.name] = {
+                "p50": s.p50(),
+                "p95": s.p95(),
+                "error_rate": s.error_rate(),
+                "healthy": s.healthy,
+                "in_flight": s.in_flight,
+                "limit": int(backend.limiter.limit),
+            }
+        return result
+
+
+def parse_routes(routes: str) -> list[ChatBackend]:
+    """
+    Create backends from a route specification.
+
+    Args:
+        routes (str): Comma separated ``provider:model`` pairs, e.g. ``1min:deepseek-chat``.
+
+    Returns:
+        list[ChatBackend]: The backends.
+
+    Raises:
+        ValueError: If a provider is unknown.
+    """
+    result: list[ChatBackend] = []
+    for route in routes.split(","):
+        route = route.strip()
+        if not route:
+            continue
+        provider, _, model = route.partition(":")
+        if provider not in _BACKENDS:
+            raise ValueError(f"Unknown provider: {provider}")
+        result.append(_BACKENDS[provider](model) if model else _BACKENDS[provider]())
+    return result
+
+
+_router: ModelRouter | None = None
+
+
+def get_router() -> ModelRouter:
+    """
+    Get the shared router built from the ``MODEL_ROUTES`` environment variable.
+
+    Returns:
+        ModelRouter: The router.
+    """
+    global _router
+    if _router is None:
+        _router = ModelRouter(parse_routes(MODEL_ROUTES))
+    return _router
@@ -3,32 +3,139 @@ import os
 import json
 import logging
 import requests
-from .ex import NoCaptionsError
+from .ex import DeadlineExceededError, NoCaptionsError
 from . import text_edit
+from . import prompts
+from . import deadline
+from . import concurrency
+from . import usage
+from .records import Usage
 
 
 logger = logging.getLogger(__name__)
 
 ONE_MIN_AI_API_KEY = os.getenv("ONE_MIN_AI_API_KEY")
 API_URL = "https://api.1min.ai/api/features"
+# Seconds to wait for a reply. The YouTube summarizer fetches captions first so it gets longer.
+SUMMARY_TIMEOUT = 300
+CHAT_TIMEOUT = 120
+
+# Requests in flight to 1min.ai, adjusted to its observed latency and throttling.
+# TimeoutError is a request that ran for its whole timeout, see _post.
+LIMITER = concurrency.get_limiter("1min", overload=(requests.Timeout, TimeoutError))
+
+
+# Used to estimate the credits of a request when the reply does not report them.
+CREDITS_PER_TOKEN = float(os.getenv("ONE_MIN_AI_CREDITS_PER_TOKEN", "1.0"))
+# The YouTube summarizer reads the transcript, which is not sent from here. Its size
+# is estimated from the video duration, or taken as a video of DEFAULT_VIDEO_MINUTES.
+TRANSCRIPT_TOKENS_PER_MINUTE = int(os.getenv("TRANSCRIPT_TOKENS_PER_MINUTE", "200"))
+DEFAULT_VIDEO_MINUTES = 15
+# Keys of the aiRecord (or its aiRecordDetail) that may hold the credits charged.
+_CREDIT_KEYS = ("credit", "credits", "usedCredit")
 
 
 def _get_headers():
     return {"API-KEY": ONE_MIN_AI_API_KEY, "Content-Type": "application/json"}
 
 
-def get_youtube_summary(url: str, model: str = "deepseek-chat") -> str:
+def _post(data: dict, default_timeout: float) -> requests.Response:
+    """
+    Send a request to 1min.ai within the job's time budget.
+
+    The ``requests`` timeout limits each read, not the whole request, so the call
+    is also given a hard limit of ``default_timeout`` or the budget left.
+
+    Args:
+        data (dict): The request body.
+        default_timeout (float): The timeout when there is plenty of budget left.
+
+    Returns:
+        requests.Response: The response.
+
+    Raises:
+        DeadlineExceededError: If the request did not finish in time.
+    """
+    try:
+        return deadline.call_with_timeout(
+            requests.post,
+            default_timeout,
+            API_URL,
+            headers=_get_headers(),
+            data=json.dumps(data),
+            timeout=deadline.timeout(default_timeout),
+        )
+    except requests.Timeout as e:
+        left = deadline.remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceededError("Deadline exceeded waiting for 1min.ai") from e
+        raise
+
+
+def transcript_tokens(duration: int) -> int:
+    """
+    Estimate the tokens of a video transcript.
+
+    Args:
+        duration (int): The video duration in seconds, 0 if not known.
+
+    Returns:
+        int: The estimated tokens.
+    """
+    minutes = duration / 60 if duration > 0 else DEFAULT_VIDEO_MINUTES
+    return int(minutes * TRANSCRIPT_TOKENS_PER_MINUTE)
+
+
+def _record_usage(
+    record: dict, model: str, prompt: str, result: str, input_tokens: int = 0
+) -> None:
+    """
+    Add the cost of a request to the usage ledger, estimating it if it was not reported.
+
+    ``input_tokens`` are read by 1min.ai on top of the prompt, such as a video transcript.
+    """
+    prompt_tokens = prompts.count_tokens(prompt) + input_tokens
+    completion_tokens = prompts.count_tokens(result)
+    credits = None
+    for part in (record, record.get("aiRecordDetail") or {}):
+        for key in _CREDIT_KEYS:
+            if isinstance(part.get(key), (int, float)):
+                credits = float(part[key])
+                break
+        if credits is not None:
+            break
+    usage.record(
+        Usage(
+            provider="1min",
+            model=model,
+            feature=record.get("type", ""),
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            credits=(
+                credits
+                if credits is not None
+                else (prompt_tokens + completion_tokens) * CREDITS_PER_TOKEN
+            ),
+            estimated=credits is None,
+        )
+    )
+
+
+def get_youtube_summary(url: str, model: str = "deepseek-chat", duration: int = 0) -> str:
     """
     Get a summary of a YouTube video using the 1min.ai API.
 
     Args:
         url (str): The URL of the YouTube video to summarize.
         model (str, optional): The AI model to use. Defaults to "deepseek-chat".
+        duration (int, optional): The video duration in seconds, used to estimate the
+            transcript's cost when 1min.ai does not report the credits. Defaults to unknown.
 
     Returns:
         str: A summary of the video content.
 
     Raises:
+        DeadlineExceededError: If the reply did not come in time.
         requests.exceptions.RequestException: If there is an error with the API request.
     """
     data = {
@@ -40,18 +147,25 @@ def get_youtube_summary(url: str, model: str = "deepseek-chat") -> str:
     }
 
     try:
-        response = requests.post(API_URL, headers=_get_headers(), data=json.dumps(data))
-        response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
+        with LIMITER.slot(data["type"], SUMMARY_TIMEOUT):
+            response = _post(data, SUMMARY_TIMEOUT)
+            response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
 
         if response.status_code != 200:
             logging.error("get_youtube_summary() Status code: %s", response.status_code)
             raise Exception(f"Status code: {response.status_code}")
         dd = response.json()
         result = dd["aiRecord"]["aiRecordDetail"]["resultObject"][0]
+        # the transcript is fetched by 1min.ai, so its size is estimated
+        _record_usage(dd["aiRecord"], model, "", result, transcript_tokens(duration))
         return result
 
     except requests.exceptions.RequestException as e:
-        if e.response.reason == "Forbidden" and "No captions" in e.response.text:
+        if (
+            e.response is not None
+            and e.response.reason == "Forbidden"
+            and "No captions" in e.response.text
+        ):
             logging.error("get_youtube_summary() No captions found for video")
             raise NoCaptionsError("No captions found for video")
         logging.error("get_youtube_summary() An error occurred: %s", e)
@@ -71,6 +185,7 @@ def query_chat(prompt: str, model="deepseek-chat", conversation_id: str = "") ->
         str: The AI generated response.
 
     Raises:
+        DeadlineExceededError: If the reply did not come in time.
         requests.exceptions.RequestException: If there is an error with the API request.
     """
     # conversationId is not required unless you need the conversation to persist.
@@ -92,14 +207,16 @@ def query_chat(prompt: str, model="deepseek-chat", conversation_id: str = "") ->
         data["conversationId"] = conversation_id
 
     try:
-        response = requests.post(API_URL, headers=_get_headers(), data=json.dumps(data))
-        response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
+        with LIMITER.slot(data["type"], CHAT_TIMEOUT):
+            response = _post(data, CHAT_TIMEOUT)
+            response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
 
         if response.status_code != 200:
             logging.error("query_deepseek_chat() Status code: %s", response.status_code)
             raise Exception(f"Status code: {response.status_code}")
         dd = response.json()
         result = dd["aiRecord"]["aiRecordDetail"]["resultObject"][0]
+        _record_usage(dd["aiRecord"], model, prompt, result)
         return result
 
     except requests.exceptions.RequestException as e:
@@ -107,38 +224,52 @@ def query_chat(prompt: str, model="deepseek-chat", conversation_id: str = "") ->
         raise e
 
 
-def query_tags(content: str, model: str = "deepseek-chat") -> list[str]:
+def tags_prompt(content: str, vocabulary: list[str] | None = None) -> str:
     """
-    Generate tags from content using AI.
+    Build the prompt used to generate tags from content.
 
     Args:
         content (str): The text content to generate tags from.
-        model (str, optional): The AI model to use. Defaults to "deepseek-chat".
+        vocabulary (list[str], optional): Existing tags the AI should prefer. Defaults to None.
 
     Returns:
-        list[str]: A list of CamelCase tags (maximum 8) generated from the content.
+        str: The prompt.
     """
-    prompt = text_edit.ai_prompt_pre()
-    prompt += """Generate tags that are a appropriate
+    return prompts.TAGS.render(
+        vocabulary=prompts.vocabulary_rule(vocabulary), content=content
+    )
 
-Rules for generation
-- Max of 8 tags
-- Tags must be in CamelCase
-- Return tags in Json format as a list with the key of `tags`
 
-Below is the text to use for tag generation:
+def parse_tags(result: str) -> list[str]:
+    """
+    Get the tags from a tag generation reply.
+
+    Args:
+        result (str): The AI reply containing a JSON object with a `tags` key.
+
+    Returns:
+        list[str]: The non empty tags.
+    """
+    dd = text_edit.get_dict_json(result)
+    return [tag for tag in dd["tags"] if tag]
 
 
-"""
-    prompt += content
-    result = query_chat(prompt, model)
-    lines = result.split("\n")
-    # remove first line ```
-    lines = lines[1:]
-    # remove last line ```
-    lines = lines[:-1]
-    dd = json.loads("\n".join(lines))
-    return dd["tags"]
+def query_tags(
+    content: str, model: str = "deepseek-chat", vocabulary: list[str] | None = None
+) -> list[str]:
+    """
+    Generate tags from content using AI.
+
+    Args:
+        content (str): The text content to generate tags from.
+        model (str, optional): The AI model to use. Defaults to "deepseek-chat".
+        vocabulary (list[str], optional): Existing tags the AI should prefer. Defaults to None.
+
+    Returns:
+        list[str]: A list of CamelCase tags (maximum 8) generated from the content.
+    """
+    result = query_chat(tags_prompt(content, vocabulary), model)
+    return parse_tags(result)
 
 
 def shorten_content(
@@ -166,14 +297,16 @@ def shorten_content(
     }
 
     try:
-        response = requests.post(API_URL, headers=_get_headers(), data=json.dumps(data))
-        response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
+        with LIMITER.slot(data["type"], CHAT_TIMEOUT):
+            response = _post(data, CHAT_TIMEOUT)
+            response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
 
         if response.status_code != 200:
             logging.error("shorten_content() Status code: %s", response.status_code)
             raise Exception(f"Status code: {response.status_code}")
         dd = response.json()
         result = dd["aiRecord"]["aiRecordDetail"]["resultObject"][0]
+        _record_usage(dd["aiRecord"], model, content, result)
         return result
 
     except requests.exceptions.RequestException as e:
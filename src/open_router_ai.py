@@ -1,66 +1,133 @@
 from __future__ import annotations
 import os
 import logging
-from openai import OpenAI
-from .text_edit import get_dict_json, ai_prompt_pre
+from typing import Callable
+from openai import APITimeoutError, OpenAI
+from .text_edit import get_dict_json
+from . import deadline
+from . import prompts
+from . import concurrency
+from . import usage
+from .ex import DeadlineExceededError
+from .records import Summary, Usage
 
 _BASE_URL = "https://openrouter.ai/api/v1"
 _API_KEY = os.getenv("OPEN_ROUTER_API_KEY")
+CHAT_TIMEOUT = 120
 
 if not _API_KEY:
     raise ValueError("OPEN_ROUTER_API_KEY is not set")
 
 logger = logging.getLogger(__name__)
 
+# Requests in flight to OpenRouter, adjusted to its observed latency and throttling.
+# Free models are rate limited per account, so all models share one limit.
+# TimeoutError is a request that ran for its whole timeout, see query_chat.
+LIMITER = concurrency.get_limiter("openrouter", overload=(APITimeoutError, TimeoutError))
 
-def get_domain_summary(
-    url: str, character_max: int = 475, model="mistralai/mistral-nemo:free"
-) -> dict[str, str]:
+
+def _record_usage(response, model: str, prompt: str) -> None:
+    """Add the tokens and cost OpenRouter reported for a completion to the usage ledger."""
+    reported = response.usage
+    cost = getattr(reported, "cost", None) if reported else None
+    usage.record(
+        Usage(
+            provider="openrouter",
+            model=model,
+            feature="chat",
+            prompt_tokens=(
+                reported.prompt_tokens if reported else prompts.count_tokens(prompt)
+            ),
+            completion_tokens=reported.completion_tokens if reported else 0,
+            # free models report no cost and cost nothing
+            credits=float(cost or 0.0),
+            estimated=cost is None and not model.endswith(":free"),
+        )
+    )
+
+
+def query_chat(prompt: str, model: str = "mistralai/mistral-nemo:free") -> str:
     """
-    Get a summary of a website using the OpenRouter API.
+    Query an OpenRouter chat model with a prompt.
 
     Args:
-        url (str): The URL of the website to summarize.
+        prompt (str): The text prompt to send to the AI.
+        model (str, optional): The AI model to use. Defaults to "mistralai/mistral-nemo:free".
 
     Returns:
-        dict: A summary of the website content. The summary is in the `summary` key and the tags are in the `tags` key.
+        str: The AI generated response.
 
     Raises:
+        DeadlineExceededError: If the reply did not come in time.
         Exception: If there is an error with the API request.
     """
-    prompt = ai_prompt_pre()
-
-    prompt += f"""Analyze the website `{url}` and generate a title, a concise summary, and relevant tags.
-
-**Generation Rules:**
-* The summary must be in Markdown format.
-* Provide a maximum of 10 tags.
-* The summary must be {character_max} characters or less.
-* Tags must be in `CamelCase` format (e.g., `DatabaseAsAService`, `ScalableCloud`).
-* The output must be a JSON object with the following keys:
-    * `title`: (string) The suggested title for the website.
-    * `summary`: (string) The Markdown-formatted summary.
-    * `tags`: (array of strings) A list of `CamelCase` tags.
-"""
-    try:
+    with LIMITER.slot(model, CHAT_TIMEOUT):
         client = OpenAI(
             api_key=_API_KEY,
             base_url=_BASE_URL,
+            timeout=deadline.timeout(CHAT_TIMEOUT),
+            max_retries=0,
         )
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
-        )
-        if response.choices[0].finish_reason != "stop":
-            raise Exception(f"Status code: {response.choices[0].finish_reason}")
-        content = response.choices[0].message.content
-        if not content:
-            raise Exception("No content returned")
+        try:
+            # the client timeout limits each read, so the whole call gets a hard limit too
+            response = deadline.call_with_timeout(
+                client.chat.completions.create,
+                CHAT_TIMEOUT,
+                model=model,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt,
+                    }
+                ],
+                # ask OpenRouter to include the cost in the usage field
+                extra_body={"usage": {"include": True}},
+            )
+        except APITimeoutError as e:
+            left = deadline.remaining()
+            if left is not None and left <= 0:
+                raise DeadlineExceededError("Deadline exceeded waiting for OpenRouter") from e
+            raise
+    _record_usage(response, model, prompt)
+    if response.choices[0].finish_reason != "stop":
+        raise Exception(f"Status code: {response.choices[0].finish_reason}")
+    content = response.choices[0].message.content
+    if not content:
+        raise Exception("No content returned")
+    return content
+
+
+def get_domain_summary(
+    url: str,
+    character_max: int = 475,
+    model="mistralai/mistral-nemo:free",
+    vocabulary: list[str] | None = None,
+    chat: Callable[[str], str] | None = None,
+) -> Summary:
+    """
+    Get a summary of a website using the OpenRouter API.
+
+    Args:
+        url (str): The URL of the website to summarize.
+        vocabulary (list[str], optional): Existing tags the AI should prefer. Defaults to None.
+        chat (Callable[[str], str], optional): Sends the prompt and returns the reply, e.g. a model router. Defaults to ``query_chat`` with ``model``.
+
+    Returns:
+        Summary: A summary of the website content with a suggested title and tags.
+
+    Raises:
+        Exception: If there is an error with the API request.
+    """
+    prompt = prompts.DOMAIN_SUMMARY.render(
+        character_max=character_max,
+        vocabulary=prompts.vocabulary_rule(vocabulary),
+        url=url,
+    )
+    try:
+        if chat is None:
+            content = query_chat(prompt, model)
+        else:
+            content = chat(prompt)
 
         # lines = content.split("\n")
         # lines = lines[1:]
@@ -70,9 +137,7 @@ def get_domain_summary(
         tags = dd["tags"]
         # remove all empyty tags
         tags = [tag for tag in tags if tag]
-        dd["tags"] = tags
-        dd["url"] = url
-        return dd
+        return Summary(url=url, title=dd["title"], summary=dd["summary"], tags=tags)
 
     except Exception as e:
         logger.error("get_domain_summary() An error occurred: %s", e)
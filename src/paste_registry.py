@@ -0,0 +1,245 @@
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from .records import PasteResult
+from .paths import cache_path
+from .storage import SummaryStore
+from . import pastebin
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_FILE = "paste_registry.db"
+# Where the registry was kept before, imported once into the database.
+LEGACY_FILE = "paste_registry.json"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pastes (
+    key TEXT PRIMARY KEY,
+    store TEXT NOT NULL,
+    url TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pastes_store ON pastes (store);
+"""
+
+
+def content_hash(title: str, content: str) -> str:
+    """
+    Get the key a paste is registered under.
+
+    Line endings and trailing whitespace are normalized first, because Pastebin
+    returns ``\\r\\n`` line endings for content that was posted with ``\\n``.
+
+    Args:
+        title (str): The paste title.
+        content (str): The paste content.
+
+    Returns:
+        str: The SHA-256 hex digest of the title and content.
+    """
+    content = "\n".join(line.rstrip() for line in content.splitlines()).strip()
+    digest = hashlib.sha256()
+    digest.update(title.strip().encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(content.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PasteRegistry:
+    """
+    Local record of the pastes already created, keyed by store and content hash.
+
+    Re-running a job, or two jobs for the same video, reuse the existing paste
+    instead of spending Pastebin's paste quota on a copy. Entries are stored in
+    SQLite one row at a time, so processes running at the same time see each
+    other's pastes and do not overwrite each other's entries.
+    """
+
+    def __init__(self, path: Path | None = None) -> None:
+        """
+        Args:
+            path (Path, optional): The database file. Defaults to the cache file.
+        """
+        self.path = path or cache_path(REGISTRY_FILE)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._creating: dict[str, threading.Lock] = {}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM pastes").fetchone()[0]
+
+    def get(self, key: str) -> PasteResult | None:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM pastes WHERE key = ?", (key,)).fetchone()
+        return PasteResult.from_json(row[0]) if row else None
+
+    def put(self, paste: PasteResult, replace: bool = True) -> bool:
+        """
+        Register a paste.
+
+        Args:
+            paste (PasteResult): The paste.
+            replace (bool, optional): Replace an entry with the same key. Defaults to True.
+
+        Returns:
+            bool: ``True`` if the paste was stored.
+        """
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"{verb} INTO pastes (key, store, url, data) VALUES (?, ?, ?, ?)",
+                (paste.key, paste.store, paste.url, paste.to_json()),
+            )
+        return cursor.rowcount > 0
+
+    def pastes(self, store: str) -> list[PasteResult]:
+        """Get every registered paste of a store."""
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM pastes WHERE store = ?", (store,)).fetchall()
+        return [PasteResult.from_json(data) for (data,) in rows]
+
+    def remove(self, keys: list[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM pastes WHERE key = ?", [(k,) for k in keys])
+
+    def import_json(self, path: Path) -> int:
+        """
+        Add the entries of a registry file written by earlier versions.
+
+        Args:
+            path (Path): The JSON file.
+
+        Returns:
+            int: The number of entries added.
+        """
+        data = json.loads(path.read_text(encoding="utf-8"))
+        return sum(self.put(PasteResult.from_dict(p), replace=False) for p in data.values())
+
+    @classmethod
+    def load(cls, path: Path | None = None) -> PasteRegistry:
+        """
+        Open the registry, importing the JSON registry of earlier versions once.
+
+        Args:
+            path (Path, optional): The database file. Defaults to the cache file.
+
+        Returns:
+            PasteRegistry: The registry.
+        """
+        registry = cls(path)
+        legacy = registry.path.with_name(LEGACY_FILE)
+        if legacy.exists():
+            added = registry.import_json(legacy)
+            legacy.replace(legacy.with_suffix(".json.imported"))
+            logger.info("load() Imported %d pastes from %s", added, legacy)
+        return registry
+
+    def get_or_create(
+        self, title: str, content: str, store: SummaryStore | None = None
+    ) -> PasteResult:
+        """
+        Get the paste for this content, publishing it if it does not exist yet.
+
+        When Pastebin's filters only accept the content as a private paste, the
+        private paste is what later calls get back, so the rejected public attempt
+        is not repeated.
+
+        Args:
+            title (str): The paste title.
+            content (str): The paste content.
+            store (SummaryStore, optional): Where to publish. Defaults to ``storage.get_store()``.
+
+        Returns:
+            PasteResult: The existing or new paste.
+        """
+        store = store or storage.get_store()
+        digest = content_hash(title, content)
+        key = f"{store.name}:{digest}"
+        with self._lock:
+            creating = self._creating.setdefault(key, threading.Lock())
+        # Two jobs for the same content wait for each other instead of both pasting.
+        with creating:
+            existing = self.get(key)
+            if existing is not None:
+                logger.info("get_or_create() Reusing paste %s for %s", existing.url, title)
+                return existing
+            paste = store.publish(title, content, digest)
+            self.put(paste)
+        with self._lock:
+            self._creating.pop(key, None)
+        return paste
+
+    def reconcile(self, limit: int = 1000) -> tuple[int, int]:
+        """
+        Sync the registry with the pastes in the Pastebin account.
+
+        Pastes that are not registered yet are downloaded once and hashed. Entries
+        whose paste no longer exists (deleted or expired) are dropped. Only the
+        listing call is made when the registry is already up to date. Entries of
+        other stores are left alone.
+
+        Args:
+            limit (int, optional): The number of account pastes to check, at most 1000.
+                Defaults to 1000.
+
+        Returns:
+            tuple[int, int]: The number of entries added and removed.
+        """
+        pastes = pastebin.list_pastes(limit)
+        registered = self.pastes("pastebin")
+        known = {paste.url for paste in registered}
+        added = 0
+        for paste in pastes:
+            if paste.url in known:
+                continue
+            try:
+                paste.digest = content_hash(paste.title, pastebin.get_paste_text(paste.url))
+            except Exception as e:
+                logger.error("reconcile() Unable to read %s: %s", paste.url, e)
+                continue
+            added += self.put(paste, replace=False)
+        removed = 0
+        if len(pastes) < limit:
+            # The listing is complete, so anything missing from it is gone.
+            live = {paste.url for paste in pastes}
+            gone = [paste.key for paste in registered if paste.url not in live]
+            self.remove(gone)
+            removed = len(gone)
+        logger.info(
+            "reconcile() %d pastes in account, %d added, %d removed",
+            len(pastes),
+            added,
+            removed,
+        )
+        return added, removed
+
+
+_registry: PasteRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> PasteRegistry:
+    """
+    Get the shared paste registry, loading it from the cache on first use.
+
+    Returns:
+        PasteRegistry: The registry.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PasteRegistry.load()
+        return _registry
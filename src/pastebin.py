@@ -9,12 +9,38 @@ from .pb_enum import PastebinFormat
 from .pb_enum import PastebinExpire
 from .pb_enum import PastebinListing
 from .ex import PastbinError, PastebinFilterError
+from . import deadline
+from .records import PasteResult
 
 logger = logging.getLogger(__name__)
 
 PASTEBIN_API_KEY = os.getenv("PASTEBIN_API_KEY")
 PASTEBIN_USERNAME = os.getenv("PASTEBIN_USERNAME")
 PASTEBIN_PASSWORD = os.getenv("PASTEBIN_PASSWORD")
+REQUEST_TIMEOUT = 30
+
+
+class _Pastebin(Pastebin):
+    """Pastebin client that applies a timeout to every request."""
+
+    def __init__(self, api_dev_key: str | None, timeout: float = REQUEST_TIMEOUT):
+        super().__init__(api_dev_key)
+        self.timeout = timeout
+
+    def general_params(self):
+        params = super().general_params()
+        params["timeout"] = deadline.timeout(self.timeout)
+        return params
+
+
+def _login() -> _Pastebin:
+    client = _Pastebin(PASTEBIN_API_KEY)
+    client.api_user_key = PASTEBIN_API_KEY
+    # Authenticate with your Pastebin account
+    # This will set the api_user_key attribute within the pb object
+    user_id = client.authenticate(PASTEBIN_USERNAME, PASTEBIN_PASSWORD)
+    client.api_user_key = user_id
+    return client
 
 
 def create_paste(
@@ -36,14 +62,7 @@ def create_paste(
         str: The URL of the paste.
     """
     try:
-        client = Pastebin(PASTEBIN_API_KEY)
-        client.api_user_key = PASTEBIN_API_KEY
-        client.general_params
-        # 2. Authenticate with your Pastebin account
-        # This will set the api_user_key attribute within the pb object
-        user_id = client.authenticate(PASTEBIN_USERNAME, PASTEBIN_PASSWORD)
-        client.api_user_key = user_id
-
+        client = _login()
         paste = client.create_paste(
             api_paste_code=content,
             api_paste_private=int(listing),
@@ -66,3 +85,41 @@ def create_paste(
     except Exception as e:
         logger.error("create_paste() An error occurred: %s", e)
         raise e
+
+
+def list_pastes(limit: int = 1000) -> list[PasteResult]:
+    """List the pastes in the account.
+
+    Args:
+        limit (int, optional): The maximum number of pastes, at most 1000. Defaults to 1000.
+
+    Returns:
+        list[PasteResult]: The pastes, newest first.
+    """
+    client = _login()
+    pastes = client.get_user_pastes(api_results_limit=limit)
+    if isinstance(pastes, str):
+        # pbwrap returns a message instead of a list when the account is empty
+        return []
+    return [
+        PasteResult(
+            url=paste.url,
+            title=paste.title or "",
+            listing=int(paste.private or 0),
+            created=float(paste.date or 0),
+        )
+        for paste in pastes
+    ]
+
+
+def get_paste_text(url: str) -> str:
+    """Get the content of a paste in the account, including private pastes.
+
+    Args:
+        url (str): The paste URL.
+
+    Returns:
+        str: The paste content.
+    """
+    client = _login()
+    return client.get_user_raw_paste(url.rstrip("/").rsplit("/", 1)[-1])
@@ -0,0 +1,20 @@
+from __future__ import annotations
+import os
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+CACHE_DIR = Path(os.getenv("AI_PINBOARD_CACHE_DIR", PROJECT_ROOT / ".cache"))
+
+
+def cache_path(name: str) -> Path:
+    """
+    Get the path of a file in the local cache directory, creating the directory if needed.
+
+    Args:
+        name (str): The file name.
+
+    Returns:
+        Path: The full path to the cache file.
+    """
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    return CACHE_DIR / name
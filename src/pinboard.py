@@ -1,27 +1,70 @@
 from __future__ import annotations
 import os
+from datetime import datetime
 import pinboard
+from . import deadline
+from .records import PinboardPost
 
 # https://idlewords.com/pinboard_api2_draft.htm
 # https://pinboard.in/api/v2/overview/
 
 PINBOARD_API_KEY = os.getenv("PINBOARD_API_KEY")
+# The pinboard package does not take a timeout, so calls are wrapped in deadline.call_with_timeout.
+REQUEST_TIMEOUT = 30
+# posts/all returns the whole account in one response.
+POSTS_ALL_TIMEOUT = 300
 
 
-def add_link(url: str, description: str, extended: str, tags: list[str]):
+def add_link(
+    url: str,
+    description: str,
+    extended: str,
+    tags: list[str],
+    dt: datetime | None = None,
+    shared: bool = True,
+    toread: bool = False,
+):
     pb = pinboard.Pinboard(PINBOARD_API_KEY)
-    result = pb.posts.add(
+    params = {}
+    if dt is not None:
+        # Keeps the original creation time when an existing bookmark is replaced.
+        params["dt"] = dt
+    result = deadline.call_with_timeout(
+        pb.posts.add,
+        REQUEST_TIMEOUT,
         url=url,
         description=description,
         extended=extended,
         tags=tags,
-        shared=True,
-        toread=False,
+        shared=shared,
+        toread=toread,
+        **params,
     )
     return result
 
 
 def get_info(url: str):
     pb = pinboard.Pinboard(PINBOARD_API_KEY)
-    result = pb.posts.get(url=url)
+    result = deadline.call_with_timeout(pb.posts.get, REQUEST_TIMEOUT, url=url)
     return result
+
+
+def get_tags() -> dict[str, int]:
+    pb = pinboard.Pinboard(PINBOARD_API_KEY)
+    result = deadline.call_with_timeout(pb.tags.get, REQUEST_TIMEOUT)
+    return {tag.name: tag.count for tag in result}
+
+
+def get_all_posts() -> list[PinboardPost]:
+    """
+    Get every bookmark in the account.
+
+    Pinboard allows one ``posts/all`` call every five minutes, so callers should
+    keep the result instead of calling this repeatedly.
+
+    Returns:
+        list[PinboardPost]: The bookmarks, newest first.
+    """
+    pb = pinboard.Pinboard(PINBOARD_API_KEY)
+    result = deadline.call_with_timeout(pb.posts.all, POSTS_ALL_TIMEOUT)
+    return [PinboardPost.from_bookmark(bookmark) for bookmark in result]
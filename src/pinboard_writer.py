@@ -0,0 +1,287 @@
+from __future__ import annotations
+import itertools
+import logging
+import queue
+import threading
+import time
+import urllib.error
+from datetime import datetime
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from pinboard.exceptions import PinboardError
+from . import pinboard
+from . import deadline
+from . import scheduler
+from .ex import DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+# Pinboard allows one API call per user every three seconds.
+# https://pinboard.in/api/#limits
+WRITE_INTERVAL = 3.0
+ITEM_EXISTS = "item already exists"
+_THROTTLE_CODES = (429, 503)
+
+
+@dataclass
+class PinboardWrite:
+    url: str
+    description: str
+    extended: str
+    tags: list[str]
+    dt: datetime | None = None
+    shared: bool = True
+    toread: bool = False
+    priority: int = scheduler.NORMAL
+    # one per submit merged into this write
+    futures: list[Future] = field(default_factory=list)
+
+
+class PinboardWriter:
+    """
+    Single consumer queue that posts bookmarks to Pinboard at the allowed rate.
+
+    Jobs call :meth:`submit` and get a ``Future`` back, so they can carry on with
+    other work while the writer drains the queue one ``posts/add`` call every
+    ``interval`` seconds. Writes from interactive jobs are taken before queued
+    background writes. A write for a URL that is still queued replaces the queued
+    one, since ``posts/add`` replaces the bookmark anyway, and both submits get the
+    result. Throttled calls are retried with exponential backoff and
+    ``item already exists`` is treated as success.
+    """
+
+    def __init__(
+        self,
+        interval: float = WRITE_INTERVAL,
+        max_retries: int = 5,
+        max_queue: int = 0,
+    ) -> None:
+        """
+        Args:
+            interval (float, optional): Minimum seconds between API calls. Defaults to 3.0.
+            max_retries (int, optional): Retries for throttled calls. Defaults to 5.
+            max_queue (int, optional): Maximum pending writes, 0 is unbounded. Defaults to 0.
+        """
+        self.interval = interval
+        self.max_retries = max_retries
+        # (priority, order, write), the order keeps writes of equal priority first in first out
+        self._queue: queue.PriorityQueue[tuple[float, int, PinboardWrite | None]] = (
+            queue.PriorityQueue(max_queue)
+        )
+        self._order = itertools.count()
+        # Queued writes by URL, until the consumer takes them.
+        self._pending: dict[str, PinboardWrite] = {}
+        self._pending_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._last_call = 0.0
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> PinboardWriter:
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def start(self) -> None:
+        """Start the consumer thread if it is not already running."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="pinboard-writer", daemon=True
+                )
+                self._thread.start()
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Stop the consumer thread once all queued writes are done.
+
+        Args:
+            wait (bool, optional): Block until the queue is drained. Defaults to True.
+        """
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        # after every queued write, whatever its priority
+        self._queue.put((float("inf"), next(self._order), None))
+        if wait:
+            thread.join()
+
+    def submit(
+        self,
+        url: str,
+        description: str,
+        extended: str,
+        tags: list[str],
+        dt: datetime | None = None,
+        shared: bool = True,
+        toread: bool = False,
+    ) -> Future:
+        """
+        Queue a bookmark to be added, or replaced if the URL is already bookmarked.
+
+        Args:
+            url (str): The bookmark URL.
+            description (str): The bookmark title.
+            extended (str): The bookmark description.
+            tags (list[str]): The bookmark tags.
+            dt (datetime, optional): The creation time. Defaults to now.
+            shared (bool, optional): Make the bookmark public. Defaults to True.
+            toread (bool, optional): Mark the bookmark unread. Defaults to False.
+
+        Returns:
+            Future: Resolves to ``True`` once the bookmark is stored, or raises the API error.
+        """
+        self.start()
+        _, priority = scheduler.current()
+        future: Future = Future()
+        with self._pending_lock:
+            item = self._pending.get(url)
+            if item is None:
+                item = PinboardWrite(url, description, extended, tags, dt, shared, toread, priority)
+                self._pending[url] = item
+            else:
+                logger.info("PinboardWriter() Merged with the queued write for %s", url)
+                item.description = description
+                item.extended = extended
+                item.tags = tags
+                item.dt = dt
+                item.shared = shared
+                item.toread = toread
+                if priority >= item.priority:
+                    item.futures.append(future)
+                    return future
+                # queue it again at the higher priority, the consumer skips the older entry
+                item.priority = priority
+            item.futures.append(future)
+        self._queue.put((priority, next(self._order), item))
+        return future
+
+    def pending(self) -> int:
+        """Number of writes waiting in the queue."""
+        return self._queue.qsize()
+
+    def _wait_for_slot(self) -> None:
+        delay = self._last_call + self.interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._last_call = time.monotonic()
+
+    def _run(self) -> None:
+        while True:
+            _, _, item = self._queue.get()
+            if item is None:
+                break
+            with self._pending_lock:
+                if self._pending.get(item.url) is not item:
+                    continue  # taken already through an entry with a higher priority
+                del self._pending[item.url]
+            # submits whose callers gave up are dropped, the write only goes out for the others
+            futures = [f for f in item.futures if f.set_running_or_notify_cancel()]
+            if not futures:
+                logger.info("PinboardWriter() Skipped cancelled write for %s", item.url)
+                continue
+            try:
+                result = self._write(item)
+            except Exception as e:
+                logger.error("PinboardWriter() Failed to add %s: %s", item.url, e)
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future in futures:
+                    future.set_result(result)
+
+    def _write(self, item: PinboardWrite) -> bool:
+        attempt = 0
+        while True:
+            self._wait_for_slot()
+            try:
+                return pinboard.add_link(
+                    url=item.url,
+                    description=item.description,
+                    extended=item.extended,
+                    tags=item.tags,
+                    dt=item.dt,
+                    shared=item.shared,
+                    toread=item.toread,
+                )
+            except PinboardError as e:
+                if str(e) == ITEM_EXISTS:
+                    logger.info("PinboardWriter() Link already exists: %s", item.url)
+                    return True
+                raise
+            except urllib.error.HTTPError as e:
+                if e.code not in _THROTTLE_CODES or attempt >= self.max_retries:
+                    raise
+                reason = str(e.code)
+            except DeadlineExceededError:
+                # posts/add is idempotent, so a call that timed out can be retried
+                if attempt >= self.max_retries:
+                    raise
+                reason = "timeout"
+            attempt += 1
+            backoff = self.interval * 2**attempt
+            logger.warning(
+                "PinboardWriter() Throttled (%s), retry %d in %.0fs",
+                reason,
+                attempt,
+                backoff,
+            )
+            time.sleep(backoff)
+
+
+_default_writer: PinboardWriter | None = None
+
+
+def get_writer() -> PinboardWriter:
+    """
+    Get the shared writer used by the pipelines.
+
+    Returns:
+        PinboardWriter: The process wide writer.
+    """
+    global _default_writer
+    if _default_writer is None:
+        _default_writer = PinboardWriter()
+    return _default_writer
+
+
+def add_link(
+    url: str,
+    description: str,
+    extended: str,
+    tags: list[str],
+    dt: datetime | None = None,
+    shared: bool = True,
+    toread: bool = False,
+) -> bool:
+    """
+    Add a link through the shared writer and wait for the result.
+
+    Args:
+        url (str): The bookmark URL.
+        description (str): The bookmark title.
+        extended (str): The bookmark description.
+        tags (list[str]): The bookmark tags.
+        dt (datetime, optional): The creation time. Defaults to now.
+        shared (bool, optional): Make the bookmark public. Defaults to True.
+        toread (bool, optional): Mark the bookmark unread. Defaults to False.
+
+    Returns:
+        bool: ``True`` if the link was added or already existed.
+
+    Raises:
+        DeadlineExceededError: If the job's time budget runs out while waiting. The
+            write is withdrawn unless it was already being sent.
+    """
+    future = get_writer().submit(url, description, extended, tags, dt, shared, toread)
+    try:
+        return future.result(timeout=deadline.remaining())
+    except DeadlineExceededError:
+        future.cancel()
+        raise
+    except TimeoutError:
+        future.cancel()
+        raise DeadlineExceededError(f"Pinboard write for {url} did not finish in time")
@@ -0,0 +1,226 @@
+from __future__ import annotations
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable
+from . import deadline
+from . import log_config
+from . import scheduler
+from .records import Record
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    A pipeline step.
+
+    ``fn`` is called with the stage ``inputs`` as keyword arguments. With a single
+    output the return value is stored under that name. With several outputs ``fn``
+    must return a tuple in the same order.
+
+    Exceptions listed in ``degrade`` do not fail the run. The stage outputs are set
+    to ``None`` and downstream stages decide what to do without them.
+
+    A ``pure`` stage only computes its outputs from its inputs, without any I/O,
+    so it can be re-run offline by :meth:`Pipeline.replay`.
+    """
+
+    name: str
+    fn: Callable[..., Any]
+    inputs: tuple[str, ...] = ()
+    outputs: tuple[str, ...] = ()
+    degrade: tuple[type[BaseException], ...] = ()
+    memo: bool = False
+    pure: bool = False
+
+    def __post_init__(self) -> None:
+        if not self.outputs:
+            object.__setattr__(self, "outputs", (self.name,))
+
+
+def _key_default(value: Any) -> Any:
+    if isinstance(value, Record):
+        return value.to_dict()
+    return repr(value)
+
+
+class Memo:
+    """Thread safe LRU cache of stage results."""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(stage: Stage, kwargs: dict[str, Any]) -> str:
+        return stage.name + ":" + json.dumps(kwargs, sort_keys=True, default=_key_default)
+
+    def get(self, key: str) -> tuple | None:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: tuple) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+@dataclass
+class Pipeline:
+    """
+    A set of stages wired together by their input and output names.
+
+    Stages run as soon as all their inputs are available, so independent stages
+    (e.g. fetching metadata and summarizing) run at the same time.
+    """
+
+    name: str
+    stages: list[Stage]
+    memo: Memo = field(default_factory=Memo)
+    max_workers: int = 4
+
+    def __post_init__(self) -> None:
+        produced: dict[str, str] = {}
+        for stage in self.stages:
+            for output in stage.outputs:
+                if output in produced:
+                    raise ValueError(
+                        f"{output} is produced by both {produced[output]} and {stage.name}"
+                    )
+                produced[output] = stage.name
+        self._produced = produced
+
+    def required_inputs(self) -> set[str]:
+        """
+        Get the values that must be passed to :meth:`run`.
+
+        Returns:
+            set[str]: Input names that no stage produces.
+        """
+        needed = {i for stage in self.stages for i in stage.inputs}
+        return needed - self._produced.keys()
+
+    def extend(self, name: str, stages: Iterable[Stage]) -> Pipeline:
+        """
+        Create a new pipeline with extra stages, replacing stages of the same name.
+
+        Args:
+            name (str): The new pipeline name.
+            stages (Iterable[Stage]): The stages to add or replace.
+
+        Returns:
+            Pipeline: The new pipeline. It shares this pipeline's memo.
+        """
+        extra = {s.name: s for s in stages}
+        merged = [extra.pop(s.name, s) for s in self.stages] + list(extra.values())
+        return Pipeline(name, merged, self.memo, self.max_workers)
+
+    def _run_stage(self, stage: Stage, kwargs: dict[str, Any]) -> tuple:
+        key = Memo.key(stage, kwargs) if stage.memo else ""
+        if key:
+            cached = self.memo.get(key)
+            if cached is not None:
+                logger.info("Pipeline %s: %s from cache", self.name, stage.name)
+                return cached
+        scheduler.checkpoint(stage.name)
+        with log_config.stage(stage.name, logger), deadline.budget(
+            deadline.STAGE_BUDGETS.get(stage.name), stage.name
+        ):
+            try:
+                result = stage.fn(**kwargs)
+            except stage.degrade as e:
+                logger.warning(
+                    "Pipeline %s: %s failed, continuing without it: %s",
+                    self.name,
+                    stage.name,
+                    e,
+                )
+                return tuple(None for _ in stage.outputs)
+        values = result if len(stage.outputs) > 1 else (result,)
+        if key:
+            self.memo.put(key, values)
+        return values
+
+    def run(self, **inputs: Any) -> dict[str, Any]:
+        """
+        Run all stages.
+
+        Args:
+            **inputs: Values for :meth:`required_inputs`.
+
+        Returns:
+            dict[str, Any]: The inputs together with every stage output.
+
+        Raises:
+            ValueError: If a required input is missing.
+            Exception: The first stage error that is not in the stage's ``degrade``.
+        """
+        missing = self.required_inputs() - inputs.keys()
+        if missing:
+            raise ValueError(f"Pipeline {self.name} is missing inputs: {sorted(missing)}")
+        values = dict(inputs)
+        waiting = list(self.stages)
+        running: dict[Future, Stage] = {}
+        executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix=self.name)
+        try:
+            while waiting or running:
+                for stage in [s for s in waiting if all(i in values for i in s.inputs)]:
+                    waiting.remove(stage)
+                    kwargs = {i: values[i] for i in stage.inputs}
+                    run = deadline.bind(self._run_stage)
+                    running[executor.submit(run, stage, kwargs)] = stage
+                if not running:
+                    names = [s.name for s in waiting]
+                    raise ValueError(f"Pipeline {self.name} cannot schedule {names}")
+                done, _ = wait(running, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+                if not done:
+                    deadline.check(self.name)
+                for future in done:
+                    stage = running.pop(future)
+                    values.update(zip(stage.outputs, future.result()))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return values
+
+    def replay(self, recorded: dict[str, Any]) -> dict[str, Any]:
+        """
+        Re-run the pure stages over the values of an earlier run.
+
+        Stages that are not pure are not called. Their outputs are taken from
+        ``recorded``, so no network or AI calls are made. Pure stages whose inputs
+        are not in the recording (e.g. stages added since) are skipped.
+
+        Args:
+            recorded (dict[str, Any]): The values returned by an earlier :meth:`run`.
+
+        Returns:
+            dict[str, Any]: The recorded values with the pure stage outputs recomputed.
+        """
+        values = {k: v for k, v in recorded.items() if k in self.required_inputs()}
+        for stage in self.stages:
+            if not stage.pure:
+                values.update((o, recorded[o]) for o in stage.outputs if o in recorded)
+        waiting = [s for s in self.stages if s.pure]
+        ready = [s for s in waiting if all(i in values for i in s.inputs)]
+        while ready:
+            for stage in ready:
+                waiting.remove(stage)
+                try:
+                    result = stage.fn(**{i: values[i] for i in stage.inputs})
+                    outputs = result if len(stage.outputs) > 1 else (result,)
+                except stage.degrade:
+                    outputs = tuple(None for _ in stage.outputs)
+                values.update(zip(stage.outputs, outputs))
+            ready = [s for s in waiting if all(i in values for i in s.inputs)]
+        return values
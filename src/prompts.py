@@ -0,0 +1,216 @@
+from __future__ import annotations
+import functools
+import hashlib
+import logging
+import os
+import re
+import string
+import time
+from datetime import datetime, timezone
+from .text_edit import WEB_UTC_DATETIME
+
+logger = logging.getLogger(__name__)
+
+# Token budget for a whole prompt. Longer content is trimmed before the prompt is sent.
+MAX_PROMPT_TOKENS = int(os.getenv("MAX_PROMPT_TOKENS", "12000"))
+
+# Roughly how BPE tokenizers split English text: short word pieces and single symbols.
+_TOKEN = re.compile(r"\w{1,4}|[^\w\s]")
+
+# Identical for every prompt and placed first, so providers that cache prompt
+# prefixes (DeepSeek, OpenAI, Anthropic via OpenRouter) can reuse it.
+PREFIX = """You are working as part of an AI system, so no chit chat and no explaning what you're are doing an why.
+DO NOT start with "OKAY", or "Alright", or "Sure", or "Yes", or "OK", or any preambles. Just the outupt please.
+
+"""
+
+VOCABULARY_RULE = "- Prefer tags from the following list of existing tags and only create a new tag when none fit: {tags}\n"
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a text.
+
+    The estimate splits words into pieces of up to four characters and counts
+    each symbol, which is close to (and slightly above) what the models'
+    tokenizers report for English prose.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The estimated token count.
+    """
+    return sum(1 for _ in _TOKEN.finditer(text))
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Shorten a text to about ``max_tokens`` tokens, ending at a paragraph or sentence.
+
+    Args:
+        text (str): The text.
+        max_tokens (int): The token budget.
+
+    Returns:
+        str: The text, or its start followed by ``[...]`` if it was too long.
+    """
+    if max_tokens <= 0:
+        return ""
+    for i, match in enumerate(_TOKEN.finditer(text)):
+        if i == max_tokens:
+            cut = match.start()
+            break
+    else:
+        return text
+    head = text[:cut]
+    # Prefer a clean break as long as it keeps most of the budget.
+    for sep in ("\n\n", "\n", ". "):
+        pos = head.rfind(sep)
+        if pos > cut * 0.8:
+            head = head[: pos + len(sep.rstrip(" "))]
+            break
+    return head.rstrip() + "\n[...]"
+
+
+@functools.lru_cache(maxsize=1)
+def _format_minute(minute: int) -> str:
+    return datetime.fromtimestamp(minute * 60, timezone.utc).strftime(WEB_UTC_DATETIME)
+
+
+def current_date() -> str:
+    """
+    Get the current UTC date and time to the minute, formatted for prompts.
+
+    The string is formatted once per minute, and every prompt rendered within
+    the same minute gets an identical date line.
+
+    Returns:
+        str: e.g. ``Mon, Jul 07, 2025 at 14:05 UTC``.
+    """
+    return _format_minute(int(time.time() // 60))
+
+
+class PromptTemplate:
+    """
+    A prompt with ``{name}`` placeholders, parsed once when it is defined.
+
+    ``{date}`` is filled in with :func:`current_date` unless given. The ``trim``
+    placeholder, usually the content, is shortened when the rendered prompt would
+    go over its token budget.
+    """
+
+    def __init__(self, name: str, text: str, trim: str = "") -> None:
+        """
+        Args:
+            name (str): The template name used in logs.
+            text (str): The template text.
+            trim (str, optional): The placeholder that may be shortened to fit the budget.
+        """
+        self.name = name
+        self.text = text
+        self.trim = trim
+        # Changes whenever the template text changes, so logged token counts can be
+        # compared between prompt versions.
+        self.version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]
+        self._parts = [
+            (literal, field) for literal, field, _, _ in string.Formatter().parse(text)
+        ]
+        self.fields = tuple(field for _, field in self._parts if field)
+        self._overhead = count_tokens("".join(literal for literal, _ in self._parts))
+
+    @property
+    def prefix(self) -> str:
+        """The text before the first placeholder, identical in every rendered prompt."""
+        return self._parts[0][0] if self._parts else ""
+
+    def _join(self, values: dict[str, str]) -> str:
+        return "".join(literal + (values[field] if field else "") for literal, field in self._parts)
+
+    def render(self, max_tokens: int | None = MAX_PROMPT_TOKENS, **values: object) -> str:
+        """
+        Fill in the placeholders.
+
+        Args:
+            max_tokens (int | None, optional): Token budget for the whole prompt. ``None``
+                disables trimming. Defaults to ``MAX_PROMPT_TOKENS``.
+            **values: A value for each placeholder.
+
+        Returns:
+            str: The prompt.
+
+        Raises:
+            KeyError: If a placeholder has no value.
+        """
+        strings = {"date": current_date()} if "date" in self.fields else {}
+        strings.update((k, str(v)) for k, v in values.items())
+        tokens = self._overhead + sum(count_tokens(strings[f]) for f in self.fields)
+        if max_tokens is not None and self.trim and tokens > max_tokens:
+            content = strings[self.trim]
+            budget = count_tokens(content) - (tokens - max_tokens)
+            strings[self.trim] = trim_to_tokens(content, budget)
+            logger.info(
+                "Prompt %s trimmed from %d to about %d tokens", self.name, tokens, max_tokens
+            )
+            tokens = max_tokens
+        logger.debug("Prompt %s v%s: %d tokens", self.name, self.version, tokens)
+        return self._join(strings)
+
+
+def vocabulary_rule(vocabulary: list[str] | None) -> str:
+    """
+    Get the prompt rule that asks the AI to reuse existing tags.
+
+    Args:
+        vocabulary (list[str] | None): The existing tags.
+
+    Returns:
+        str: The prompt rule, or an empty string if there is no vocabulary.
+    """
+    if not vocabulary:
+        return ""
+    return VOCABULARY_RULE.format(tags=", ".join(vocabulary))
+
+
+# The static instructions come first and the values that change between calls
+# last, ordered from the least to the most often changing, so the shared prefix
+# is as long as possible.
+TAGS = PromptTemplate(
+    "tags",
+    PREFIX
+    + """Generate tags that are a appropriate
+
+Rules for generation
+- Max of 8 tags
+- Tags must be in CamelCase
+- Return tags in Json format as a list with the key of `tags`
+{vocabulary}
+Today is {date}
+
+Below is the text to use for tag generation:
+
+
+{content}""",
+    trim="content",
+)
+
+DOMAIN_SUMMARY = PromptTemplate(
+    "domain_summary",
+    PREFIX
+    + """Analyze the website given below and generate a title, a concise summary, and relevant tags.
+
+**Generation Rules:**
+* The summary must be in Markdown format.
+* Provide a maximum of 10 tags.
+* The summary must be {character_max} characters or less.
+* Tags must be in `CamelCase` format (e.g., `DatabaseAsAService`, `ScalableCloud`).
+* The output must be a JSON object with the following keys:
+    * `title`: (string) The suggested title for the website.
+    * `summary`: (string) The Markdown-formatted summary.
+    * `tags`: (array of strings) A list of `CamelCase` tags.
+{vocabulary}
+Today is {date}
+
+Website: `{url}`
+""",
+)
@@ -0,0 +1,254 @@
+from __future__ import annotations
+import json
+import time
+from dataclasses import dataclass, field, fields
+from types import UnionType
+from typing import Any, Self, Union, get_args, get_origin, get_type_hints
+
+YOUTUBE_URL_PREFIXES = (
+    "https://youtu.be/",
+    "https://www.youtube.com/watch?v=",
+    "https://youtube.com/shorts/",
+    "https://www.youtube.com/shorts/",
+)
+
+
+class Record:
+    """
+    Mixin for the slotted record dataclasses.
+
+    Serialization reads the fields directly instead of using ``dataclasses.asdict``,
+    which deep copies every value, and writes compact JSON. Fields holding another
+    record, or a list of records, are converted too.
+    """
+
+    __slots__ = ()
+    _field_names: tuple[str, ...] = ()
+    _nested_fields: dict[str, tuple[type[Record], bool]] | None = None
+
+    @classmethod
+    def field_names(cls) -> tuple[str, ...]:
+        if not cls.__dict__.get("_field_names"):
+            cls._field_names = tuple(f.name for f in fields(cls))  # type: ignore[arg-type]
+        return cls._field_names
+
+    @classmethod
+    def nested_fields(cls) -> dict[str, tuple[type[Record], bool]]:
+        """Fields typed as a record, mapped to the record class and whether they hold a list."""
+        if cls.__dict__.get("_nested_fields") is None:
+            hints = get_type_hints(cls)
+            nested = {name: _record_type(hints[name]) for name in cls.field_names()}
+            cls._nested_fields = {name: (r, many) for name, (r, many) in nested.items() if r}
+        return cls._nested_fields  # type: ignore[return-value]
+
+    def to_dict(self) -> dict[str, Any]:
+        return {name: _dump(getattr(self, name)) for name in self.field_names()}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> Self:
+        """
+        Create a record from a dictionary, ignoring unknown keys.
+
+        Args:
+            data (dict[str, Any]): The values.
+
+        Returns:
+            Self: The record.
+        """
+        names = cls.field_names()
+        values = {k: v for k, v in data.items() if k in names}
+        for name, (record, many) in cls.nested_fields().items():
+            value = values.get(name)
+            if many and isinstance(value, list):
+                values[name] = [record.from_dict(v) if isinstance(v, dict) else v for v in value]
+            elif isinstance(value, dict):
+                values[name] = record.from_dict(value)
+        return cls(**values)
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, text: str | bytes) -> Self:
+        return cls.from_dict(json.loads(text))
+
+
+def _dump(value: Any) -> Any:
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_dump(v) for v in value]
+    return value
+
+
+def _record_type(hint: Any) -> tuple[type[Record] | None, bool]:
+    # The record class in a field type such as ``Post | None`` or ``list[Post]``.
+    origin = get_origin(hint)
+    if origin is list:
+        return _record_type(get_args(hint)[0])[0], True
+    if origin is Union or origin is UnionType:
+        for arg in get_args(hint):
+            record, many = _record_type(arg)
+            if record is not None:
+                return record, many
+        return None, False
+    if isinstance(hint, type) and issubclass(hint, Record):
+        return hint, False
+    return None, False
+
+
+@dataclass(slots=True)
+class VideoInfo(Record):
+    """The parts of the yt-dlp info dict the pipeline uses."""
+
+    url: str
+    id: str = ""
+    title: str = ""
+    duration: int = 0
+    channel: str = ""
+    upload_date: str = ""
+    description: str = ""
+    tags: list[str] = field(default_factory=list)
+
+    @classmethod
+    def from_info(cls, url: str, info: dict[str, Any]) -> VideoInfo:
+        """
+        Copy the used fields out of a yt-dlp info dict.
+
+        Args:
+            url (str): The URL the info was extracted from.
+            info (dict[str, Any]): The yt-dlp info dict.
+
+        Returns:
+            VideoInfo: The video info.
+        """
+        return cls(
+            url=url,
+            id=info.get("id") or "",
+            title=info.get("title") or "",
+            duration=int(info.get("duration") or 0),
+            channel=info.get("channel") or info.get("uploader") or "",
+            upload_date=info.get("upload_date") or "",
+            description=info.get("description") or "",
+            tags=list(info.get("tags") or []),
+        )
+
+
+@dataclass(slots=True)
+class Summary(Record):
+    """An AI generated summary of a web page or video."""
+
+    url: str
+    title: str = ""
+    summary: str = ""
+    tags: list[str] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class PinboardPost(Record):
+    """An existing Pinboard bookmark."""
+
+    url: str
+    description: str = ""
+    extended: str = ""
+    tags: list[str] = field(default_factory=list)
+    time: str = ""  # ISO 8601, UTC
+    shared: bool = True
+    toread: bool = False
+
+    @classmethod
+    def from_bookmark(cls, bookmark: Any) -> PinboardPost:
+        """
+        Copy a bookmark returned by the pinboard package.
+
+        Args:
+            bookmark (pinboard.Bookmark): The bookmark.
+
+        Returns:
+            PinboardPost: The post.
+        """
+        return cls(
+            url=bookmark.url,
+            description=bookmark.description,
+            extended=bookmark.extended,
+            tags=[tag for tag in bookmark.tags if tag],
+            time=bookmark.time.isoformat(),
+            shared=bookmark.shared,
+            toread=bookmark.toread,
+        )
+
+
+@dataclass(slots=True)
+class BookmarkJob(Record):
+    """A URL to summarize and bookmark."""
+
+    url: str
+    tags: list[str] = field(default_factory=list)
+    job_id: str = ""
+    # Set when the job updates an existing bookmark instead of adding a new one.
+    post: PinboardPost | None = None
+    # Where the job came from, a key of scheduler.SOURCE_PRIORITIES.
+    source: str = ""
+
+    @property
+    def kind(self) -> str:
+        if self.url.startswith(YOUTUBE_URL_PREFIXES):
+            return "youtube"
+        return "web"
+
+
+@dataclass(slots=True)
+class PasteResult(Record):
+    """A long summary published as a paste or a page of the local site."""
+
+    url: str
+    title: str = ""
+    listing: int = 0
+    created: float = field(default_factory=time.time)
+    digest: str = ""
+    store: str = "pastebin"
+
+    @property
+    def key(self) -> str:
+        return f"{self.store}:{self.digest}"
+
+
+@dataclass(slots=True)
+class IndexedSummary(Record):
+    """A processed bookmark as stored in the local search index."""
+
+    url: str
+    kind: str = ""
+    title: str = ""
+    tags: list[str] = field(default_factory=list)
+    short_summary: str = ""
+    summary: str = ""
+    link: str = ""
+    updated: float = field(default_factory=time.time)
+
+
+@dataclass(slots=True)
+class SearchHit(Record):
+    """A search result."""
+
+    url: str
+    title: str = ""
+    tags: list[str] = field(default_factory=list)
+    link: str = ""
+    snippet: str = ""
+    score: float = 0.0
+
+
+@dataclass(slots=True)
+class Usage(Record):
+    """What one AI request cost."""
+
+    provider: str
+    model: str = ""
+    feature: str = ""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # In the provider's unit: 1min.ai credits, OpenRouter credits (US dollars).
+    credits: float = 0.0
+    # The provider did not report the cost, it was worked out from the token counts.
+    estimated: bool = False
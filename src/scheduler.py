@@ -0,0 +1,212 @@
+from __future__ import annotations
+import contextvars
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+from . import deadline
+from .paths import cache_path
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first.
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+
+# Where jobs come from. Someone is waiting for interactive jobs.
+SOURCE_PRIORITIES: dict[str, int] = {
+    "cli": INTERACTIVE,
+    "bookmarklet": INTERACTIVE,
+    "batch": NORMAL,
+    "subscription": NORMAL,
+    "backfill": BACKGROUND,
+}
+
+LEASE_DIR = "interactive"
+# A lease older than this belongs to a process that died without removing it.
+LEASE_TTL = deadline.JOB_TIMEOUT
+# Longest a background job waits at one stage boundary for interactive work to finish.
+MAX_PAUSE = float(os.getenv("SCHEDULER_MAX_PAUSE", "120"))
+POLL_INTERVAL = 0.5
+
+# Work outside any job, such as a replay or a one off call, is treated as interactive.
+_SOURCE: contextvars.ContextVar[tuple[str, int]] = contextvars.ContextVar(
+    "source", default=("cli", INTERACTIVE)
+)
+_seq = itertools.count()
+
+
+@dataclass(slots=True)
+class Ticket:
+    """A place in a :class:`FairQueue`."""
+
+    priority: int
+    source: str
+    seq: int
+
+
+def current() -> tuple[str, int]:
+    """Get the source and priority of the job running in the current context."""
+    return _SOURCE.get()
+
+
+def ticket() -> Ticket:
+    """Create a ticket for the job running in the current context."""
+    source, priority = _SOURCE.get()
+    return Ticket(priority, source, next(_seq))
+
+
+class FairQueue:
+    """
+    Waiting tickets for a limited resource, such as provider request slots.
+
+    The next ticket is the one with the best priority. Among equal priorities the
+    source with the fewest running tickets goes first, so a large backfill does
+    not crowd out a subscription run, and then the oldest ticket.
+
+    Not thread safe. The owner calls it under its own lock.
+    """
+
+    def __init__(self) -> None:
+        self.waiting: list[Ticket] = []
+        self.running: Counter[str] = Counter()
+
+    def __len__(self) -> int:
+        return len(self.waiting)
+
+    def join(self) -> Ticket:
+        item = ticket()
+        self.waiting.append(item)
+        return item
+
+    def is_next(self, item: Ticket) -> bool:
+        best = min(self.waiting, key=lambda t: (t.priority, self.running[t.source], t.seq))
+        return best is item
+
+    def start(self, item: Ticket) -> None:
+        self.waiting.remove(item)
+        self.running[item.source] += 1
+
+    def leave(self, item: Ticket) -> None:
+        self.waiting.remove(item)
+
+    def finish(self, item: Ticket) -> None:
+        self.running[item.source] -= 1
+
+
+# region Interactive leases
+
+
+def _lease_dir() -> Path:
+    path = cache_path(LEASE_DIR)
+    path.mkdir(exist_ok=True)
+    return path
+
+
+_active = (0.0, False)
+_active_lock = threading.Lock()
+
+
+def interactive_active() -> bool:
+    """
+    Check whether an interactive job is running in any process.
+
+    The answer is reused for ``POLL_INTERVAL`` seconds, so many background jobs
+    reaching a stage boundary together look at the lease directory once.
+
+    Returns:
+        bool: ``True`` while an interactive job holds a lease.
+    """
+    global _active
+    with _active_lock:
+        checked, active = _active
+        now = time.monotonic()
+        if now - checked < POLL_INTERVAL:
+            return active
+        active = False
+        cutoff = time.time() - LEASE_TTL
+        for entry in os.scandir(_lease_dir()):
+            try:
+                if entry.stat().st_mtime >= cutoff:
+                    active = True
+                    break
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue  # removed by its owner meanwhile
+        _active = (now, active)
+        return active
+
+
+@contextmanager
+def _lease() -> Iterator[None]:
+    path = _lease_dir() / f"{os.getpid()}-{uuid.uuid4().hex[:8]}.lease"
+    path.touch()
+    try:
+        yield
+    finally:
+        path.unlink(missing_ok=True)
+
+
+# endregion Interactive leases
+
+
+@contextmanager
+def job(source: str) -> Iterator[None]:
+    """
+    Run the block as a job from ``source``.
+
+    Provider request slots and Pinboard writes go to higher priority jobs first.
+    An interactive job also holds a lease that makes background jobs, in this and
+    in other processes, pause at their next stage boundary until it is done.
+
+    Args:
+        source (str): A key of ``SOURCE_PRIORITIES``. Unknown sources get ``NORMAL``.
+    """
+    priority = SOURCE_PRIORITIES.get(source, NORMAL)
+    token = _SOURCE.set((source, priority))
+    try:
+        if priority == INTERACTIVE:
+            with _lease():
+                yield
+        else:
+            yield
+    finally:
+        _SOURCE.reset(token)
+
+
+def checkpoint(name: str = "") -> None:
+    """
+    Let interactive work go first before a background job starts its next stage.
+
+    Interactive jobs return at once. Other jobs wait while an interactive job is
+    running, for at most ``MAX_PAUSE`` seconds or half of their remaining budget.
+
+    Args:
+        name (str, optional): The stage about to start, used in logs.
+    """
+    source, priority = _SOURCE.get()
+    if priority == INTERACTIVE or not interactive_active():
+        return
+    limit = MAX_PAUSE
+    left = deadline.remaining()
+    if left is not None:
+        limit = min(limit, left / 2)
+    start = time.monotonic()
+    while time.monotonic() - start < limit:
+        time.sleep(POLL_INTERVAL)
+        if not interactive_active():
+            break
+    logger.info(
+        "checkpoint() %s job paused %.1fs before %s for interactive work",
+        source,
+        time.monotonic() - start,
+        name or "next stage",
+    )
@@ -0,0 +1,295 @@
+from __future__ import annotations
+import logging
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from .records import IndexedSummary, SearchHit
+from .paths import cache_path
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "summaries.db"
+
+# Titles sharing at least this share of their words are reported as near duplicates.
+SIMILAR_TITLE_THRESHOLD = 0.8
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    url TEXT NOT NULL,
+    kind TEXT NOT NULL DEFAULT '',
+    title TEXT NOT NULL DEFAULT '',
+    tags TEXT NOT NULL DEFAULT '',
+    short_summary TEXT NOT NULL DEFAULT '',
+    summary TEXT NOT NULL DEFAULT '',
+    link TEXT NOT NULL DEFAULT '',
+    updated REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS summaries_fts USING fts5(
+    title, url, tags, short_summary, summary,
+    content='summaries', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS summaries_ai AFTER INSERT ON summaries BEGIN
+    INSERT INTO summaries_fts(rowid, title, url, tags, short_summary, summary)
+    VALUES (new.id, new.title, new.url, new.tags, new.short_summary, new.summary);
+END;
+CREATE TRIGGER IF NOT EXISTS summaries_ad AFTER DELETE ON summaries BEGIN
+    INSERT INTO summaries_fts(summaries_fts, rowid, title, url, tags, short_summary, summary)
+    VALUES ('delete', old.id, old.title, old.url, old.tags, old.short_summary, old.summary);
+END;
+CREATE TRIGGER IF NOT EXISTS summaries_au AFTER UPDATE ON summaries BEGIN
+    INSERT INTO summaries_fts(summaries_fts, rowid, title, url, tags, short_summary, summary)
+    VALUES ('delete', old.id, old.title, old.url, old.tags, old.short_summary, old.summary);
+    INSERT INTO summaries_fts(rowid, title, url, tags, short_summary, summary)
+    VALUES (new.id, new.title, new.url, new.tags, new.short_summary, new.summary);
+END;
+"""
+
+_COLUMNS = ("url", "kind", "title", "tags", "short_summary", "summary", "link", "updated")
+_SELECT = ", ".join(f"s.{column}" for column in _COLUMNS)
+
+_WORD = re.compile(r"\w+")
+_YOUTUBE_ID = re.compile(
+    r"(?:youtu\.be/|youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/))([\w-]{11})"
+)
+
+
+def canonical_url(url: str) -> str:
+    """
+    Get the key used to recognize the same page behind different URLs.
+
+    YouTube URLs become ``youtube:<video id>``. Other URLs are lower cased up to
+    the path, and lose ``www.``, the fragment, tracking parameters and any
+    trailing slash.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        str: The canonical key.
+    """
+    url = url.strip()
+    match = _YOUTUBE_ID.search(url)
+    if match:
+        return f"youtube:{match.group(1)}"
+    parts = urlsplit(url)
+    host = parts.netloc.lower().removeprefix("www.")
+    query = [
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.startswith("utm_") and k not in ("fbclid", "gclid")
+    ]
+    path = parts.path.rstrip("/")
+    return urlunsplit((parts.scheme.lower(), host, path, urlencode(sorted(query)), ""))
+
+
+def _words(text: str) -> set[str]:
+    return {w for w in _WORD.findall(text.casefold()) if len(w) > 1}
+
+
+def _quote(text: str) -> str:
+    """Turn free text into an FTS5 query that matches all of its words."""
+    return " ".join('"' + w.replace('"', '""') + '"' for w in _WORD.findall(text))
+
+
+def _row_to_entry(row: tuple) -> IndexedSummary:
+    url, kind, title, tags, short_summary, summary, link, updated = row
+    return IndexedSummary(
+        url=url,
+        kind=kind,
+        title=title,
+        tags=tags.split(),
+        short_summary=short_summary,
+        summary=summary,
+        link=link,
+        updated=updated,
+    )
+
+
+class SummaryIndex:
+    """
+    SQLite FTS5 index over every processed bookmark.
+
+    Title, URL, tags and both summaries are searchable. Entries are keyed by
+    :func:`canonical_url`, so processing a page again replaces its entry.
+    """
+
+    def __init__(self, path: Path | None = None) -> None:
+        """
+        Args:
+            path (Path, optional): The database file. Defaults to the cache file.
+        """
+        self.path = path or cache_path(INDEX_FILE)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM summaries").fetchone()[0]
+
+    def add(self, entry: IndexedSummary) -> None:
+        """
+        Add or replace the entry for a URL.
+
+        Args:
+            entry (IndexedSummary): The entry.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"""
+                INSERT INTO summaries (key, {", ".join(_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    url = excluded.url, kind = excluded.kind, title = excluded.title,
+                    tags = excluded.tags, short_summary = excluded.short_summary,
+                    summary = excluded.summary, link = excluded.link, updated = excluded.updated
+                """,
+                (
+                    canonical_url(entry.url),
+                    entry.url,
+                    entry.kind,
+                    entry.title,
+                    " ".join(entry.tags),
+                    entry.short_summary,
+                    entry.summary,
+                    entry.link,
+                    entry.updated,
+                ),
+            )
+        logger.debug("add() Indexed %s", entry.url)
+
+    def get(self, url: str) -> IndexedSummary | None:
+        """
+        Find the entry for a URL, in any of its forms.
+
+        Args:
+            url (str): The URL.
+
+        Returns:
+            IndexedSummary | None: The entry or ``None`` if the URL was not processed yet.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_SELECT} FROM summaries s WHERE s.key = ?", (canonical_url(url),)
+            ).fetchone()
+        return _row_to_entry(row) if row else None
+
+    def search(self, query: str, limit: int = 20) -> list[SearchHit]:
+        """
+        Search the index, best matches first.
+
+        ``query`` uses FTS5 syntax (``AND``, ``OR``, ``NOT``, ``"phrases"``, ``prefix*``,
+        ``title:word``). When it is not valid FTS5 syntax it is searched as plain words.
+        Title and tag matches rank above summary matches.
+
+        Args:
+            query (str): The search query.
+            limit (int, optional): The maximum number of hits. Defaults to 20.
+
+        Returns:
+            list[SearchHit]: The hits.
+        """
+        sql = """
+            SELECT s.url, s.title, s.tags, s.link,
+                   snippet(summaries_fts, -1, '[', ']', '...', 12),
+                   bm25(summaries_fts, 10.0, 2.0, 5.0, 2.0, 1.0) AS rank
+            FROM summaries_fts JOIN summaries s ON s.id = summaries_fts.rowid
+            WHERE summaries_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        """
+        with self._lock:
+            try:
+                rows = self._conn.execute(sql, (query, limit)).fetchall()
+            except sqlite3.OperationalError:
+                quoted = _quote(query)
+                if not quoted:
+                    return []
+                rows = self._conn.execute(sql, (quoted, limit)).fetchall()
+        return [
+            SearchHit(
+                url=url,
+                title=title,
+                tags=tags.split(),
+                link=link,
+                snippet=snippet,
+                score=-rank,
+            )
+            for url, title, tags, link, snippet, rank in rows
+        ]
+
+    def similar(
+        self,
+        title: str,
+        url: str = "",
+        threshold: float = SIMILAR_TITLE_THRESHOLD,
+        limit: int = 5,
+    ) -> list[IndexedSummary]:
+        """
+        Find entries whose title shares most of its words with ``title``.
+
+        Catches the same content under another URL, such as a re-upload of a video.
+
+        Args:
+            title (str): The title to compare.
+            url (str, optional): A URL to leave out of the results, usually the page being processed.
+            threshold (float, optional): The minimum Jaccard similarity of the title words.
+                Defaults to ``SIMILAR_TITLE_THRESHOLD``.
+            limit (int, optional): The maximum number of entries. Defaults to 5.
+
+        Returns:
+            list[IndexedSummary]: The similar entries, most similar first.
+        """
+        words = _words(title)
+        if not words:
+            return []
+        query = "title : (" + " OR ".join(f'"{w}"' for w in sorted(words)) + ")"
+        skip = canonical_url(url) if url else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT s.key, {_SELECT}
+                FROM summaries_fts JOIN summaries s ON s.id = summaries_fts.rowid
+                WHERE summaries_fts MATCH ?
+                ORDER BY bm25(summaries_fts)
+                LIMIT 50
+                """,
+                (query,),
+            ).fetchall()
+        scored = []
+        for key, *row in rows:
+            if key == skip:
+                continue
+            other = _words(row[2])
+            score = len(words & other) / len(words | other)
+            if score >= threshold:
+                scored.append((score, _row_to_entry(tuple(row))))
+        scored.sort(key=lambda item: -item[0])
+        return [entry for _, entry in scored[:limit]]
+
+
+_index: SummaryIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> SummaryIndex:
+    """
+    Get the shared summary index, opening it on first use.
+
+    Returns:
+        SummaryIndex: The index.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SummaryIndex()
+        return _index
@@ -0,0 +1,296 @@
+from __future__ import annotations
+import html
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Protocol
+from urllib.parse import urlsplit
+from xml.etree.ElementTree import Element
+import markdown
+from markdown.extensions import Extension
+from markdown.treeprocessors import Treeprocessor
+from .pb_enum import PastebinExpire, PastebinListing
+from .records import PasteResult
+from .paths import PROJECT_ROOT
+from .ex import PastebinFilterError
+from . import pastebin
+
+try:
+    import fcntl
+except ImportError:  # Windows: only jobs in the same process are serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+STORES = ("pastebin", "local")
+SUMMARY_STORE = os.getenv("SUMMARY_STORE", "pastebin")
+SITE_DIR = Path(os.getenv("SITE_DIR", PROJECT_ROOT / "site"))
+SITE_BASE_URL = os.getenv("SITE_BASE_URL", "")
+
+INDEX_FILE = "index.json"
+INDEX_LOCK_FILE = ".index.lock"
+
+_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+_SLUG = re.compile(r"[^a-z0-9]+")
+
+# Link and image URL schemes kept in rendered pages. Relative URLs are always kept.
+SAFE_SCHEMES = ("http", "https", "mailto")
+
+
+class SummaryStore(Protocol):
+    """Somewhere long summaries are published so a bookmark can link to them."""
+
+    name: str
+
+    def publish(self, title: str, content: str, digest: str) -> PasteResult: ...
+
+
+class _SafeUrls(Treeprocessor):
+    def run(self, root: Element) -> None:
+        for element in root.iter():
+            for attr in ("href", "src"):
+                url = element.get(attr)
+                if url is None:
+                    continue
+                scheme = urlsplit(url.strip()).scheme.lower()
+                if scheme and scheme not in SAFE_SCHEMES:
+                    del element.attrib[attr]
+
+
+class _SafeHtml(Extension):
+    """Render raw HTML in the Markdown as text and drop ``javascript:`` and similar URLs."""
+
+    def extendMarkdown(self, md: markdown.Markdown) -> None:
+        md.preprocessors.deregister("html_block")
+        md.inlinePatterns.deregister("html")
+        md.treeprocessors.register(_SafeUrls(md), "safe_urls", -10)
+
+
+def render_markdown(content: str) -> str:
+    """
+    Render Markdown written by the summarizers as HTML that is safe to serve.
+
+    Summaries quote the pages they summarize, so any HTML in them is shown as
+    text instead of being passed through, and only ``SAFE_SCHEMES`` links are kept.
+
+    Args:
+        content (str): The Markdown.
+
+    Returns:
+        str: The HTML.
+    """
+    return markdown.markdown(content, extensions=[_SafeHtml()])
+
+
+def write_atomic(path: Path, text: str) -> None:
+    """
+    Write a text file so readers see either the old or the new content, never part of it.
+
+    Args:
+        path (Path): The file to write.
+        text (str): The content.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class PastebinStore:
+    """Publish summaries as Pastebin pastes."""
+
+    name = "pastebin"
+
+    def __init__(self, expire: PastebinExpire = PastebinExpire.EXPIRE_N) -> None:
+        self.expire = expire
+
+    def publish(self, title: str, content: str, digest: str) -> PasteResult:
+        """
+        Create a public paste, or a private one when Pastebin's filters reject it.
+
+        Args:
+            title (str): The paste title.
+            content (str): The Markdown content.
+            digest (str): The content hash recorded with the result.
+
+        Returns:
+            PasteResult: The new paste.
+        """
+        listing = PastebinListing.PUBLIC
+        try:
+            url = pastebin.create_paste(title, content, listing=listing, expire=self.expire)
+        except PastebinFilterError:
+            logger.info("Pastebin reports a filter error. Creating a private paste.")
+            listing = PastebinListing.PRIVATE
+            url = pastebin.create_paste(title, content, listing=listing, expire=self.expire)
+        return PasteResult(
+            url=url, title=title, listing=int(listing), digest=digest, store=self.name
+        )
+
+
+class LocalSiteStore:
+    """
+    Publish summaries as pages of a static site in a local directory.
+
+    Each summary is written as Markdown next to its rendered HTML page, and
+    ``index.html`` lists every page, newest first. All files are replaced
+    atomically, so the directory can be served while jobs are writing to it.
+    """
+
+    name = "local"
+
+    def __init__(self, root: Path = SITE_DIR, base_url: str = SITE_BASE_URL) -> None:
+        """
+        Args:
+            root (Path, optional): The site directory. Defaults to ``SITE_DIR``.
+            base_url (str, optional): The URL the directory is served from. Defaults to
+                ``SITE_BASE_URL``, or a ``file://`` URL of the directory when not set.
+        """
+        self.root = Path(root)
+        self.base_url = (base_url or self.root.resolve().as_uri()).rstrip("/")
+        self._lock = threading.Lock()
+
+    def page_name(self, title: str, digest: str) -> str:
+        slug = _SLUG.sub("-", title.casefold()).strip("-")[:60] or "summary"
+        return f"{slug}-{digest[:12]}"
+
+    @contextmanager
+    def _index_lock(self) -> Iterator[None]:
+        """Hold the index for a read-modify-write, against other threads and processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.root / INDEX_LOCK_FILE, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_index(self) -> dict[str, dict]:
+        path = self.root / INDEX_FILE
+        if not path.exists():
+            return {}
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def _write_index(self, index: dict[str, dict]) -> None:
+        write_atomic(self.root / INDEX_FILE, json.dumps(index, indent=1))
+        entries = sorted(index.items(), key=lambda item: -item[1]["created"])
+        items = "\n".join(
+            f'<li><a href="{name}.html">{html.escape(entry["title"])}</a> '
+            f'<small>{time.strftime("%Y-%m-%d", time.gmtime(entry["created"]))}</small></li>'
+            for name, entry in entries
+        )
+        write_atomic(
+            self.root / "index.html",
+            _PAGE.format(title="Summaries", body=f"<h1>Summaries</h1>\n<ul>\n{items}\n</ul>"),
+        )
+
+    def _write_page(self, name: str, title: str, content: str) -> None:
+        body = render_markdown(content)
+        write_atomic(self.root / f"{name}.html", _PAGE.format(title=html.escape(title), body=body))
+
+    def publish(self, title: str, content: str, digest: str) -> PasteResult:
+        """
+        Write the summary page and add it to the index.
+
+        Args:
+            title (str): The page title.
+            content (str): The Markdown content.
+            digest (str): The content hash, used in the file name.
+
+        Returns:
+            PasteResult: The page URL.
+        """
+        name = self.page_name(title, digest)
+        created = time.time()
+        with self._index_lock():
+            write_atomic(self.root / f"{name}.md", content)
+            self._write_page(name, title, content)
+            index = self._load_index()
+            index[name] = {"title": title, "created": created}
+            self._write_index(index)
+        url = f"{self.base_url}/{name}.html"
+        logger.info("publish() Page written: %s for %s", url, title)
+        return PasteResult(
+            url=url,
+            title=title,
+            listing=int(PastebinListing.PUBLIC),
+            created=created,
+            digest=digest,
+            store=self.name,
+        )
+
+    def rebuild(self) -> int:
+        """
+        Render every page and the index again from the Markdown files.
+
+        Use after changing the page template, or to recover a damaged index.
+
+        Returns:
+            int: The number of pages written.
+        """
+        with self._index_lock():
+            index = self._load_index()
+            rebuilt: dict[str, dict] = {}
+            for path in sorted(self.root.glob("*.md")):
+                name = path.stem
+                content = path.read_text(encoding="utf-8")
+                entry = index.get(name) or {
+                    "title": content.partition("\n")[0].lstrip("# ").strip() or name,
+                    "created": path.stat().st_mtime,
+                }
+                self._write_page(name, entry["title"], content)
+                rebuilt[name] = entry
+            self._write_index(rebuilt)
+        logger.info("rebuild() %d pages written to %s", len(rebuilt), self.root)
+        return len(rebuilt)
+
+
+_stores: dict[str, SummaryStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(name: str = SUMMARY_STORE) -> SummaryStore:
+    """
+    Get the store long summaries are published to.
+
+    Args:
+        name (str, optional): ``pastebin`` or ``local``. Defaults to the ``SUMMARY_STORE``
+            environment variable or ``pastebin``.
+
+    Returns:
+        SummaryStore: The store.
+    """
+    if name not in STORES:
+        raise ValueError(f"Unknown summary store: {name}. Use one of {STORES}")
+    # One instance per store, so concurrent jobs share the local site's index lock.
+    with _stores_lock:
+        if name not in _stores:
+            _stores[name] = PastebinStore() if name == "pastebin" else LocalSiteStore()
+        return _stores[name]
@@ -0,0 +1,285 @@
+from __future__ import annotations
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Iterable
+from . import pinboard
+from .paths import cache_path
+
+logger = logging.getLogger(__name__)
+
+VOCAB_FILE = "tag_vocab.db"
+# Where the vocabulary was kept before, imported once into the database.
+LEGACY_FILE = "tag_vocab.json"
+VOCAB_MAX_AGE = 24 * 60 * 60  # refresh from Pinboard once a day
+# Seconds to wait after a failed refresh before asking Pinboard again.
+REFRESH_RETRY = 15 * 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tags (name TEXT PRIMARY KEY, count INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS aliases (alias TEXT PRIMARY KEY, tag TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL);
+"""
+
+_NON_ALNUM = re.compile(r"[\W_]+")
+
+
+def normalize_tag(tag: str) -> str:
+    """
+    Get the lookup key for a tag.
+
+    The key is case folded with all punctuation, spaces and underscores removed,
+    so ``MachineLearning``, ``Machinelearning`` and ``machine_learning`` share a key.
+
+    Args:
+        tag (str): The tag to normalize.
+
+    Returns:
+        str: The normalized key.
+    """
+    return _NON_ALNUM.sub("", tag.casefold())
+
+
+class TagVocabulary:
+    """
+    Local index of the tags already used in the Pinboard account.
+
+    Tags are looked up by their normalized key. An alias table maps other keys,
+    such as ``ml``, onto a canonical tag.
+    """
+
+    def __init__(
+        self,
+        tags: dict[str, int] | None = None,
+        aliases: dict[str, str] | None = None,
+        updated: float = 0.0,
+    ) -> None:
+        """
+        Args:
+            tags (dict[str, int], optional): Tag name mapped to its use count.
+            aliases (dict[str, str], optional): Alias mapped to a canonical tag.
+            updated (float, optional): Time the tags were fetched from Pinboard.
+        """
+        self.tags: dict[str, int] = {}
+        self.aliases: dict[str, str] = {}
+        self.updated = updated
+        self._index: dict[str, str] = {}
+        for name, count in (tags or {}).items():
+            self.add(name, count)
+        for alias, tag in (aliases or {}).items():
+            self.add_alias(alias, tag)
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def __contains__(self, tag: str) -> bool:
+        return self.canonical(tag) is not None
+
+    def add(self, tag: str, count: int = 1) -> None:
+        """
+        Add a tag to the vocabulary.
+
+        When two tags share a normalized key, the most used one is kept as canonical.
+
+        Args:
+            tag (str): The tag name.
+            count (int, optional): The number of bookmarks using the tag. Defaults to 1.
+        """
+        tag = tag.strip()
+        key = normalize_tag(tag)
+        if not key:
+            return
+        self.tags[tag] = self.tags.get(tag, 0) + count
+        current = self._index.get(key)
+        if current is None or self.tags[tag] > self.tags.get(current, 0):
+            self._index[key] = tag
+
+    def add_alias(self, alias: str, tag: str) -> None:
+        """
+        Map an alias onto a canonical tag, e.g. ``ML`` onto ``MachineLearning``.
+
+        Args:
+            alias (str): The alias.
+            tag (str): The canonical tag.
+        """
+        self.aliases[normalize_tag(alias)] = tag
+
+    def canonical(self, tag: str) -> str | None:
+        """
+        Find the vocabulary tag for a proposed tag.
+
+        Args:
+            tag (str): The proposed tag.
+
+        Returns:
+            str | None: The canonical tag or ``None`` if the tag is not known.
+        """
+        key = normalize_tag(tag)
+        target = self.aliases.get(key)
+        if target is not None:
+            return self._index.get(normalize_tag(target), target)
+        return self._index.get(key)
+
+    def normalize(self, tags: Iterable[str]) -> list[str]:
+        """
+        Map tags onto the vocabulary and remove duplicates.
+
+        Known tags are replaced by their canonical spelling. Unknown tags are kept
+        as they are. Order is preserved and the first occurrence wins.
+
+        Args:
+            tags (Iterable[str]): The tags to normalize.
+
+        Returns:
+            list[str]: The normalized tags.
+        """
+        result: dict[str, str] = {}
+        for tag in tags:
+            tag = tag.strip()
+            if not tag:
+                continue
+            name = self.canonical(tag) or tag
+            result.setdefault(normalize_tag(name), name)
+        return list(result.values())
+
+    def top(self, limit: int = 200) -> list[str]:
+        """
+        Get the most used tags.
+
+        Args:
+            limit (int, optional): The maximum number of tags. Defaults to 200.
+
+        Returns:
+            list[str]: Tags ordered by use count, most used first.
+        """
+        names = sorted(set(self._index.values()), key=lambda t: -self.tags.get(t, 0))
+        return names[:limit]
+
+    def to_dict(self) -> dict:
+        return {"updated": self.updated, "tags": self.tags, "aliases": self.aliases}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> TagVocabulary:
+        return cls(
+            tags=data.get("tags", {}),
+            aliases=data.get("aliases", {}),
+            updated=data.get("updated", 0.0),
+        )
+
+    def save(self, path: Path | None = None) -> None:
+        """
+        Write the vocabulary to the cache.
+
+        Processes share the cache, so the write is merged with what is stored: the
+        tags are only replaced if these were fetched from Pinboard later, and the
+        aliases are added to the stored ones.
+
+        Args:
+            path (Path, optional): The database file. Defaults to the cache file.
+        """
+        with closing(_connect(path or cache_path(VOCAB_FILE))) as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT value FROM meta WHERE key = 'updated'").fetchone()
+            if row is None or self.updated >= row[0]:
+                conn.execute("DELETE FROM tags")
+                conn.executemany("INSERT INTO tags (name, count) VALUES (?, ?)", self.tags.items())
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('updated', ?)", (self.updated,)
+                )
+            conn.executemany(
+                "INSERT OR REPLACE INTO aliases (alias, tag) VALUES (?, ?)", self.aliases.items()
+            )
+
+    @classmethod
+    def load(cls, path: Path | None = None) -> TagVocabulary:
+        """
+        Read the vocabulary from the cache, importing the JSON cache of earlier versions once.
+
+        Args:
+            path (Path, optional): The database file. Defaults to the cache file.
+
+        Returns:
+            TagVocabulary: The cached vocabulary, empty if there is no cache.
+        """
+        path = path or cache_path(VOCAB_FILE)
+        legacy = path.with_name(LEGACY_FILE)
+        if legacy.exists():
+            cls.from_dict(json.loads(legacy.read_text(encoding="utf-8"))).save(path)
+            legacy.replace(legacy.with_suffix(".json.imported"))
+            logger.info("TagVocabulary.load() Imported %s", legacy)
+        if not path.exists():
+            return cls()
+        with closing(_connect(path)) as conn:
+            tags = dict(conn.execute("SELECT name, count FROM tags").fetchall())
+            aliases = dict(conn.execute("SELECT alias, tag FROM aliases").fetchall())
+            row = conn.execute("SELECT value FROM meta WHERE key = 'updated'").fetchone()
+        return cls(tags=tags, aliases=aliases, updated=row[0] if row else 0.0)
+
+    def refreshed(self) -> TagVocabulary:
+        """
+        Load the tags from Pinboard ``tags/get``, keeping the alias table.
+
+        The vocabulary is left unchanged, so jobs reading it are not affected.
+
+        Returns:
+            TagVocabulary: A new, fully built vocabulary.
+        """
+        vocabulary = TagVocabulary(pinboard.get_tags(), dict(self.aliases), time.time())
+        logger.info("TagVocabulary.refreshed() Loaded %d tags", len(vocabulary))
+        return vocabulary
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+_vocabulary: TagVocabulary | None = None
+_vocabulary_lock = threading.Lock()
+_retry_at = 0.0
+
+
+def get_vocabulary(max_age: float = VOCAB_MAX_AGE) -> TagVocabulary:
+    """
+    Get the tag vocabulary, refreshing it from Pinboard when the cache is stale.
+
+    Only one job refreshes at a time and the others wait for its result. A stale
+    vocabulary is first reloaded from the cache, in case another process already
+    refreshed it. If Pinboard cannot be reached the cached vocabulary is used as
+    is and no refresh is tried for ``REFRESH_RETRY`` seconds.
+
+    Args:
+        max_age (float, optional): Maximum cache age in seconds. Defaults to one day.
+
+    Returns:
+        TagVocabulary: The vocabulary. It is replaced, never changed, by a refresh.
+    """
+    global _vocabulary, _retry_at
+    with _vocabulary_lock:
+        if _vocabulary is None:
+            _vocabulary = TagVocabulary.load()
+        if time.time() - _vocabulary.updated <= max_age or time.monotonic() < _retry_at:
+            return _vocabulary
+        stored = TagVocabulary.load()
+        if stored.updated > _vocabulary.updated:
+            _vocabulary = stored
+            if time.time() - stored.updated <= max_age:
+                return _vocabulary
+        try:
+            _vocabulary = _vocabulary.refreshed()
+        except Exception as e:
+            _retry_at = time.monotonic() + REFRESH_RETRY
+            logger.error("get_vocabulary() Unable to refresh tags, retrying in %ds: %s", REFRESH_RETRY, e)
+            return _vocabulary
+        try:
+            _vocabulary.save()
+        except sqlite3.Error as e:
+            logger.warning("get_vocabulary() Tags not cached: %s", e)
+        return _vocabulary
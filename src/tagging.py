@@ -0,0 +1,319 @@
+from __future__ import annotations
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Protocol
+import numpy as np
+from . import one_min_ai
+from . import model_router
+from .tag_vocab import TagVocabulary, get_vocabulary, normalize_tag
+
+logger = logging.getLogger(__name__)
+
+TAGGER_MODES = ("llm", "local", "hybrid")
+TAGGER_MODE = os.getenv("TAGGER_MODE", "hybrid")
+
+_CAMEL_WORDS = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+_TEXT_WORDS = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = frozenset(
+    ("a", "an", "and", "as", "at", "by", "for", "from")
+    + ("in", "of", "on", "or", "the", "to", "with")
+)
+# Everyday words that are also tags, e.g. ``Go``, but say nothing about the content.
+_COMMON_WORDS = _STOP_WORDS | frozenset(
+    ("all", "any", "are", "back", "be", "best", "but", "can", "day", "do", "get", "go")
+    + ("good", "has", "have", "how", "is", "it", "just", "like", "make", "more", "most")
+    + ("new", "not", "now", "one", "out", "over", "see", "so", "that", "this", "time")
+    + ("up", "use", "was", "way", "what", "when", "why", "will", "you", "your")
+)
+# Tags whose words add up to fewer letters match too much text, e.g. ``C`` or ``R``.
+MIN_KEY_LENGTH = 3
+
+
+def split_tag_words(tag: str) -> list[str]:
+    """
+    Split a CamelCase tag into lower case words, e.g. ``HTTPServer`` into ``http`` and ``server``.
+
+    Args:
+        tag (str): The tag to split.
+
+    Returns:
+        list[str]: The words of the tag without stop words.
+    """
+    words = [w.lower() for w in _CAMEL_WORDS.findall(tag)]
+    return [w for w in words if w not in _STOP_WORDS]
+
+
+@dataclass
+class TagResult:
+    tags: list[str]
+    confidence: float
+    source: str
+    scores: dict[str, float] = field(default_factory=dict)
+
+
+class Tagger(Protocol):
+    def tag(self, content: str) -> TagResult: ...
+
+
+class LLMTagger:
+    """Generate tags with a chat model."""
+
+    def __init__(
+        self,
+        vocabulary: TagVocabulary | None = None,
+        chat: Callable[[str], str] | None = None,
+    ) -> None:
+        """
+        Args:
+            vocabulary (TagVocabulary, optional): Existing tags the model should prefer.
+            chat (Callable[[str], str], optional): Sends a prompt and returns the reply. Defaults to 1min.ai ``query_chat``.
+        """
+        self.vocabulary = vocabulary
+        self.chat = chat or one_min_ai.query_chat
+
+    def tag(self, content: str) -> TagResult:
+        prefer = self.vocabulary.top() if self.vocabulary else None
+        result = self.chat(one_min_ai.tags_prompt(content, prefer))
+        return TagResult(tags=one_min_ai.parse_tags(result), confidence=1.0, source="llm")
+
+
+class LocalTagger:
+    """
+    Pick tags from the vocabulary by scoring the content against each tag's words.
+
+    Each tag is indexed by its CamelCase words and by its joined key, so
+    ``MachineLearning`` matches both "machine learning" and "machinelearning".
+    A tag is a candidate only when all of its words occur in the content. Candidates
+    are ranked by TF-IDF, where the IDF is taken over the tag corpus so that words
+    shared by many tags count for less, with a small boost for popular tags.
+    Tags that are everyday words or shorter than ``MIN_KEY_LENGTH`` are only
+    matched through an alias.
+
+    The IDF is scaled so the rarest word weighs 1. A word mentioned once then
+    scores about 0.69 times its weight, so the default ``min_score`` lets a
+    single mention through only for words few tags share.
+
+    The tag/word index is kept as flat NumPy arrays and scored with ``bincount``,
+    so tagging a summary against thousands of tags is a handful of vector operations.
+    """
+
+    def __init__(
+        self,
+        vocabulary: TagVocabulary,
+        max_tags: int = 8,
+        min_tags: int = 3,
+        min_score: float = 0.6,
+        ignore: Iterable[str] = (),
+    ) -> None:
+        """
+        Args:
+            vocabulary (TagVocabulary): The tags to choose from.
+            max_tags (int, optional): Maximum tags returned. Defaults to 8.
+            min_tags (int, optional): Tags needed for full confidence. Defaults to 3.
+            min_score (float, optional): Minimum score for a tag to be used. Defaults to 0.6.
+            ignore (Iterable[str], optional): Tags that are never returned, e.g. tags the caller always adds.
+        """
+        self.max_tags = max_tags
+        self.min_tags = min_tags
+        self.min_score = min_score
+        ignored = {normalize_tag(t) for t in ignore}
+
+        self._tags: list[str] = []
+        self._terms: dict[str, int] = {}
+        row_tag: list[int] = []
+        row_of: list[int] = []
+        cols: list[int] = []
+
+        def add_row(tag_idx: int, words: list[str]) -> None:
+            if not words or any(w in _COMMON_WORDS for w in words):
+                return
+            row = len(row_tag)
+            row_tag.append(tag_idx)
+            for word in words:
+                cols.append(self._terms.setdefault(word, len(self._terms)))
+                row_of.append(row)
+
+        aliases: dict[str, list[str]] = {}
+        for alias, target in vocabulary.aliases.items():
+            aliases.setdefault(normalize_tag(target), []).append(alias)
+
+        for tag in vocabulary.top(len(vocabulary)):
+            key = normalize_tag(tag)
+            if key in ignored:
+                continue
+            tag_idx = len(self._tags)
+            self._tags.append(tag)
+            words = split_tag_words(tag)
+            if len(key) >= MIN_KEY_LENGTH:
+                add_row(tag_idx, words)
+                if words != [key]:
+                    add_row(tag_idx, [key])
+            for alias in aliases.get(key, ()):
+                add_row(tag_idx, [alias])
+
+        self._row_tag = np.asarray(row_tag, dtype=np.intp)
+        self._row_of = np.asarray(row_of, dtype=np.intp)
+        self._cols = np.asarray(cols, dtype=np.intp)
+        n_rows = len(row_tag)
+        self._row_len = np.bincount(self._row_of, minlength=n_rows).astype(np.float64)
+        df = np.bincount(self._cols, minlength=len(self._terms))
+        idf = np.log((1.0 + n_rows) / (1.0 + df)) + 1.0
+        self._idf = idf / (np.log(1.0 + n_rows) + 1.0)
+        counts = np.asarray([vocabulary.tags.get(t, 0) for t in self._tags], dtype=np.float64)
+        self._prior = 1.0 + 0.1 * np.log1p(counts)
+
+    def scores(self, content: str) -> dict[str, float]:
+        """
+        Score every vocabulary tag that is fully present in the content.
+
+        Args:
+            content (str): The text to tag.
+
+        Returns:
+            dict[str, float]: Tag mapped to score, for tags with a score above zero.
+        """
+        if not self._tags:
+            return {}
+        ids = [self._terms[w] for w in _TEXT_WORDS.findall(content.casefold()) if w in self._terms]
+        if not ids:
+            return {}
+        n_rows = len(self._row_tag)
+        tf = np.bincount(np.asarray(ids, dtype=np.intp), minlength=len(self._terms))
+        present = (tf > 0).astype(np.float64)
+        weight = np.log1p(tf) * self._idf
+
+        coverage = np.bincount(self._row_of, weights=present[self._cols], minlength=n_rows)
+        strength = np.bincount(self._row_of, weights=weight[self._cols], minlength=n_rows)
+        row_score = np.where(coverage >= self._row_len, strength / self._row_len, 0.0)
+
+        tag_score = np.zeros(len(self._tags))
+        np.maximum.at(tag_score, self._row_tag, row_score)
+        tag_score *= self._prior
+        hits = np.flatnonzero(tag_score)
+        return {self._tags[i]: float(tag_score[i]) for i in hits}
+
+    def confidence(self, scores: list[float]) -> float:
+        """
+        Rate how much a set of tags can be trusted.
+
+        Full confidence needs ``min_tags`` tags that all score at least twice
+        ``min_score``. Tags just over the threshold count for half.
+
+        Args:
+            scores (list[float]): The scores of the tags used.
+
+        Returns:
+            float: The confidence, from 0 to 1.
+        """
+        if not scores:
+            return 0.0
+        margin = sum(min(1.0, s / (2 * self.min_score)) for s in scores) / len(scores)
+        enough = min(1.0, len(scores) / self.min_tags) if self.min_tags else 1.0
+        return enough * margin
+
+    def tag(self, content: str) -> TagResult:
+        scores = self.scores(content)
+        ranked = sorted(
+            (t for t, s in scores.items() if s >= self.min_score),
+            key=lambda t: -scores[t],
+        )[: self.max_tags]
+        confidence = self.confidence([scores[t] for t in ranked])
+        return TagResult(
+            tags=ranked,
+            confidence=confidence,
+            source="local",
+            scores={t: scores[t] for t in ranked},
+        )
+
+
+class HybridTagger:
+    """Use the local tagger and only call the LLM when its confidence is low."""
+
+    def __init__(self, local: LocalTagger, llm: LLMTagger, threshold: float = 0.8) -> None:
+        """
+        Args:
+            local (LocalTagger): The local tagger.
+            llm (LLMTagger): The LLM tagger.
+            threshold (float, optional): Minimum local confidence to skip the LLM. Defaults to 0.8.
+        """
+        self.local = local
+        self.llm = llm
+        self.threshold = threshold
+
+    def tag(self, content: str) -> TagResult:
+        result = self.local.tag(content)
+        if result.confidence >= self.threshold:
+            logger.info("HybridTagger() Using local tags: %s", result.tags)
+            return result
+        logger.info(
+            "HybridTagger() Local confidence %.2f is low, asking the LLM", result.confidence
+        )
+        llm_result = self.llm.tag(content)
+        merged: dict[str, str] = {}
+        for tag in [*llm_result.tags, *result.tags]:
+            merged.setdefault(normalize_tag(tag), tag)
+        llm_result.tags = list(merged.values())[: self.local.max_tags]
+        llm_result.source = "hybrid"
+        return llm_result
+
+
+_local_taggers: dict[frozenset[str], tuple[TagVocabulary, LocalTagger]] = {}
+_local_taggers_lock = threading.Lock()
+
+
+def get_local_tagger(vocabulary: TagVocabulary, ignore: Iterable[str] = ()) -> LocalTagger:
+    """
+    Get a local tagger, building its index once per vocabulary.
+
+    A refreshed vocabulary is a new object, so its tagger is built again.
+
+    Args:
+        vocabulary (TagVocabulary): The tags to choose from.
+        ignore (Iterable[str], optional): Tags the tagger never returns.
+
+    Returns:
+        LocalTagger: The tagger.
+    """
+    key = frozenset(normalize_tag(t) for t in ignore)
+    with _local_taggers_lock:
+        cached = _local_taggers.get(key)
+        if cached is not None and cached[0] is vocabulary:
+            return cached[1]
+        tagger = LocalTagger(vocabulary, ignore=ignore)
+        _local_taggers[key] = (vocabulary, tagger)
+        return tagger
+
+
+def get_tagger(
+    mode: str = TAGGER_MODE,
+    vocabulary: TagVocabulary | None = None,
+    ignore: Iterable[str] = (),
+) -> Tagger:
+    """
+    Create a tagger.
+
+    Args:
+        mode (str, optional): ``llm``, ``local`` or ``hybrid``. Defaults to the ``TAGGER_MODE`` environment variable or ``hybrid``.
+        vocabulary (TagVocabulary, optional): The tag vocabulary. Defaults to the cached vocabulary.
+        ignore (Iterable[str], optional): Tags the local tagger never returns.
+
+    Returns:
+        Tagger: The tagger.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    if mode not in TAGGER_MODES:
+        raise ValueError(f"Unknown tagger mode: {mode}")
+    if vocabulary is None:
+        vocabulary = get_vocabulary()
+    llm = LLMTagger(vocabulary, model_router.get_router().chat)
+    if mode == "llm":
+        return llm
+    local = get_local_tagger(vocabulary, ignore)
+    if mode == "local":
+        return local
+    return HybridTagger(local, llm)
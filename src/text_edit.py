@@ -42,23 +42,6 @@ def date_time_web_utc() -> str:
     return now_time.strftime(WEB_UTC_DATETIME)
 
 
-def ai_prompt_pre() -> str:
-    """
-    Generate a standard prefix for AI prompts that includes the current date/time
-    and instructions for AI response formatting.
-
-    Returns:
-        str: A formatted string containing the current date/time and AI instructions.
-    """
-    result = f"""Today is {date_time_web_utc()}
-
-You are working as part of an AI system, so no chit chat and no explaning what you're are doing an why.
-DO NOT start with "OKAY", or "Alright", or "Sure", or "Yes", or "OK", or any preambles. Just the outupt please.
-
-"""
-    return result
-
-
 def markdown_to_text(markdown_text: str) -> str:
     """
     Convert Markdown text to plain text by first converting to HTML and then removing all HTML tags.
@@ -77,6 +60,30 @@ def markdown_to_text(markdown_text: str) -> str:
     return text
 
 
+def page_info(html: str) -> tuple[str, str]:
+    """
+    Get the title and canonical link of an HTML page.
+
+    Args:
+        html (str): The page.
+
+    Returns:
+        tuple[str, str]: The ``<title>``, falling back to ``og:title`` and then the
+        first ``<h1>``, and the ``rel="canonical"`` link. Empty when missing.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    title = soup.title.get_text(" ", strip=True) if soup.title else ""
+    if not title:
+        og = soup.find("meta", attrs={"property": "og:title"})
+        title = (og.get("content") or "").strip() if og else ""
+    if not title:
+        h1 = soup.find("h1")
+        title = h1.get_text(" ", strip=True) if h1 else ""
+    link = soup.find("link", rel="canonical")
+    canonical = (link.get("href") or "").strip() if link else ""
+    return title, canonical
+
+
 def remove_last_line_if_has_parentheses(text: str) -> str:
     """
     Remove the last line of text if it is enclosed in parentheses.
@@ -135,3 +142,38 @@ def get_dict_json(text: str) -> dict:
     start = text.find("{")
     end = text.rfind("}")
     return json.loads(text[start : end + 1])
+
+
+def format_seconds_to_hms(total_seconds: int) -> str:
+    """
+    Converts an integer representing seconds into a formatted string
+    of Hours, Minutes, and Seconds.
+
+    Args:
+        total_seconds (int): The total number of seconds.
+
+    Returns:
+        str: A string formatted as "HHh MMm SSs", "MMm SSs", or "SSs"
+            depending on the total duration.
+    """
+    if not isinstance(total_seconds, int) or total_seconds < 0:
+        raise ValueError("Input must be a non-negative integer representing seconds.")
+
+    hours, remainder = divmod(total_seconds, 3600)  # 3600 seconds in an hour
+    minutes, seconds = divmod(remainder, 60)  # 60 seconds in a minute
+
+    if hours > 0:
+        return f"{hours}h {minutes}m {seconds}s"
+    elif minutes > 0:
+        return f"{minutes}m {seconds}s"
+    else:
+        return f"{seconds}s"
+
+    # --- Examples ---
+    # print(format_seconds_to_hms(3665))  # Output: 1h 1m 5s
+    # print(format_seconds_to_hms(3600))  # Output: 1h 0m 0s
+    # print(format_seconds_to_hms(125))  # Output: 2m 5s
+    # print(format_seconds_to_hms(59))  # Output: 59s
+    # print(format_seconds_to_hms(0))  # Output: 0s
+    # print(format_seconds_to_hms(36000))  # Output: 10h 0m 0s
+    # print(format_seconds_to_hms(7261))  # Output: 2h 1m 1s
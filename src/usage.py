@@ -0,0 +1,373 @@
+from __future__ import annotations
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, TypeVar
+from . import log_config
+from . import scheduler
+from .paths import cache_path
+from .records import Usage
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+LEDGER_FILE = "usage.db"
+
+OK = "ok"
+NEAR = "near"
+OVER = "over"
+
+# Share of a budget at which jobs switch to the cheaper paths.
+BUDGET_NEAR = float(os.getenv("BUDGET_NEAR", "0.8"))
+# Seconds between starting jobs once a budget is near. Running jobs record their
+# cost as their requests finish, so starting jobs slower keeps the overshoot small.
+NEAR_BUDGET_DELAY = float(os.getenv("NEAR_BUDGET_DELAY", "10"))
+
+# Identifies this process's run in the ledger.
+RUN_ID = log_config.new_job_id()
+# Seconds between re-reading today's total, which other processes add to.
+DAY_REFRESH = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    day TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    job_id TEXT NOT NULL DEFAULT '',
+    source TEXT NOT NULL DEFAULT '',
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL DEFAULT '',
+    feature TEXT NOT NULL DEFAULT '',
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    credits REAL NOT NULL DEFAULT 0,
+    estimated INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS calls_day ON calls (day, provider);
+CREATE INDEX IF NOT EXISTS calls_run ON calls (run_id);
+CREATE INDEX IF NOT EXISTS calls_job ON calls (job_id);
+"""
+
+_GROUPS = {"day": "day", "run": "run_id", "job": "job_id"}
+
+
+def parse_budgets(spec: str) -> dict[str, float]:
+    """
+    Parse a budget specification.
+
+    Args:
+        spec (str): Comma separated ``provider=credits`` pairs, e.g. ``1min=50000,openrouter=0.5``.
+
+    Returns:
+        dict[str, float]: Provider mapped to its budget.
+
+    Raises:
+        ValueError: If an amount is not a number.
+    """
+    result: dict[str, float] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item or "=" not in item:
+            continue
+        provider, amount = item.split("=", 1)
+        result[provider.strip()] = float(amount)
+    return result
+
+
+# Credits each provider may use per UTC day, and per run of the batch or backfill command.
+DAILY_BUDGETS = parse_budgets(os.getenv("DAILY_BUDGETS", ""))
+RUN_BUDGETS = parse_budgets(os.getenv("RUN_BUDGETS", ""))
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+class UsageLedger:
+    """
+    SQLite record of every AI request and what it cost.
+
+    Each call is stored with its run, job and source, so spending can be totalled
+    per job, per run and per day. Today's and this run's totals are also kept in
+    memory, so budget checks rarely query the database.
+    """
+
+    def __init__(self, path: Path | None = None, run_id: str = RUN_ID) -> None:
+        """
+        Args:
+            path (Path, optional): The database file. Defaults to the cache file.
+            run_id (str, optional): The current run. Defaults to ``RUN_ID``.
+        """
+        self.path = path or cache_path(LEDGER_FILE)
+        self.run_id = run_id
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._run: dict[str, float] = defaultdict(float)
+        self._day = ""
+        self._day_loaded = 0.0
+        self._today: dict[str, float] = defaultdict(float)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _refresh_day(self) -> None:
+        # Starts a new total at midnight UTC and picks up what other processes spent.
+        day = _today()
+        now = time.monotonic()
+        if day == self._day and now - self._day_loaded < DAY_REFRESH:
+            return
+        rows = self._conn.execute(
+            "SELECT provider, sum(credits) FROM calls WHERE day = ? GROUP BY provider", (day,)
+        ).fetchall()
+        self._day = day
+        self._day_loaded = now
+        self._today = defaultdict(float, rows)
+
+    def record(self, usage: Usage) -> None:
+        """
+        Store a request made by the job running in the current context.
+
+        Args:
+            usage (Usage): What the request cost.
+        """
+        source, _ = scheduler.current()
+        with self._lock, self._conn:
+            self._refresh_day()
+            self._conn.execute(
+                """
+                INSERT INTO calls (created, day, run_id, job_id, source, provider, model, feature,
+                                   prompt_tokens, completion_tokens, credits, estimated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    time.time(),
+                    self._day,
+                    self.run_id,
+                    log_config.current_job_id(),
+                    source,
+                    usage.provider,
+                    usage.model,
+                    usage.feature,
+                    usage.prompt_tokens,
+                    usage.completion_tokens,
+                    usage.credits,
+                    usage.estimated,
+                ),
+            )
+            self._today[usage.provider] += usage.credits
+            self._run[usage.provider] += usage.credits
+        logger.debug(
+            "record() %s %s: %d + %d tokens, %.4g credits",
+            usage.provider,
+            usage.feature,
+            usage.prompt_tokens,
+            usage.completion_tokens,
+            usage.credits,
+        )
+
+    def spent_today(self) -> dict[str, float]:
+        """Credits used per provider today, by every process."""
+        with self._lock:
+            self._refresh_day()
+            return dict(self._today)
+
+    def spent_run(self) -> dict[str, float]:
+        """Credits used per provider by this run."""
+        with self._lock:
+            return dict(self._run)
+
+    def job_totals(self, job_id: str) -> dict[str, float]:
+        """
+        Get the credits a job used.
+
+        Args:
+            job_id (str): The job ID.
+
+        Returns:
+            dict[str, float]: Provider mapped to credits.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT provider, sum(credits) FROM calls WHERE job_id = ? GROUP BY provider",
+                (job_id,),
+            ).fetchall()
+        return dict(rows)
+
+    def totals(self, by: str = "day", since: float = 0.0, limit: int = 100) -> list[dict]:
+        """
+        Total the usage per day, run or job and provider, newest first.
+
+        Args:
+            by (str, optional): ``day``, ``run`` or ``job``. Defaults to ``day``.
+            since (float, optional): Only calls made after this time. Defaults to all.
+            limit (int, optional): The maximum number of rows. Defaults to 100.
+
+        Returns:
+            list[dict]: Rows with the group key, provider, calls, token counts, credits
+            and how many of the calls were estimated.
+        """
+        column = _GROUPS[by]
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT {column}, provider, count(*), sum(prompt_tokens), sum(completion_tokens),
+                       sum(credits), sum(estimated), max(created) AS last
+                FROM calls WHERE created >= ?
+                GROUP BY {column}, provider
+                ORDER BY last DESC, provider
+                LIMIT ?
+                """,
+                (since, limit),
+            ).fetchall()
+        return [
+            {
+                by: key,
+                "provider": provider,
+                "calls": calls,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "credits": credits,
+                "estimated": estimated,
+            }
+            for key, provider, calls, prompt_tokens, completion_tokens, credits, estimated, _ in rows
+        ]
+
+
+_ledger: UsageLedger | None = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> UsageLedger:
+    """
+    Get the shared usage ledger, opening it on first use.
+
+    Returns:
+        UsageLedger: The ledger.
+    """
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = UsageLedger()
+        return _ledger
+
+
+def record(usage: Usage) -> None:
+    """Store a request in the shared ledger. Ledger errors are logged, not raised."""
+    try:
+        get_ledger().record(usage)
+    except sqlite3.Error as e:
+        logger.warning("record() Usage not recorded: %s", e)
+
+
+def job_credits(job_id: str) -> dict[str, float]:
+    """Get the credits a job used per provider. Ledger errors give an empty result."""
+    try:
+        return get_ledger().job_totals(job_id)
+    except sqlite3.Error as e:
+        logger.warning("job_credits() Usage not available: %s", e)
+        return {}
+
+
+# region Budgets
+
+
+def budget_state(provider: str | None = None) -> str:
+    """
+    Compare spending with the daily and run budgets.
+
+    Args:
+        provider (str, optional): Only this provider's budgets. Defaults to every provider.
+
+    Returns:
+        str: ``OVER`` if a budget is used up, ``NEAR`` if ``BUDGET_NEAR`` of one is
+        used, else ``OK``. Always ``OK`` when no budgets are set.
+    """
+    if not DAILY_BUDGETS and not RUN_BUDGETS:
+        return OK
+    ledger = get_ledger()
+    state = OK
+    for budgets, spent in (
+        (DAILY_BUDGETS, ledger.spent_today()),
+        (RUN_BUDGETS, ledger.spent_run()),
+    ):
+        for name, budget in budgets.items():
+            if provider is not None and name != provider:
+                continue
+            used = spent.get(name, 0.0)
+            if used >= budget:
+                return OVER
+            if used >= budget * BUDGET_NEAR:
+                state = NEAR
+    return state
+
+
+def near_budget(provider: str | None = None) -> bool:
+    """Whether jobs should take the cheaper paths."""
+    return budget_state(provider) != OK
+
+
+def cheaper_tagger(mode: str) -> str:
+    """
+    Get the tagger mode to use given the budgets.
+
+    Args:
+        mode (str): The requested mode.
+
+    Returns:
+        str: ``local`` when near a budget, else ``mode``.
+    """
+    if mode != "local" and near_budget():
+        logger.info("cheaper_tagger() Near the credit budget, tagging locally")
+        return "local"
+    return mode
+
+
+def within_budget(jobs: Iterable[T]) -> Iterator[T]:
+    """
+    Pass jobs through until a budget is used up.
+
+    Once a budget is near, jobs are started ``NEAR_BUDGET_DELAY`` seconds apart,
+    so the cost of the jobs already running is recorded before more start.
+    Jobs already started are left to finish. An interrupted backfill resumes
+    where it stopped once there is budget again.
+
+    Args:
+        jobs (Iterable[T]): The jobs.
+
+    Yields:
+        T: The jobs, while there is budget.
+    """
+    throttled = False
+    for job in jobs:
+        state = budget_state()
+        if state == NEAR:
+            if not throttled:
+                logger.warning(
+                    "within_budget() Near the credit budget, starting a job every %gs",
+                    NEAR_BUDGET_DELAY,
+                )
+                throttled = True
+            time.sleep(NEAR_BUDGET_DELAY)
+            state = budget_state()
+        if state == OVER:
+            logger.warning(
+                "within_budget() Credit budget used up, not starting more jobs. Today: %s, run: %s",
+                get_ledger().spent_today(),
+                get_ledger().spent_run(),
+            )
+            return
+        yield job
+
+
+# endregion Budgets
@@ -1,26 +1,38 @@
 from __future__ import annotations
 import logging
-import json
 import yt_dlp
 from yt_dlp.utils import DownloadError
+from . import deadline
+from .records import VideoInfo
 
 logger = logging.getLogger(__name__)
 
+SOCKET_TIMEOUT = 30
 
-def get_youtube_info(url: str) -> dict:
-    ydl_opts = {}
+
+def get_video_info(url: str) -> VideoInfo:
+    """
+    Get the video details the pipeline uses.
+
+    Only the used fields are copied out of the yt-dlp info dict, so the dict
+    (hundreds of keys and nested format lists) can be freed straight away.
+
+    Args:
+        url (str): The URL of the YouTube video.
+
+    Returns:
+        VideoInfo: The video details.
+    """
+    ydl_opts = {"socket_timeout": deadline.timeout(SOCKET_TIMEOUT)}
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(url, download=False)
-
-            # ℹ️ ydl.sanitize_info makes the info json-serializable
-            info = json.dumps(ydl.sanitize_info(info))
-            dd = json.loads(info)
-            logger.info("get_youtube_info() Title: %s", dd["title"])
-            return dd
+            video = VideoInfo.from_info(url, info)
+            logger.info("get_video_info() Title: %s", video.title)
+            return video
     except DownloadError as e:
-        logger.error("get_youtube_info() DownloadError: %s", e)
+        logger.error("get_video_info() DownloadError: %s", e)
         raise e
     except Exception as e:
-        logger.error("get_youtube_info() An error occurred: %s", e)
+        logger.error("get_video_info() An error occurred: %s", e)
         raise e